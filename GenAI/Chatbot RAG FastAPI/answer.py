@@ -0,0 +1,144 @@
+# Grounded answer generation with the Qwen model
+#
+# Retrieved chunks are packed best-first into a token budget, wrapped in Qwen's
+# chat template after a fixed system prompt, and answered greedily. The system
+# prompt is the same for every request, so its key/value cache is computed once
+# and a copy is handed to generate(), which then only has to prefill the
+# context and question. Generation stops at the first end-of-turn token, and
+# every answer reports time to first token and decode speed.
+
+import os                                                                       # For the generation budgets
+import copy                                                                     # For copying the shared prefix cache per request
+import time                                                                     # For TTFT and tokens/sec
+import torch                                                                    # For model inference
+from transformers.generation.streamers import BaseStreamer                      # For timing tokens as they are generated
+
+SYSTEM_PROMPT = (
+    "You are an assistant that answers questions about the user's PDF documents. "
+    "Answer only from the numbered context passages in the user's message and cite them as [1], [2], ... "
+    "If the passages do not contain the answer, say that you don't know. Keep answers short and factual."
+)
+CONTEXT_TOKENS = int(os.getenv("ANSWER_CONTEXT_TOKENS", "1536"))    # Token budget for the packed chunks
+MAX_NEW_TOKENS = int(os.getenv("ANSWER_MAX_NEW_TOKENS", "256"))     # Default cap on generated tokens
+
+
+class TokenTimer(BaseStreamer):
+    """Streamer that records when the first generated token arrives and how many follow."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.first_token = None
+        self.finished = None
+        self.tokens = 0
+        self._prompt_seen = False
+
+    def put(self, value):
+        # generate() first passes the prompt itself, then each new token
+        if not self._prompt_seen:
+            self._prompt_seen = True
+            return
+        if self.first_token is None:
+            self.first_token = time.perf_counter()
+        self.tokens += value.numel()
+
+    def end(self):
+        self.finished = time.perf_counter()
+
+    def report(self):
+        finished = self.finished or time.perf_counter()
+        decode_seconds = finished - self.first_token if self.first_token is not None else 0.0
+        return {
+            "ttft_ms": round((self.first_token - self.started) * 1000, 1) if self.first_token is not None else None,
+            "generated_tokens": self.tokens,
+            "tokens_per_sec": round((self.tokens - 1) / decode_seconds, 2) if self.tokens > 1 and decode_seconds else None,
+            "total_ms": round((finished - self.started) * 1000, 1),
+        }
+
+
+class AnswerGenerator:
+    """Answers questions from retrieved matches, reusing the system prompt's KV cache across requests."""
+
+    def __init__(self, tokenizer, model, system_prompt=SYSTEM_PROMPT, context_tokens=CONTEXT_TOKENS):
+        self.tokenizer = tokenizer
+        self.model = model
+        self.system_prompt = system_prompt
+        self.context_tokens = context_tokens
+        self.eos_ids = sorted({tokenizer.eos_token_id, tokenizer.convert_tokens_to_ids("<|im_end|>")} - {None})
+        self.pad_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else self.eos_ids[0]
+
+        # The rendered system turn is a prefix of every prompt; prefill it once
+        self.prefix_text = tokenizer.apply_chat_template(self._messages(None), tokenize=False)
+        self.prefix_ids = tokenizer(self.prefix_text, add_special_tokens=False, return_tensors="pt").input_ids
+        with torch.inference_mode():
+            self.prefix_cache = model(self.prefix_ids, use_cache=True).past_key_values
+
+    def _messages(self, user):
+        messages = [{"role": "system", "content": self.system_prompt}]
+        if user is not None:
+            messages.append({"role": "user", "content": user})
+        return messages
+
+    # Number matches as passages and keep as many as fit in the token budget, best first
+    def pack(self, matches):
+        blocks = []
+        for n, match in enumerate(matches, 1):
+            location = ""
+            if match.source:
+                location = f" ({match.source}, page {match.page})" if match.page else f" ({match.source})"
+            blocks.append(f"[{n}]{location}\n{match.text.strip()}\n")
+        if not blocks:
+            return "", [], 0
+
+        lengths = [len(ids) for ids in self.tokenizer(blocks, add_special_tokens=False).input_ids]
+        used, total = [], 0
+        for block, length, match in zip(blocks, lengths, matches):
+            if total + length > self.context_tokens:
+                if not used:
+                    # Even the best chunk is over budget: keep its head rather than answer with nothing
+                    ids = self.tokenizer(block, add_special_tokens=False).input_ids[:self.context_tokens]
+                    blocks[0] = self.tokenizer.decode(ids)
+                    used.append(match)
+                    total = len(ids)
+                break
+            used.append(match)
+            total += length
+        return "\n".join(blocks[:len(used)]), used, total
+
+    # Prompt token IDs: the cached system prefix followed by the tokenized user turn
+    def prompt_ids(self, question, context):
+        user = f"Context:\n{context}\nQuestion: {question.strip()}" if context else f"Question: {question.strip()}"
+        text = self.tokenizer.apply_chat_template(self._messages(user), tokenize=False, add_generation_prompt=True)
+        if not text.startswith(self.prefix_text):
+            raise ValueError("The chat template does not render the system prompt as a fixed prefix.")
+        rest = self.tokenizer(text[len(self.prefix_text):], add_special_tokens=False, return_tensors="pt").input_ids
+        return torch.cat([self.prefix_ids, rest], dim=1)
+
+    # Generate an answer to question grounded in the matches; returns the answer, the cited matches and timings
+    def answer(self, question, matches, max_new_tokens=MAX_NEW_TOKENS):
+        context, used, context_tokens = self.pack(matches)
+        input_ids = self.prompt_ids(question, context)
+        timer = TokenTimer()
+        with torch.inference_mode():
+            output = self.model.generate(
+                input_ids,
+                attention_mask=torch.ones_like(input_ids),
+                past_key_values=copy.deepcopy(self.prefix_cache),
+                max_new_tokens=max_new_tokens,
+                do_sample=False,
+                eos_token_id=self.eos_ids,
+                pad_token_id=self.pad_id,
+                streamer=timer,
+            )
+        text = self.tokenizer.decode(output[0, input_ids.shape[1]:], skip_special_tokens=True).strip()
+        usage = {
+            "prompt_tokens": input_ids.shape[1],
+            "prefix_tokens_reused": self.prefix_ids.shape[1],
+            "context_tokens": context_tokens,
+            "context_chunks": len(used),
+            **timer.report(),
+        }
+        return text, used, usage
+
+    # Answer a dummy question so weights and kernels are warm before the first request
+    def warm_up(self):
+        self.answer("warm up", [], max_new_tokens=2)
@@ -0,0 +1,134 @@
+# Benchmark of the FAISS index types supported by the RAG API
+#
+# Builds every index type over the same synthetic corpus, then opens each one
+# memory-mapped in a fresh process (as a uvicorn worker would) and reports
+# recall@k against exact flat search, p50/p99 single-query latency and
+# resident memory split into private (RssAnon) and shared page cache (RssFile).
+#
+# Usage:
+#   python benchmark_index.py --sizes 100000 1000000 --types flat sq8 hnsw ivf_flat ivf_pq
+
+import os                                                                       # For file paths
+import time                                                                     # For latency measurements
+import argparse                                                                 # For command line options
+import multiprocessing                                                          # For measuring each index in a clean process
+import faiss                                                                    # For the vector indexes
+import numpy as np                                                              # For the synthetic corpus
+from faiss_index import INDEX_TYPES, IndexConfig, factory_string, tune_for_search
+
+BUILD_BATCH = 50000             # Vectors generated and added per step
+
+
+# Deterministic clustered vectors, generated in batches so the corpus never has to sit in memory twice
+def corpus_batches(size, dim, seed=0, clusters=1000):
+    centers = np.random.default_rng(seed).standard_normal((clusters, dim)).astype(np.float32)
+    for start in range(0, size, BUILD_BATCH):
+        rng = np.random.default_rng(seed + 1 + start // BUILD_BATCH)
+        count = min(BUILD_BATCH, size - start)
+        labels = rng.integers(0, clusters, count)
+        yield start, centers[labels] + 0.3 * rng.standard_normal((count, dim)).astype(np.float32)
+
+
+# Build one index type over the corpus and write it to disk
+def build(index_type, size, dim, path, train_size):
+    config = IndexConfig(index_type=index_type, train_size=train_size)
+    factory = None
+    index = None
+    started = time.perf_counter()
+    for start, vectors in corpus_batches(size, dim):
+        if index is None:
+            sample = vectors[:train_size]
+            factory = factory_string(config, dim, len(sample))
+            index = faiss.index_factory(dim, factory)
+            if not index.is_trained:
+                index.train(sample)
+        index.add_with_ids(vectors, np.arange(start, start + len(vectors), dtype=np.int64))
+    faiss.write_index(index, path)
+    return factory, time.perf_counter() - started
+
+
+# Resident memory of this process, in MiB
+def resident_memory():
+    memory = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("VmRSS", "RssAnon", "RssFile"):
+                memory[key] = round(int(value.split()[0]) / 1024, 1)
+    return memory
+
+
+# Open an index memory-mapped and time single queries; runs in a fresh process
+def measure(path, index_type, queries_path, truth_path, k):
+    config = IndexConfig(index_type=index_type)
+    flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+    index = tune_for_search(faiss.read_index(path, flags), config)
+    queries = np.load(queries_path)
+    truth = np.load(truth_path)
+
+    latencies = []
+    found = np.empty((len(queries), k), dtype=np.int64)
+    for i, query in enumerate(queries):
+        started = time.perf_counter()
+        _, labels = index.search(query[None, :], k)
+        latencies.append(time.perf_counter() - started)
+        found[i] = labels[0]
+
+    recall = np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)])
+    latencies = np.array(latencies) * 1000
+    return {
+        "recall": round(float(recall), 4),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+        **resident_memory(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark FAISS index types for the RAG API.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--types", nargs="+", default=list(INDEX_TYPES), choices=INDEX_TYPES)
+    parser.add_argument("--dim", type=int, default=300, help="300 matches en_core_web_lg vectors")
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--train-size", type=int, default=50000)
+    parser.add_argument("--workdir", default="bench_indexes")
+    args = parser.parse_args()
+
+    os.makedirs(args.workdir, exist_ok=True)
+    context = multiprocessing.get_context("spawn")
+    print(f"{'chunks':>9} {'type':>9} {'factory':>18} {'build_s':>8} {'recall@' + str(args.k):>9} "
+          f"{'p50_ms':>8} {'p99_ms':>8} {'rss_mb':>8} {'anon_mb':>8} {'file_mb':>8}")
+
+    for size in args.sizes:
+        # Queries are perturbed corpus points; ground truth is exact flat search over the whole corpus
+        rng = np.random.default_rng(12345)
+        picks = np.sort(rng.choice(size, args.queries, replace=False))
+        exact = faiss.IndexFlatL2(args.dim)
+        queries = []
+        for start, vectors in corpus_batches(size, args.dim):
+            exact.add(vectors)
+            inside = picks[(picks >= start) & (picks < start + len(vectors))] - start
+            queries.append(vectors[inside])
+        queries = np.concatenate(queries)
+        queries += 0.05 * rng.standard_normal(queries.shape).astype(np.float32)
+        _, truth = exact.search(queries, args.k)
+        del exact
+
+        queries_path = os.path.join(args.workdir, f"queries_{size}.npy")
+        truth_path = os.path.join(args.workdir, f"truth_{size}.npy")
+        np.save(queries_path, queries)
+        np.save(truth_path, truth)
+
+        for index_type in args.types:
+            path = os.path.join(args.workdir, f"{index_type}_{size}.faiss")
+            factory, build_seconds = build(index_type, size, args.dim, path, args.train_size)
+            with context.Pool(1) as pool:
+                result = pool.apply(measure, (path, index_type, queries_path, truth_path, args.k))
+            print(f"{size:>9} {index_type:>9} {factory:>18} {build_seconds:>8.1f} {result['recall']:>9.4f} "
+                  f"{result['p50_ms']:>8.3f} {result['p99_ms']:>8.3f} {result['VmRSS']:>8.1f} "
+                  f"{result['RssAnon']:>8.1f} {result['RssFile']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
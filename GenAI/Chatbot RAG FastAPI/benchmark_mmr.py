@@ -0,0 +1,121 @@
+# Benchmark of MMR re-ranking overhead for the RAG API
+#
+# Builds an index over a synthetic corpus in which every passage appears as
+# several near-identical overlapping chunks, as the text splitter produces, then
+# compares plain top-k dense search with fetch_k dense candidates re-ranked by
+# mmr_select (batched NumPy) and by a straightforward per-candidate Python loop.
+# MMR timings include fetching the candidate vectors back from the index by ID
+# (the mmr_vectors stage of the API), reported separately as vectors_ms.
+# Reports per-query latency and how redundant the returned chunks are (mean
+# pairwise cosine similarity, lower is more diverse).
+#
+# Usage:
+#   python benchmark_mmr.py --chunks 100000 --k 4 --fetch-k 10 20 50 100 --factory IDMap2,HNSW32
+
+import time                                                                     # For latency measurements
+import argparse                                                                 # For command line options
+import faiss                                                                    # For the dense candidate search
+import numpy as np                                                              # For the synthetic corpus
+from mmr import mmr_select, normalize                                           # For the re-ranking under test
+from faiss_index import stored_vectors                                          # For the candidate vectors, as the API fetches them
+
+
+# Passages with a few jittered copies each, like the overlapping chunks of one page
+def corpus(chunks, dim, copies=4, seed=0):
+    rng = np.random.default_rng(seed)
+    passages = rng.standard_normal((chunks // copies, dim)).astype(np.float32)
+    vectors = np.repeat(passages, copies, axis=0)
+    return vectors + 0.05 * rng.standard_normal(vectors.shape).astype(np.float32)
+
+
+# Reference MMR with a Python loop over the candidates, for comparison
+def mmr_loop(query, candidates, k, lambda_mult):
+    query, candidates = normalize(query), normalize(candidates)
+    picked, left = [], list(range(len(candidates)))
+    while left and len(picked) < k:
+        best, best_score = None, -np.inf
+        for i in left:
+            redundancy = max((float(candidates[i] @ candidates[j]) for j in picked), default=0.0)
+            relevance = float(query @ candidates[i])
+            score = lambda_mult * relevance - (1 - lambda_mult) * redundancy if picked else relevance
+            if score > best_score:
+                best, best_score = i, score
+        picked.append(best)
+        left.remove(best)
+    return picked
+
+
+# Mean pairwise cosine similarity of the returned chunks of each query
+def redundancy(vectors, picks):
+    scores = []
+    for row in picks:
+        chosen = normalize(vectors[[i for i in row if i != -1]])
+        similarity = chosen @ chosen.T
+        n = len(chosen)
+        scores.append((similarity.sum() - n) / (n * (n - 1)) if n > 1 else 0.0)
+    return float(np.mean(scores))
+
+
+# (queries, fetch_k, dim) vectors of the candidates, reconstructed once per distinct ID as the API does
+def candidate_matrix(index, candidates):
+    ids, positions = np.unique(np.maximum(candidates, 0), return_inverse=True)
+    return stored_vectors(index, ids)[positions.reshape(candidates.shape)]
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark MMR re-ranking for the RAG API.")
+    parser.add_argument("--chunks", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=300, help="300 matches en_core_web_lg vectors")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--fetch-k", type=int, nargs="+", default=[10, 20, 50, 100])
+    parser.add_argument("--lambda-mult", type=float, default=0.5)
+    parser.add_argument("--factory", default="IDMap2,Flat", help="An exact type: IDMap2,Flat, IDMap2,HNSW32 or IVF<n>,Flat")
+    args = parser.parse_args()
+
+    vectors = corpus(args.chunks, args.dim)
+    index = faiss.index_factory(args.dim, args.factory)
+    if not index.is_trained:
+        index.train(vectors)
+    index.add_with_ids(vectors, np.arange(len(vectors), dtype=np.int64))
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+    if stored_vectors(index, [0]) is None:
+        parser.error(f"{args.factory} keeps only lossy codes; MMR reads those vectors from the embedding cache")
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(len(vectors), args.queries, replace=False)]
+    queries = queries + 0.3 * rng.standard_normal(queries.shape).astype(np.float32)
+
+    (_, labels), seconds = timed(lambda: index.search(queries, args.k))
+    print(f"{'method':>12} {'fetch_k':>8} {'ms/query':>9} {'overhead_ms':>12} {'vectors_ms':>11} {'redundancy':>11}")
+    base_ms = seconds * 1000 / args.queries
+    print(f"{'dense':>12} {args.k:>8} {base_ms:>9.3f} {0:>12.3f} {0:>11.3f} {redundancy(vectors, labels):>11.3f}")
+
+    for fetch_k in args.fetch_k:
+        (_, candidates), search_seconds = timed(lambda: index.search(queries, fetch_k))
+        valid = candidates != -1
+        matrix, vector_seconds = timed(lambda: candidate_matrix(index, candidates))
+        picks, mmr_seconds = timed(lambda: mmr_select(queries, matrix, valid, args.k, args.lambda_mult))
+        labels = np.take_along_axis(candidates, np.maximum(picks, 0), axis=1)
+        vectors_ms = vector_seconds * 1000 / args.queries
+        total_ms = (search_seconds + vector_seconds + mmr_seconds) * 1000 / args.queries
+        print(f"{'mmr_numpy':>12} {fetch_k:>8} {total_ms:>9.3f} {total_ms - base_ms:>12.3f} {vectors_ms:>11.3f} "
+              f"{redundancy(vectors, labels):>11.3f}")
+
+        loop_picks, loop_seconds = timed(lambda: [
+            mmr_loop(query, rows, args.k, args.lambda_mult) for query, rows in zip(queries, matrix)
+        ])
+        total_ms = (search_seconds + vector_seconds + loop_seconds) * 1000 / args.queries
+        print(f"{'mmr_loop':>12} {fetch_k:>8} {total_ms:>9.3f} {total_ms - base_ms:>12.3f} {vectors_ms:>11.3f} "
+              f"{redundancy(vectors, np.take_along_axis(candidates, np.array(loop_picks), axis=1)):>11.3f}")
+
+
+if __name__ == "__main__":
+    main()
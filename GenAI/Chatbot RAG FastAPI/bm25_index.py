@@ -0,0 +1,152 @@
+# Compact BM25 inverted index stored next to each FAISS index version
+#
+# spaCy average vectors are poor at exact tokens such as part numbers and error
+# codes, so every ingest also builds a BM25 index over the same chunks. Postings
+# are kept as flat NumPy arrays in CSR layout (one offsets array, one row array,
+# one term-frequency array) and saved as a single .npz, so loading is a few
+# array reads and scoring a query is a handful of vectorized operations. An
+# incremental ingest updates the previous version's postings instead of
+# rebuilding them: rows of removed chunks are dropped, kept rows are renumbered
+# with array operations, and only the chunks added by the ingest are tokenized.
+
+import os                                                                       # For file paths
+import re                                                                       # For tokenization
+import math                                                                     # For IDF
+from collections import Counter                                                 # For term frequencies
+import numpy as np                                                              # For postings arrays
+
+BM25_FILE = "bm25.npz"
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")    # Keeps codes like e-1042, v2.3 or ab_12 whole
+K1 = 1.2
+B = 0.75
+
+
+# Lower-case and split text into BM25 terms
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+# Reciprocal rank fusion of several ranked ID lists; returns (ID, fused score) best first
+def reciprocal_rank_fusion(rankings, k=60):
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda pair: pair[1], reverse=True)
+
+
+class BM25Index:
+    """BM25 over the chunks of one index version, addressed by the same int64 IDs as FAISS."""
+
+    def __init__(self, terms, offsets, rows, tfs, doc_ids, doc_lengths):
+        self.vocabulary = {term: i for i, term in enumerate(terms.tolist())}
+        self.terms = terms
+        self.offsets = offsets          # Postings of term t are rows[offsets[t]:offsets[t + 1]]
+        self.rows = rows                # Document rows, indexes into doc_ids / doc_lengths
+        self.tfs = tfs                  # Term frequency of each posting
+        self.doc_ids = doc_ids          # FAISS int64 ID of each document row
+        self.doc_lengths = doc_lengths
+        self.average_length = float(doc_lengths.mean()) if len(doc_lengths) else 0.0
+
+    # Build the index from a LangChain FAISS store's docstore
+    @classmethod
+    def from_store(cls, store):
+        return cls.update(None, store)
+
+    # The index of a store that differs from the one previous was built over by added and removed chunks.
+    # FAISS IDs are never reused for other text within one ingest, so a kept ID is a kept chunk; only the
+    # chunks previous does not know are tokenized. previous=None builds the index from scratch.
+    @classmethod
+    def update(cls, previous, store):
+        doc_ids = np.array(sorted(store.index_to_docstore_id), dtype=np.int64)
+        doc_lengths = np.zeros(len(doc_ids), dtype=np.int32)
+        known = np.zeros(len(doc_ids), dtype=bool)
+        if previous is not None and len(previous.doc_ids):
+            # Kept rows of the previous index, renumbered to their rows in the new one
+            new_rows = np.searchsorted(doc_ids, previous.doc_ids).clip(max=max(len(doc_ids) - 1, 0))
+            kept = np.isin(previous.doc_ids, doc_ids)
+            known[new_rows[kept]] = True
+            doc_lengths[new_rows[kept]] = previous.doc_lengths[kept]
+
+        added_terms, added_rows, added_tfs = [], [], []
+        for row in np.flatnonzero(~known).tolist():
+            chunk = store.index_to_docstore_id[int(doc_ids[row])]
+            tokens = tokenize(store.docstore.search(chunk).page_content)
+            doc_lengths[row] = len(tokens)
+            for term, tf in Counter(tokens).items():
+                added_terms.append(term)
+                added_rows.append(row)
+                added_tfs.append(tf)
+
+        added_terms = np.array(added_terms, dtype=str)
+        added_rows = np.array(added_rows, dtype=np.int64)
+        added_tfs = np.array(added_tfs, dtype=np.float32)
+        terms = np.unique(added_terms)
+        term_ids = np.empty(0, dtype=np.int64)
+        rows = np.empty(0, dtype=np.int64)
+        tfs = np.empty(0, dtype=np.float32)
+        if previous is not None and len(previous.doc_ids):
+            # Term and row renumbering both keep order, so the kept postings stay sorted by (term, row)
+            terms = np.union1d(previous.terms, terms)
+            posting_terms = np.repeat(np.searchsorted(terms, previous.terms), np.diff(previous.offsets))
+            live = kept[previous.rows]
+            term_ids, rows, tfs = posting_terms[live], new_rows[previous.rows[live]], previous.tfs[live]
+
+        # Postings grouped by term, rows ascending within a term: the added ones are sorted and merged in
+        added_ids = np.searchsorted(terms, added_terms)
+        added_keys = added_ids * len(doc_ids) + added_rows
+        order = np.argsort(added_keys, kind="stable")
+        at = np.searchsorted(term_ids * len(doc_ids) + rows, added_keys[order])
+        term_ids = np.insert(term_ids, at, added_ids[order])
+        rows = np.insert(rows, at, added_rows[order])
+        tfs = np.insert(tfs, at, added_tfs[order])
+
+        # Terms left without postings are dropped
+        counts = np.bincount(term_ids, minlength=len(terms))
+        used = counts > 0
+        offsets = np.zeros(int(used.sum()) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(counts[used])
+        return cls(terms[used], offsets, rows.astype(np.int32), tfs.astype(np.float32), doc_ids, doc_lengths)
+
+    def save(self, path):
+        np.savez(
+            os.path.join(path, BM25_FILE), terms=self.terms, offsets=self.offsets, rows=self.rows,
+            tfs=self.tfs, doc_ids=self.doc_ids, doc_lengths=self.doc_lengths
+        )
+
+    # Load the index saved with a version, or None for versions built before BM25 existed
+    @classmethod
+    def load(cls, path):
+        bm25_path = os.path.join(path, BM25_FILE)
+        if not os.path.exists(bm25_path):
+            return None
+        with np.load(bm25_path, allow_pickle=False) as data:
+            return cls(
+                data["terms"], data["offsets"], data["rows"], data["tfs"], data["doc_ids"], data["doc_lengths"]
+            )
+
+    # Boolean mask over document rows selecting the given FAISS IDs, to restrict searches to
+    def rows_mask(self, int_ids):
+        return np.isin(self.doc_ids, int_ids)
+
+    # Top-n (FAISS ID, BM25 score) pairs for a query, best first, optionally only over masked rows
+    def search(self, query, n, mask=None):
+        scores = np.zeros(len(self.doc_ids), dtype=np.float32)
+        total = len(self.doc_ids)
+        for term in set(tokenize(query)):
+            t = self.vocabulary.get(term)
+            if t is None:
+                continue
+            start, end = self.offsets[t], self.offsets[t + 1]
+            rows, tfs = self.rows[start:end], self.tfs[start:end]
+            idf = math.log(1.0 + (total - (end - start) + 0.5) / ((end - start) + 0.5))
+            norm = K1 * (1 - B + B * self.doc_lengths[rows] / max(self.average_length, 1e-9))
+            scores[rows] += idf * tfs * (K1 + 1) / (tfs + norm)
+
+        if mask is not None:
+            scores[~mask] = 0.0
+        hits = np.flatnonzero(scores)
+        if len(hits) > n:
+            hits = hits[np.argpartition(-scores[hits], n - 1)[:n]]
+        hits = hits[np.argsort(-scores[hits])]
+        return list(zip(self.doc_ids[hits].tolist(), scores[hits].tolist()))
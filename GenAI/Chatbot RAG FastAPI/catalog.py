@@ -0,0 +1,134 @@
+# Named document collections served from one process
+#
+# Every collection is a directory under COLLECTIONS_DIR holding its PDFs
+# (PDFFILES) and its versioned index (faiss_db), so one API with one resident
+# embedding model can serve many document sets. Opening a collection loads its
+# index into a RetrievalEngine. Open engines are kept in an LRU bounded both by
+# count (COLLECTIONS_MAX_OPEN) and by their estimated resident size
+# (COLLECTIONS_MAX_MEMORY_MB). The least recently used engines are closed once
+# either limit is exceeded, and are simply reopened on their next request.
+# Queries already running keep the snapshot they took, so closing one never
+# disturbs them. Loading an index and measuring its files happen outside the
+# catalog lock, behind a lock of that collection only, so opening a large
+# collection never holds up requests for the ones already open, and concurrent
+# first requests for the same collection load it once.
+
+import os                                                                       # For collection paths and file sizes
+import re                                                                       # For validating collection names
+import threading                                                                # For guarding the LRU
+from collections import OrderedDict                                             # For LRU ordering
+from engine import RetrievalEngine                                              # For the per-collection index
+
+COLLECTIONS_DIR = os.getenv("COLLECTIONS_DIR", "collections")
+MAX_OPEN = int(os.getenv("COLLECTIONS_MAX_OPEN", "64"))                         # Open indexes kept at most
+MAX_MEMORY_MB = float(os.getenv("COLLECTIONS_MAX_MEMORY_MB", "1024"))           # Estimated resident size of open indexes
+SOURCE_DIR = "PDFFILES"
+INDEX_DIR = "faiss_db"
+NAME_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$")
+
+
+# Bytes of the files in an index version directory, the upper bound of what opening it keeps resident
+def version_bytes(path):
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+
+class CollectionCatalog:
+    """Opens collections on demand and keeps the most recently used ones resident within a memory budget."""
+
+    def __init__(self, root, embeddings, config=None, max_open=MAX_OPEN, max_bytes=MAX_MEMORY_MB * 1024 * 1024):
+        self.root = root
+        self.embeddings = embeddings        # Shared by every collection
+        self.config = config
+        self.max_open = max_open
+        self.max_bytes = max_bytes
+        self._open = OrderedDict()          # Name -> [engine, generation, bytes], least recently used first
+        self._lock = threading.Lock()
+        self._opening = {}                  # Name -> lock held while that collection is being loaded
+        self.opened = 0
+        self.evictions = 0
+
+    # Validate a collection name so it is always a single directory under the root
+    def check_name(self, name):
+        if not NAME_PATTERN.match(name):
+            raise ValueError("Collection names use letters, digits, '.', '_' and '-' and are at most 64 characters.")
+        return name
+
+    def source_dir(self, name):
+        return os.path.join(self.root, self.check_name(name), SOURCE_DIR)
+
+    def index_dir(self, name):
+        return os.path.join(self.root, self.check_name(name), INDEX_DIR)
+
+    # Names of every collection on disk
+    def names(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name for name in os.listdir(self.root)
+                      if NAME_PATTERN.match(name) and os.path.isdir(os.path.join(self.root, name)))
+
+    def exists(self, name):
+        return os.path.isdir(os.path.join(self.root, self.check_name(name)))
+
+    # Engine of a collection, opening it and closing least recently used ones as needed
+    def get(self, name):
+        self.check_name(name)
+        with self._lock:
+            entry = self._open.get(name)
+            if entry is not None:
+                self._open.move_to_end(name)
+            else:
+                opening = self._opening.setdefault(name, threading.Lock())
+        if entry is None:
+            with opening:
+                try:
+                    with self._lock:
+                        entry = self._open.get(name)
+                    if entry is None:
+                        # First request since it was opened last: load it while other collections keep being served
+                        engine = RetrievalEngine(self.index_dir(name), self.embeddings, self.config)
+                        engine.load()
+                        with self._lock:
+                            entry = self._open[name] = [engine, None, 0]
+                            self.opened += 1
+                finally:
+                    # Loaded or failed, the lock is done with; a later open after eviction gets a new one
+                    with self._lock:
+                        if self._opening.get(name) is opening:
+                            del self._opening[name]
+        self._measure(name, entry)
+        return entry[0]
+
+    # Re-measure an engine whose collection published a new version since it was last measured, then evict
+    def _measure(self, name, entry):
+        snapshot = entry[0].snapshot()
+        generation = snapshot.generation if snapshot is not None else None
+        size = None
+        if generation != entry[1]:
+            size = version_bytes(snapshot.path) if snapshot is not None else 0
+        with self._lock:
+            if size is not None and self._open.get(name) is entry:
+                entry[1] = generation
+                entry[2] = size
+            self._evict(keep=name)
+
+    # Close least recently used engines until both limits hold again; the one just requested stays
+    def _evict(self, keep):
+        while len(self._open) > 1 and (
+            len(self._open) > self.max_open or sum(entry[2] for entry in self._open.values()) > self.max_bytes
+        ):
+            oldest = next(iter(self._open))
+            if oldest == keep:
+                break
+            del self._open[oldest]
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "open": {name: {"generation": entry[1], "bytes": entry[2]} for name, entry in self._open.items()},
+                "open_bytes": sum(entry[2] for entry in self._open.values()),
+                "max_open": self.max_open,
+                "max_bytes": int(self.max_bytes),
+                "opened": self.opened,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,184 @@
+# Persistent embedding cache keyed by chunk hash
+#
+# Vectors live in an append-only float32 matrix that is memory-mapped for reads,
+# next to an append-only file of 32-byte keys where row i of one file belongs to
+# key i of the other. A key is the SHA-256 of the embedder name and the
+# normalized chunk text, so rebuilding or re-ingesting an index only pays the
+# embedding cost for text that has never been seen before.
+
+import os                                                                       # For handling file paths
+import re                                                                       # For whitespace normalization
+import json                                                                     # For the cache metadata
+import hashlib                                                                  # For the cache keys
+import threading                                                                # For guarding appends inside one process
+import unicodedata                                                              # For unicode normalization
+import numpy as np                                                              # For the memory-mapped vector matrix
+from langchain_core.embeddings import Embeddings                                # Base class for LangChain embedding models
+
+try:
+    import fcntl                                                                # For locking appends across worker processes
+except ImportError:                                                             # Not available on Windows
+    fcntl = None
+
+KEY_SIZE = 32                   # Bytes per SHA-256 key
+VECTORS_FILE = "vectors.f32"
+KEYS_FILE = "keys.bin"
+META_FILE = "meta.json"
+LOCK_FILE = "lock"
+
+
+# Normalize chunk text so formatting-only differences share one cache entry
+def normalize_text(text):
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text)).strip()
+
+
+class EmbeddingCache:
+    """On-disk store of vectors for one embedding model, shared by every process using the same directory."""
+
+    def __init__(self, cache_dir, embedder_name):
+        self.embedder_name = embedder_name
+        self.path = os.path.join(cache_dir, re.sub(r"[^A-Za-z0-9_.-]", "_", embedder_name))
+        os.makedirs(self.path, exist_ok=True)
+        self.dim = None
+        self.hits = 0
+        self.misses = 0
+        self._rows = {}
+        self._keys_read = 0
+        self._matrix = None
+        self._lock = threading.Lock()
+
+        meta_path = os.path.join(self.path, META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                self.dim = json.load(f)["dim"]
+            self._refresh()
+
+    # Cache key for a chunk text
+    def key(self, text):
+        return hashlib.sha256(f"{self.embedder_name}\0{normalize_text(text)}".encode("utf-8")).digest()
+
+    # Return cached vectors for the keys, None where a key has not been embedded yet
+    def get_many(self, keys):
+        with self._lock:
+            rows = [self._rows.get(key) for key in keys]
+            if None in rows and self.dim is not None:
+                self._refresh()
+                rows = [self._rows.get(key) for key in keys]
+            found = [row for row in rows if row is not None]
+            self.hits += len(found)
+            self.misses += len(rows) - len(found)
+            if not found:
+                return [None] * len(keys)
+            matrix = self._map(max(found) + 1)
+            vectors = iter(np.asarray(matrix[found]).tolist())
+            return [next(vectors) if row is not None else None for row in rows]
+
+    # Append new vectors; keys already present (for example written by another worker) are skipped
+    def put_many(self, keys, vectors):
+        if not keys:
+            return
+        with self._lock, self._file_lock():
+            if self.dim is None:
+                self.dim = len(vectors[0])
+                with open(os.path.join(self.path, META_FILE), "w") as f:
+                    json.dump({"embedder": self.embedder_name, "dim": self.dim}, f)
+            self._refresh()
+            new = {}
+            for key, vector in zip(keys, vectors):
+                if key not in self._rows and key not in new:
+                    new[key] = vector
+            if not new:
+                return
+
+            # Vectors are written before keys, so a crash never leaves a key without its vector. Both files
+            # are cut back to the last whole key first: bytes a crashed append left behind would otherwise
+            # shift every later key onto the wrong row.
+            start = self._keys_read // KEY_SIZE
+            with open(os.path.join(self.path, VECTORS_FILE), "ab") as f:
+                f.truncate(start * self.dim * 4)
+                f.write(np.asarray(list(new.values()), dtype=np.float32).tobytes())
+                f.flush()
+            with open(os.path.join(self.path, KEYS_FILE), "ab") as f:
+                f.truncate(self._keys_read)
+                f.write(b"".join(new.keys()))
+                f.flush()
+            for row, key in enumerate(new, start):
+                self._rows[key] = row
+            self._keys_read += len(new) * KEY_SIZE
+
+    def stats(self):
+        return {"entries": len(self._rows), "hits": self.hits, "misses": self.misses}
+
+    # Pick up keys appended by other processes since the last read
+    def _refresh(self):
+        keys_path = os.path.join(self.path, KEYS_FILE)
+        if not os.path.exists(keys_path):
+            return
+        with open(keys_path, "rb") as f:
+            f.seek(self._keys_read)
+            data = f.read()
+        whole = len(data) - len(data) % KEY_SIZE
+        start = self._keys_read // KEY_SIZE
+        for offset in range(0, whole, KEY_SIZE):
+            self._rows[data[offset:offset + KEY_SIZE]] = start + offset // KEY_SIZE
+        self._keys_read += whole
+
+    # Memory-map the vector file, remapping when it has grown past the current mapping
+    def _map(self, rows):
+        if self._matrix is None or self._matrix.shape[0] < rows:
+            vectors_path = os.path.join(self.path, VECTORS_FILE)
+            available = os.path.getsize(vectors_path) // (self.dim * 4)
+            self._matrix = np.memmap(vectors_path, dtype=np.float32, mode="r", shape=(available, self.dim))
+        return self._matrix
+
+    # Hold an exclusive lock on the cache directory while appending
+    def _file_lock(self):
+        return _FileLock(os.path.join(self.path, LOCK_FILE))
+
+
+class _FileLock:
+    """Exclusive advisory lock on a file; a no-op where fcntl is unavailable."""
+
+    def __init__(self, path):
+        self.path = path
+        self.handle = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self.handle = open(self.path, "a")
+            fcntl.flock(self.handle, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self.handle is not None:
+            fcntl.flock(self.handle, fcntl.LOCK_UN)
+            self.handle.close()
+
+
+class CachedEmbeddings(Embeddings):
+    """Wraps an embedding model so document embeddings are served from an EmbeddingCache."""
+
+    def __init__(self, embeddings, cache_dir, name=None):
+        self.embeddings = embeddings
+        self.cache = EmbeddingCache(cache_dir, name or getattr(embeddings, "model_name", type(embeddings).__name__))
+
+    # Embed only the texts the cache has not seen, then store them for next time
+    def embed_documents(self, texts):
+        keys = [self.cache.key(text) for text in texts]
+        vectors = self.cache.get_many(keys)
+        missing = {}
+        for i, (key, vector) in enumerate(zip(keys, vectors)):
+            if vector is None:
+                missing.setdefault(key, []).append(i)
+        if missing:
+            first = [positions[0] for positions in missing.values()]
+            computed = self.embeddings.embed_documents([texts[i] for i in first])
+            self.cache.put_many(list(missing), computed)
+            for positions, vector in zip(missing.values(), computed):
+                for i in positions:
+                    vectors[i] = vector
+        return vectors
+
+    # Queries are rarely repeated verbatim, so they go straight to the model
+    def embed_query(self, text):
+        return self.embeddings.embed_query(text)
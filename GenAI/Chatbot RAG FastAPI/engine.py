@@ -0,0 +1,344 @@
+# Process-wide retrieval engine for the RAG API
+#
+# The embedding model and the FAISS index are loaded once and kept resident for
+# every /query/ call. Each ingest writes a complete new version directory under
+# the index root and then flips the CURRENT pointer, so a query either sees the
+# old index or the new one, never a half-written faiss_db. Published versions are
+# opened memory-mapped, and other worker processes pick a new version up by
+# watching CURRENT.
+
+import os                                                                       # For handling file paths
+import json                                                                     # For reading and writing the ingest manifest
+import shutil                                                                   # For removing old index versions
+import time                                                                     # For rate-limiting CURRENT checks
+import threading                                                                # For guarding the snapshot swap
+from dataclasses import dataclass                                               # For the immutable index snapshot
+import numpy as np                                                              # For query vector matrices
+from faiss_index import IndexConfig, read_store, ensure_id_index, search_subset, stored_vectors  # For configurable, memory-mapped index types
+from bm25_index import BM25Index, reciprocal_rank_fusion                        # For keyword search and rank fusion
+from provenance import ChunkProvenance                                          # For chunk sources, pages and filters
+from mmr import mmr_select                                                      # For diversifying dense candidates by maximal marginal relevance
+from metrics import stage                                                       # For per-stage latency metrics
+
+CURRENT_FILE = "CURRENT"        # Pointer file holding the name of the live version directory
+VERSION_PREFIX = "v"            # Version directories are named v000001, v000002, ...
+KEEP_VERSIONS = 2               # Number of published versions kept on disk
+REFRESH_INTERVAL = 1.0          # Seconds between checks for a version published by another process
+MANIFEST_FILE = "manifest.json" # File and chunk content hashes of the sources in a version
+SEARCH_MODES = ("dense", "bm25", "hybrid", "mmr")
+HYBRID_FETCH_K = 20             # Minimum candidates taken from each ranking before fusion
+MMR_FETCH_K = 20                # Default dense candidates re-ranked by MMR
+MMR_LAMBDA = 0.5                # Default MMR trade-off: 1 is pure relevance, 0 pure novelty
+
+
+# One retrieved chunk with its score: L2 distance for dense and MMR search (lower is closer),
+# BM25 score or fused reciprocal-rank score for keyword and hybrid search (higher is closer),
+# and the source file and 1-based page it was cut from when the version records provenance,
+# plus the other (source, page) places whose near-duplicate chunks ingest collapsed into it.
+# Dense matches also carry the chunk's int64 FAISS ID.
+@dataclass(frozen=True)
+class Match:
+    id: str
+    text: str
+    score: float
+    source: str = None
+    page: int = None
+    duplicates: tuple = ()
+    int_id: int = None
+
+
+# Embed a batch of queries with the given embeddings in one pass; spaCy document vectors only need
+# the tokenizer, so the tagger, parser and NER are skipped. Queries bypass the chunk embedding cache.
+def embed_queries(embeddings, queries):
+    model = getattr(embeddings, "embeddings", embeddings)
+    nlp = getattr(model, "nlp", None)
+    if nlp is not None:
+        return np.array([doc.vector for doc in nlp.tokenizer.pipe(queries)], dtype=np.float32)
+    return np.array([embeddings.embed_query(query) for query in queries], dtype=np.float32)
+
+
+# One published, fully loaded version of the index
+@dataclass(frozen=True)
+class IndexSnapshot:
+    generation: int             # Monotonic version number, 0 for a legacy un-versioned faiss_db
+    path: str                   # Directory the version was loaded from
+    store: object               # Resident LangChain FAISS store
+    manifest: dict              # Ingest manifest, None for an index built before manifests existed
+    bm25: object = None         # BM25 index over the same chunks, None for a version built before BM25 existed
+    provenance: object = None   # Source, page and offset columns, None for a version built before provenance existed
+
+    # Search all query vectors with a single FAISS call and return the top-k matches per query,
+    # optionally restricted to a set of int64 IDs
+    def search(self, vectors, k, int_ids=None):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        with stage("faiss_search"):
+            if int_ids is None:
+                distances, labels = self.store.index.search(vectors, k)
+            else:
+                distances, labels = search_subset(self.store.index, vectors, k, int_ids)
+        with stage("docstore"):
+            return self._matches(distances.tolist(), labels.tolist())
+
+    # Int64 IDs of the chunks matching source and page filters, or None when no filter is given
+    def select(self, sources=None, page_from=None, page_to=None):
+        if sources is None and page_from is None and page_to is None:
+            return None
+        if self.provenance is None:
+            raise ValueError("This index has no chunk provenance; run /ingest/ again to enable filters.")
+        return self.provenance.select(sources, page_from, page_to)
+
+    # Rank queries with dense vectors, BM25 or both fused with reciprocal rank fusion, or take
+    # fetch_k dense candidates and pick k of them by MMR. With prefilter > 0 the dense search
+    # only considers the prefilter best BM25 candidates, and with int_ids (see select) both
+    # searches only consider those chunks.
+    def retrieve(self, queries, vectors, k, mode="hybrid", prefilter=0, int_ids=None,
+                 fetch_k=MMR_FETCH_K, lambda_mult=MMR_LAMBDA):
+        if int_ids is not None and len(int_ids) == 0:
+            return [[] for _ in queries]
+        if self.bm25 is None:
+            mode, prefilter = ("mmr" if mode == "mmr" else "dense"), 0
+        mask = self.bm25.rows_mask(int_ids) if self.bm25 is not None and int_ids is not None else None
+        if mode == "bm25":
+            with stage("bm25_search"):
+                keyword = [self.bm25.search(query, k, mask) for query in queries]
+            return [self._keyword_matches(pairs) for pairs in keyword]
+
+        if mode == "dense":
+            fetch_k = k
+        elif mode == "mmr":
+            fetch_k = max(fetch_k, k)
+        else:
+            fetch_k = max(4 * k, HYBRID_FETCH_K)
+        keyword = None
+        if mode == "hybrid" or prefilter > 0:
+            with stage("bm25_search"):
+                keyword = [self.bm25.search(query, max(prefilter, fetch_k), mask) for query in queries]
+        if prefilter > 0:
+            dense = [
+                self.search(vectors[i:i + 1], fetch_k, [int_id for int_id, _ in keyword[i][:prefilter]])[0]
+                if keyword[i] else self.search(vectors[i:i + 1], fetch_k, int_ids)[0]
+                for i in range(len(queries))
+            ]
+        else:
+            dense = self.search(vectors, fetch_k, int_ids)
+        if mode == "dense":
+            return dense
+        if mode == "mmr":
+            return self.diversify(vectors, dense, k, lambda_mult)
+
+        lookup = self.store.index_to_docstore_id
+        results = []
+        with stage("fuse"):
+            for dense_matches, keyword_pairs in zip(dense, keyword):
+                fused = reciprocal_rank_fusion([
+                    [match.id for match in dense_matches],
+                    [lookup[int_id] for int_id, _ in keyword_pairs[:fetch_k]],
+                ])
+                results.append(self.resolve(fused[:k]))
+        return results
+
+    # Re-rank each query's dense candidates by MMR and keep k
+    def diversify(self, vectors, candidates, k, lambda_mult=MMR_LAMBDA):
+        width = max((len(matches) for matches in candidates), default=0)
+        if width == 0:
+            return [[] for _ in candidates]
+        with stage("mmr_vectors"):
+            embedded = self.candidate_vectors({match.id: match for matches in candidates for match in matches})
+        with stage("mmr"):
+            dim = vectors.shape[1]
+            matrix = np.zeros((len(candidates), width, dim), dtype=np.float32)
+            valid = np.zeros((len(candidates), width), dtype=bool)
+            for row, matches in enumerate(candidates):
+                if matches:
+                    matrix[row, :len(matches)] = [embedded[match.id] for match in matches]
+                    valid[row, :len(matches)] = True
+            picks = mmr_select(vectors, matrix, valid, k, lambda_mult)
+        return [[matches[i] for i in row if i != -1] for matches, row in zip(candidates, picks.tolist())]
+
+    # Vectors of candidate matches by chunk ID. Flat, HNSW and IVF-Flat indexes hold them exactly and
+    # hand them back by int64 ID. SQ8 and PQ keep only lossy codes, so those come from the chunk
+    # embedding cache, read without adding to it, and only chunks it misses are embedded again.
+    def candidate_vectors(self, matches):
+        int_ids = [match.int_id for match in matches.values()]
+        if None not in int_ids:
+            stored = stored_vectors(self.store.index, int_ids)
+            if stored is not None:
+                return dict(zip(matches, stored))
+        texts = [match.text for match in matches.values()]
+        model = self.store.embedding_function
+        cache = getattr(model, "cache", None)
+        if cache is None:
+            return dict(zip(matches, model.embed_documents(texts)))
+        found = cache.get_many([cache.key(text) for text in texts])
+        missing = [i for i, vector in enumerate(found) if vector is None]
+        if missing:
+            for i, vector in zip(missing, model.embeddings.embed_documents([texts[i] for i in missing])):
+                found[i] = vector
+        return dict(zip(matches, found))
+
+    # Rebuild matches from (chunk ID, score) pairs, for example ones served from the query cache
+    def resolve(self, pairs):
+        return [self._match(chunk, score) for chunk, score in pairs]
+
+    # Match for one chunk, with its source and page when they are known
+    def _match(self, chunk, score, int_id=None):
+        text = self.store.docstore.search(chunk).page_content
+        locations = self.provenance.locations(chunk) if self.provenance is not None else []
+        if not locations:
+            return Match(chunk, text, score, int_id=int_id)
+        (source, page, _), others = locations[0], locations[1:]
+        duplicates = tuple((other, other_page or None) for other, other_page, _ in others)
+        return Match(chunk, text, score, source, page or None, duplicates, int_id)
+
+    # Matches for (int64 ID, BM25 score) pairs
+    def _keyword_matches(self, pairs):
+        lookup = self.store.index_to_docstore_id
+        return self.resolve([(lookup[int_id], score) for int_id, score in pairs])
+
+    # Matches for rows of FAISS distances and labels, skipping the -1 padding of short results
+    def _matches(self, distances, labels):
+        lookup = self.store.index_to_docstore_id
+        return [
+            [self._match(lookup[label], distance, label)
+             for distance, label in zip(row_distances, row_labels) if label != -1]
+            for row_distances, row_labels in zip(distances, labels)
+        ]
+
+
+class RetrievalEngine:
+    """Keeps one FAISS index resident and hot-swaps it when a new version is published."""
+
+    def __init__(self, index_dir, embeddings, config=None, keep_versions=KEEP_VERSIONS):
+        self.index_dir = index_dir
+        self.embeddings = embeddings
+        self.config = config or IndexConfig()
+        self.keep_versions = keep_versions
+        self._snapshot = None
+        self._publish_lock = threading.Lock()
+        self._checked = 0.0
+
+    # Return the snapshot queries should use; callers keep the reference for the whole request
+    def snapshot(self):
+        return self._snapshot
+
+    # Embed a batch of queries with the engine's embeddings
+    def embed_queries(self, queries):
+        return embed_queries(self.embeddings, queries)
+
+    # Reload if another process published a newer version; checks CURRENT at most once per interval
+    def refresh(self):
+        now = time.monotonic()
+        if now - self._checked < REFRESH_INTERVAL:
+            return self._snapshot
+        self._checked = now
+        path, generation = self._current_version()
+        current = self._snapshot
+        if path is not None and (current is None or generation > current.generation):
+            with self._publish_lock:
+                if self._snapshot is None or generation > self._snapshot.generation:
+                    self.load()
+        return self._snapshot
+
+    # Load the version CURRENT points to, falling back to a legacy flat faiss_db directory
+    def load(self):
+        path, generation = self._current_version()
+        if path is None:
+            return None
+        with stage("faiss_load"):
+            store = read_store(path, self.embeddings, self.config, mmap=self.config.mmap)
+            self._snapshot = IndexSnapshot(
+                generation, path, store, self._read_manifest(path), BM25Index.load(path),
+                ChunkProvenance.load(path, store.index_to_docstore_id)
+            )
+        return self._snapshot
+
+    # Load a private, writable copy of a snapshot's store so it can be updated incrementally
+    def load_copy(self, snapshot):
+        return ensure_id_index(read_store(snapshot.path, self.embeddings, self.config, mmap=False))
+
+    # Persist the store and its sidecars as a new version, point CURRENT at it and swap it in
+    def publish(self, store, manifest=None, bm25=None, provenance=None, minhash=None):
+        with self._publish_lock:
+            os.makedirs(self.index_dir, exist_ok=True)
+            generation = self._latest_generation() + 1
+            name = f"{VERSION_PREFIX}{generation:06d}"
+            path = os.path.join(self.index_dir, name)
+
+            # Write into a temporary directory first so a crash never leaves a partial version
+            tmp_path = path + ".tmp"
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            with stage("faiss_save"):
+                store.save_local(tmp_path)
+            if manifest is not None:
+                with open(os.path.join(tmp_path, MANIFEST_FILE), "w") as f:
+                    json.dump(manifest, f)
+            if bm25 is not None:
+                bm25.save(tmp_path)
+            if provenance is not None:
+                provenance.save(tmp_path)
+            if minhash is not None:
+                minhash.save(tmp_path)
+            os.replace(tmp_path, path)
+            self._write_current(name)
+
+            # Serve the published files memory-mapped rather than the private copy ingest built in RAM
+            if self.config.mmap:
+                with stage("faiss_load"):
+                    store = read_store(path, self.embeddings, self.config, mmap=True)
+
+            # A single reference assignment is atomic, in-flight queries keep their old snapshot
+            self._snapshot = IndexSnapshot(generation, path, store, manifest, bm25, provenance)
+            self._prune(keep=name)
+            return self._snapshot
+
+    # Resolve the live version directory and its generation number
+    def _current_version(self):
+        pointer = os.path.join(self.index_dir, CURRENT_FILE)
+        if os.path.exists(pointer):
+            with open(pointer) as f:
+                name = f.read().strip()
+            path = os.path.join(self.index_dir, name)
+            if os.path.isdir(path):
+                return path, int(name[len(VERSION_PREFIX):])
+        if os.path.exists(os.path.join(self.index_dir, "index.faiss")):
+            return self.index_dir, 0
+        return None, 0
+
+    # Read the manifest stored next to a version, if it has one
+    def _read_manifest(self, path):
+        manifest_path = os.path.join(path, MANIFEST_FILE)
+        if not os.path.exists(manifest_path):
+            return None
+        with open(manifest_path) as f:
+            return json.load(f)
+
+    # Replace the CURRENT pointer atomically
+    def _write_current(self, name):
+        pointer = os.path.join(self.index_dir, CURRENT_FILE)
+        with open(pointer + ".tmp", "w") as f:
+            f.write(name)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(pointer + ".tmp", pointer)
+
+    # List published version directories sorted oldest first
+    def _versions(self):
+        if not os.path.isdir(self.index_dir):
+            return []
+        names = [
+            name for name in os.listdir(self.index_dir)
+            if name.startswith(VERSION_PREFIX) and name[len(VERSION_PREFIX):].isdigit()
+        ]
+        return sorted(names)
+
+    def _latest_generation(self):
+        versions = self._versions()
+        return int(versions[-1][len(VERSION_PREFIX):]) if versions else 0
+
+    # Remove old versions; the live one is always kept
+    def _prune(self, keep):
+        older = [name for name in self._versions() if name != keep]
+        retained = max(self.keep_versions - 1, 0)
+        stale = older[:len(older) - retained]
+        for name in stale:
+            shutil.rmtree(os.path.join(self.index_dir, name), ignore_errors=True)
@@ -0,0 +1,183 @@
+# Bounded execution pools for blocking work called from async endpoints
+#
+# torch generation, spaCy and FAISS calls block, so running them directly in an
+# async def endpoint stalls the event loop and serializes every other request.
+# Each workload class gets its own small pool instead, sized with environment
+# variables (<NAME>_POOL_WORKERS, <NAME>_POOL_QUEUE), and a queue-depth limit:
+# once workers + queue slots are taken, new requests are turned away at once
+# with 429 and a Retry-After estimate instead of piling up.
+#
+# The cores are split between every worker of every pool, so concurrent calls
+# share them instead of oversubscribing them. The intra-op thread count of
+# torch and FAISS is a process-wide setting, so it is set once, when the
+# Executor is created, to the cores divided by all workers (INTRA_OP_THREADS
+# overrides it). Worker processes of process pools set their own, which
+# <NAME>_POOL_THREADS can override per pool.
+
+import os                                                                       # For the CPU count and pool configuration
+import sys                                                                      # For checking which numeric libraries are loaded
+import math                                                                     # For rounding Retry-After up
+import time                                                                     # For service time estimates
+import asyncio                                                                  # For awaiting pool work from endpoints
+import threading                                                                # For guarding the admission counters
+import contextvars                                                              # For carrying request context into worker threads
+import multiprocessing                                                          # For a fork-safe process pool context
+from contextlib import asynccontextmanager                                      # For shutting the pools down with the app's lifespan
+from functools import partial                                                   # For binding call arguments
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor          # For the worker pools
+from fastapi.responses import JSONResponse                                      # For the 429/503 responses
+
+CPU_COUNT = os.cpu_count() or 1
+INTRA_OP_THREADS = int(os.getenv("INTRA_OP_THREADS", "0"))     # torch/FAISS threads of this process, 0 splits the cores
+
+
+class Overloaded(Exception):
+    """Raised when a pool cannot accept more work; becomes a 429 (queue full) or 503 (shutting down)."""
+
+    def __init__(self, pool, status_code, retry_after):
+        super().__init__(f"The {pool} pool is {'busy' if status_code == 429 else 'unavailable'}.")
+        self.pool = pool
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+# Limit the intra-op threads of the numeric libraries this process has loaded
+def set_intra_op_threads(threads):
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(threads)
+    if "faiss" in sys.modules:
+        sys.modules["faiss"].omp_set_num_threads(threads)
+
+
+class WorkloadPool:
+    """A bounded thread or process pool for one class of blocking work, with admission control."""
+
+    def __init__(self, name, workers=1, max_queue=8, kind="thread", intra_op_threads=None):
+        self.name = name
+        self.workers = workers
+        self.max_queue = max_queue
+        self.kind = kind
+        self.intra_op_threads = intra_op_threads    # Only for process pools; threads share the process setting
+        self.active = 0
+        self.rejected = 0
+        self.completed = 0
+        self.average_seconds = None     # Moving average of the time one call takes
+        self.closed = False
+        self._lock = threading.Lock()
+        self._pool = None
+
+    # Create the workers; share is the intra-op thread count each worker gets from the Executor's budget
+    def start(self, share):
+        if self.kind == "process":
+            self.intra_op_threads = self.intra_op_threads or share
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                initializer=set_intra_op_threads, initargs=(self.intra_op_threads,)
+            )
+        else:
+            self.intra_op_threads = share
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=self.name)
+
+    # Pool sized from <NAME>_POOL_WORKERS, <NAME>_POOL_QUEUE and <NAME>_POOL_THREADS, with the given defaults
+    @classmethod
+    def from_env(cls, name, workers=1, max_queue=8, kind="thread", intra_op_threads=None):
+        prefix = name.upper()
+        threads = os.getenv(f"{prefix}_POOL_THREADS")
+        return cls(
+            name,
+            workers=int(os.getenv(f"{prefix}_POOL_WORKERS", workers)),
+            max_queue=int(os.getenv(f"{prefix}_POOL_QUEUE", max_queue)),
+            kind=kind,
+            intra_op_threads=int(threads) if threads else intra_op_threads,
+        )
+
+    # Seconds a rejected client should wait: the queue ahead of it drained at the observed service rate
+    def retry_after(self):
+        per_call = self.average_seconds or 1.0
+        return max(1, math.ceil(per_call * max(self.active, 1) / self.workers))
+
+    # Run fn(*args, **kwargs) in the pool and await its result, or raise Overloaded without queueing
+    async def run(self, fn, *args, **kwargs):
+        with self._lock:
+            if self.closed:
+                raise Overloaded(self.name, 503, self.retry_after())
+            if self.active >= self.workers + self.max_queue:
+                self.rejected += 1
+                raise Overloaded(self.name, 429, self.retry_after())
+            self.active += 1
+
+        call = partial(fn, *args, **kwargs)
+        if self.kind == "thread":
+            # Worker threads see the request's context variables, such as its metrics trace
+            call = partial(contextvars.copy_context().run, call)
+        started = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._pool, call)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.active -= 1
+                self.completed += 1
+                self.average_seconds = elapsed if self.average_seconds is None else 0.9 * self.average_seconds + 0.1 * elapsed
+
+    def stats(self):
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "intra_op_threads": self.intra_op_threads,
+            "running": min(self.active, self.workers),
+            "queued": max(self.active - self.workers, 0),
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "average_ms": round(self.average_seconds * 1000, 2) if self.average_seconds is not None else None,
+        }
+
+    def shutdown(self):
+        with self._lock:
+            self.closed = True
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+
+
+class Executor:
+    """The workload pools of one app, plus the FastAPI wiring that turns Overloaded into 429/503."""
+
+    def __init__(self, *pools):
+        self.pools = {pool.name: pool for pool in pools}
+        # One intra-op thread count for this process, from the cores split between all workers
+        self.intra_op_threads = INTRA_OP_THREADS or max(1, CPU_COUNT // max(sum(pool.workers for pool in pools), 1))
+        set_intra_op_threads(self.intra_op_threads)
+        for pool in pools:
+            pool.start(self.intra_op_threads)
+
+    def __getitem__(self, name):
+        return self.pools[name]
+
+    # Register the Overloaded handler and shut the pools down after the app's own lifespan ends
+    def install(self, app):
+        async def overloaded(request, exc):
+            return JSONResponse(
+                status_code=exc.status_code,
+                content={"detail": str(exc)},
+                headers={"Retry-After": str(exc.retry_after)},
+            )
+        app.add_exception_handler(Overloaded, overloaded)
+
+        inner = app.router.lifespan_context
+
+        @asynccontextmanager
+        async def lifespan(app):
+            try:
+                async with inner(app) as state:
+                    yield state
+            finally:
+                self.shutdown()
+        app.router.lifespan_context = lifespan
+
+    def stats(self):
+        return {name: pool.stats() for name, pool in self.pools.items()}
+
+    def shutdown(self):
+        for pool in self.pools.values():
+            pool.shutdown()
@@ -0,0 +1,252 @@
+# Configurable FAISS index types for the RAG API
+#
+# LangChain's FAISS.from_documents always builds an exact IndexFlatL2, so every
+# search is O(N) and every worker holds the whole index in RAM. Here the index
+# type is chosen through environment variables:
+#
+#   FAISS_INDEX_TYPE   flat | sq8 | hnsw | ivf_flat | ivf_pq   (default flat)
+#   FAISS_NLIST        IVF cells, 0 picks ~4*sqrt(training sample)
+#   FAISS_PQ_M         PQ sub-quantizers, 0 picks the largest divisor of the dimension <= min(dim/4, 64)
+#   FAISS_NPROBE       IVF cells visited per query
+#   FAISS_HNSW_M       HNSW neighbours per node
+#   FAISS_EF_SEARCH    HNSW search breadth
+#   FAISS_TRAIN_SIZE   vectors sampled during ingest to train IVF/PQ/SQ8
+#   FAISS_MMAP         1 to open published indexes memory-mapped (default 1)
+#
+# Every index is addressed by stable int64 IDs (IVF natively, the rest through
+# IDMap2), so chunks can be added and removed without renumbering. Published
+# indexes are opened memory-mapped, so several uvicorn workers share one
+# page-cached copy instead of each loading its own.
+
+import os                                                                       # For environment configuration and file paths
+import math                                                                     # For the automatic IVF cell count
+import pickle                                                                   # For LangChain's docstore sidecar
+from dataclasses import dataclass                                               # For the index configuration
+import faiss                                                                    # For the vector indexes
+import numpy as np                                                              # For vector batches
+from langchain_community.vectorstores import FAISS                              # For efficient vector-based storage and retrieval
+from langchain_community.docstore.in_memory import InMemoryDocstore             # For chunk texts keyed by chunk ID
+from langchain.docstore.document import Document                                # For Document processing
+
+INDEX_TYPES = ("flat", "sq8", "hnsw", "ivf_flat", "ivf_pq")
+TRAINED_TYPES = ("sq8", "ivf_flat", "ivf_pq")
+MIN_TRAIN_SIZE = 1000           # Below this many vectors a trained index falls back to flat
+PQ_MIN_TRAIN_SIZE = 256 * 39    # 8-bit PQ codebooks need ~39 points per centroid, below this IVF-PQ falls back to IVF-Flat
+HNSW_EXACT_LIMIT = 4096         # Filtered HNSW searches over at most this many IDs are ranked exactly
+
+
+@dataclass(frozen=True)
+class IndexConfig:
+    index_type: str = "flat"
+    nlist: int = 0
+    pq_m: int = 0
+    nprobe: int = 16
+    hnsw_m: int = 32
+    ef_search: int = 64
+    train_size: int = 50000
+    mmap: bool = True
+
+    # Read the configuration from FAISS_* environment variables
+    @classmethod
+    def from_env(cls):
+        index_type = os.getenv("FAISS_INDEX_TYPE", cls.index_type).lower()
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"FAISS_INDEX_TYPE must be one of {', '.join(INDEX_TYPES)}, not '{index_type}'.")
+        return cls(
+            index_type=index_type,
+            nlist=int(os.getenv("FAISS_NLIST", cls.nlist)),
+            pq_m=int(os.getenv("FAISS_PQ_M", cls.pq_m)),
+            nprobe=int(os.getenv("FAISS_NPROBE", cls.nprobe)),
+            hnsw_m=int(os.getenv("FAISS_HNSW_M", cls.hnsw_m)),
+            ef_search=int(os.getenv("FAISS_EF_SEARCH", cls.ef_search)),
+            train_size=int(os.getenv("FAISS_TRAIN_SIZE", cls.train_size)),
+            mmap=os.getenv("FAISS_MMAP", "1") not in ("0", "false", "False"),
+        )
+
+    def needs_training(self):
+        return self.index_type in TRAINED_TYPES
+
+
+# FAISS index_factory description for a config, given the vector dimension and training sample size
+def factory_string(config, dim, sample_size):
+    index_type = config.index_type
+    if index_type == "ivf_pq" and sample_size < PQ_MIN_TRAIN_SIZE:
+        index_type = "ivf_flat"
+    if index_type in TRAINED_TYPES and sample_size < MIN_TRAIN_SIZE:
+        index_type = "flat"
+    if index_type == "flat":
+        return "IDMap2,Flat"
+    if index_type == "sq8":
+        return "IDMap2,SQ8"
+    if index_type == "hnsw":
+        return f"IDMap2,HNSW{config.hnsw_m}"
+    nlist = config.nlist or int(4 * math.sqrt(sample_size))
+    nlist = max(1, min(nlist, sample_size // 39))
+    if index_type == "ivf_flat":
+        return f"IVF{nlist},Flat"
+    pq_m = config.pq_m or max(m for m in range(1, max(min(dim // 4, 64), 1) + 1) if dim % m == 0)
+    return f"IVF{nlist},PQ{pq_m}"
+
+
+# Apply the query-time knobs (IVF nprobe, HNSW efSearch) to a loaded index. IVF-Flat also gets an ID
+# hashtable, so stored_vectors can look its vectors up by int64 ID.
+def tune_for_search(index, config):
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(config.nprobe, ivf.nlist)
+        if isinstance(faiss.downcast_index(index), faiss.IndexIVFFlat) and ivf.direct_map.type == faiss.DirectMap.NoMap:
+            ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+    if hasattr(inner, "hnsw"):
+        inner.hnsw.efSearch = config.ef_search
+    return index
+
+
+# Search only among the given int64 IDs, inside FAISS rather than by post-filtering. Small
+# HNSW subsets are ranked exactly from their reconstructed vectors, since a graph walk that
+# skips most nodes can dead-end; larger ones and all other types take an ID selector. IVF
+# probes enough extra cells that about k selected vectors are expected in them, so a broad
+# filter costs no more than an unfiltered search and a narrow one falls back to all cells.
+def search_subset(index, vectors, k, int_ids):
+    int_ids = np.asarray(int_ids, dtype=np.int64)
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+    if hasattr(inner, "hnsw") and len(int_ids) <= HNSW_EXACT_LIMIT:
+        candidates = index.reconstruct_batch(int_ids)
+        distances = ((vectors[:, None, :] - candidates[None, :, :]) ** 2).sum(axis=2)
+        order = np.argsort(distances, axis=1)[:, :k]
+        labels = np.take_along_axis(np.broadcast_to(int_ids, distances.shape), order, axis=1)
+        found = np.take_along_axis(distances, order, axis=1)
+        missing = k - found.shape[1]
+        return (np.pad(found, ((0, 0), (0, missing)), constant_values=np.inf),
+                np.pad(labels, ((0, 0), (0, missing)), constant_values=-1))
+
+    selector = faiss.IDSelectorBatch(int_ids)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        nprobe = min(ivf.nlist, max(ivf.nprobe, math.ceil(ivf.nlist * 4 * k / max(len(int_ids), 1))))
+        params = faiss.SearchParametersIVF(sel=selector, nprobe=nprobe)
+    elif hasattr(inner, "hnsw"):
+        params = faiss.SearchParametersHNSW(sel=selector, efSearch=max(inner.hnsw.efSearch, 4 * k))
+    else:
+        params = faiss.SearchParameters(sel=selector)
+    return index.search(vectors, k, params=params)
+
+
+# Exact vectors of int64 IDs as a float32 matrix, or None for index types that keep only lossy
+# codes (SQ8, PQ). LangChain's legacy flat index uses positions as IDs, which works just the same.
+def stored_vectors(index, int_ids):
+    inner = faiss.downcast_index(index.index if isinstance(index, faiss.IndexIDMap2) else index)
+    if not isinstance(inner, (faiss.IndexFlat, faiss.IndexHNSWFlat, faiss.IndexIVFFlat)):
+        return None
+    if isinstance(inner, faiss.IndexIVFFlat) and inner.direct_map.type == faiss.DirectMap.NoMap:
+        return None
+    return index.reconstruct_batch(np.asarray(int_ids, dtype=np.int64))
+
+
+# Create an empty LangChain store around a freshly trained index
+def new_store(embeddings, config, train_vectors):
+    vectors = np.asarray(train_vectors, dtype=np.float32)
+    factory = factory_string(config, vectors.shape[1], len(vectors))
+    index = faiss.index_factory(vectors.shape[1], factory)
+    if not index.is_trained:
+        index.train(vectors)
+    store = FAISS(embeddings, tune_for_search(index, config), InMemoryDocstore(), {})
+    return store, factory
+
+
+# First int64 ID not used by the store yet
+def next_int_id(store):
+    return max(store.index_to_docstore_id, default=-1) + 1
+
+
+# Add chunk texts and their vectors under int64 IDs starting at start; returns the next free ID
+def add_to_store(store, ids, texts, vectors, start):
+    int_ids = np.arange(start, start + len(ids), dtype=np.int64)
+    store.index.add_with_ids(np.asarray(vectors, dtype=np.float32), int_ids)
+    store.docstore.add({chunk: Document(page_content=text, metadata={}) for chunk, text in zip(ids, texts)})
+    store.index_to_docstore_id.update(zip(int_ids.tolist(), ids))
+    return start + len(ids)
+
+
+# Remove chunks by ID; HNSW cannot delete in place, so its graph is rebuilt from the remaining vectors
+def remove_from_store(store, ids, config):
+    doomed = set(ids)
+    int_ids = np.array([i for i, chunk in store.index_to_docstore_id.items() if chunk in doomed], dtype=np.int64)
+    if len(int_ids) == 0:
+        return 0
+    index = store.index
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+    if hasattr(inner, "hnsw"):
+        keep_ids = faiss.vector_to_array(index.id_map)
+        keep_vectors = inner.reconstruct_n(0, inner.ntotal)
+        mask = ~np.isin(keep_ids, int_ids)
+        rebuilt = faiss.index_factory(index.d, f"IDMap2,HNSW{config.hnsw_m}")
+        rebuilt.add_with_ids(keep_vectors[mask], keep_ids[mask])
+        store.index = tune_for_search(rebuilt, config)
+    else:
+        index.remove_ids(int_ids)
+    store.docstore.delete([store.index_to_docstore_id[i] for i in int_ids.tolist()])
+    for i in int_ids.tolist():
+        del store.index_to_docstore_id[i]
+    return len(int_ids)
+
+
+# Convert an index built by LangChain (positional IDs, no ID map) so it supports stable IDs
+def ensure_id_index(store):
+    index = store.index
+    if isinstance(index, faiss.IndexIDMap2) or faiss.try_extract_index_ivf(index) is not None:
+        return store
+    converted = faiss.index_factory(index.d, "IDMap2,Flat")
+    if index.ntotal:
+        positions = np.array(sorted(store.index_to_docstore_id), dtype=np.int64)
+        converted.add_with_ids(index.reconstruct_n(0, index.ntotal), positions)
+    store.index = converted
+    return store
+
+
+# Open a saved store; memory-mapped and read-only for serving, fully in RAM for a copy to be modified
+def read_store(path, embeddings, config, mmap):
+    flags = 0
+    if mmap:
+        flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+    index_path = os.path.join(path, "index.faiss")
+    try:
+        index = faiss.read_index(index_path, flags)
+    except RuntimeError:
+        index = faiss.read_index(index_path)
+    with open(os.path.join(path, "index.pkl"), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    return FAISS(embeddings, tune_for_search(index, config), docstore, index_to_docstore_id)
+
+
+class IndexTrainer:
+    """Buffers the first vectors of a fresh ingest until there are enough to train the index on."""
+
+    def __init__(self, embeddings, config):
+        self.embeddings = embeddings
+        self.config = config
+        self.target = config.train_size if config.needs_training() else 1
+        self.buffer = []
+        self.buffered = 0
+        self.factory = None
+
+    # Take a batch; returns the store once it has been trained and filled with everything buffered
+    def feed(self, ids, texts, vectors):
+        self.buffer.append((ids, texts, vectors))
+        self.buffered += len(ids)
+        if self.buffered >= self.target:
+            return self.finish()
+        return None
+
+    # Train on whatever has been buffered (end of ingest or enough vectors) and add it
+    def finish(self):
+        if not self.buffer:
+            return None
+        sample = np.concatenate([np.asarray(vectors, dtype=np.float32) for _, _, vectors in self.buffer])
+        store, self.factory = new_store(self.embeddings, self.config, sample)
+        start = 0
+        for ids, texts, vectors in self.buffer:
+            start = add_to_store(store, ids, texts, vectors, start)
+        self.buffer = []
+        self.buffered = 0
+        return store
@@ -0,0 +1,559 @@
+# Incremental, streaming ingestion of the PDF folder into the FAISS index
+#
+# A manifest of file and chunk content hashes is stored with every index version.
+# On re-ingest only new or changed files are parsed and embedded, chunks that
+# disappeared are removed from the index by ID, and unchanged files are skipped,
+# so the work done scales with the size of the change rather than the corpus.
+#
+# The files that do need work flow through a staged pipeline:
+#
+#   parse (process pool) -> split + near-duplicate check -> embed (batched) -> FAISS add
+#
+# Stages are connected by bounded queues, so at most a few parsed files and
+# chunk batches are held in memory at any time no matter how big the corpus is.
+# The parse pool is started once per server process and shared by every ingest,
+# since each worker pays for importing the PDF stack. An ingest of at most
+# SERIAL_FILES files and SERIAL_BYTES bytes, such as one upload or one changed
+# file, is parsed on the parse stage's own thread instead.
+
+import os                                                                       # For walking the PDF folder
+import time                                                                     # For per-stage throughput
+import queue                                                                    # For the bounded queues between stages
+import hashlib                                                                  # For file and chunk content hashes
+import threading                                                                # For running the stages concurrently
+import multiprocessing                                                          # For a fork-safe process pool context
+from collections import Counter, deque                                          # For numbering repeated chunks and in-flight parses
+from concurrent.futures import Future, ProcessPoolExecutor                      # For parsing PDFs on all cores
+from concurrent.futures.process import BrokenProcessPool                        # For replacing a pool whose worker died
+from langchain_community.document_loaders import PyPDFLoader                    # Document loader integration
+from langchain.text_splitter import RecursiveCharacterTextSplitter              # For splitting long texts into manageable chunks
+from faiss_index import IndexTrainer, add_to_store, next_int_id, remove_from_store  # For building and updating the configured index type
+from bm25_index import BM25Index                                                # For the keyword index published with every version
+from provenance import ChunkProvenance                                          # For the chunk source/page columns published with every version
+from minhash import Deduplicator, MinHashIndex                                  # For collapsing near-duplicate chunks before embedding
+import metrics                                                                  # For per-stage latency histograms and ingest counters
+
+MANIFEST_VERSION = 2            # Version 2 records the page and offset of every chunk
+HASH_BLOCK_SIZE = 1 << 20                           # Read files in 1 MiB blocks while hashing
+PARSE_WORKERS = max(1, (os.cpu_count() or 2) - 1)   # Processes parsing PDFs, one core is left for the other stages
+SERIAL_FILES = 4                                    # Ingests of at most this many files ...
+SERIAL_BYTES = 4 << 20                              # ... and bytes are parsed without the process pool
+QUEUE_SIZE = 8                                      # Items allowed to wait between two stages
+EMBED_BATCH_SIZE = 64                               # Chunks embedded per call to the embedding model
+DEDUP_THRESHOLD = float(os.getenv("INGEST_DEDUP_THRESHOLD", "0.8"))    # Estimated Jaccard similarity at which chunks collapse, 0 disables
+
+_DONE = object()                # End-of-stream marker passed down the pipeline
+
+
+# Hash a file's content without loading it into memory
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Hash a chunk's text
+def chunk_sha256(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+# Build a stable chunk ID from the file it came from and its content; repeated
+# chunks inside one file are told apart by their occurrence number
+def chunk_id(relpath, chunk_hash, occurrence):
+    return hashlib.sha1(f"{relpath}\0{chunk_hash}\0{occurrence}".encode("utf-8")).hexdigest()
+
+
+# Find every PDF under the source folder, keyed by its path relative to that folder
+def scan_sources(source_dir):
+    sources = {}
+    for root, dirs, files in os.walk(source_dir):
+        for file in files:
+            if file.endswith(".pdf"):
+                path = os.path.join(root, file)
+                sources[os.path.relpath(path, source_dir)] = path
+    return sources
+
+
+# Parse one PDF into pages; usually runs inside a worker process, so it reports its own parse time
+def parse_pdf(path):
+    started = time.perf_counter()
+    pages = PyPDFLoader(path).load()
+    return pages, time.perf_counter() - started
+
+
+# Split a parsed file into chunks with their IDs, content hashes, 1-based pages and offsets in the page
+def chunk_pages(pages, relpath, text_splitter):
+    seen = Counter()
+    entries, texts = [], []
+    for chunk in text_splitter.split_documents(pages):
+        chunk_hash = chunk_sha256(chunk.page_content)
+        seen[chunk_hash] += 1
+        entries.append({
+            "id": chunk_id(relpath, chunk_hash, seen[chunk_hash]),
+            "sha256": chunk_hash,
+            "page": chunk.metadata.get("page", -1) + 1,
+            "start": chunk.metadata.get("start_index", -1),
+        })
+        texts.append(chunk.page_content)
+    return entries, texts
+
+
+class StageStats:
+    """Throughput of one pipeline stage.
+
+    Time spent waiting for input or for room downstream is tracked separately,
+    so the rate reflects how fast the stage itself works rather than its neighbours.
+    """
+
+    def __init__(self, unit):
+        self.unit = unit
+        self.items = 0
+        self.started = None
+        self.finished = None
+        self.waiting = 0.0
+
+    def start(self):
+        self.started = time.perf_counter()
+
+    def finish(self):
+        self.finished = time.perf_counter()
+
+    def report(self):
+        now = time.perf_counter()
+        elapsed = (self.finished or now) - (self.started or now)
+        busy = max(elapsed - self.waiting, 1e-9)
+        return {
+            self.unit: self.items,
+            "seconds": round(elapsed, 3),
+            "busy_seconds": round(busy, 3),
+            f"{self.unit}_per_sec": round(self.items / busy, 2) if self.items else 0.0,
+        }
+
+
+class IngestCancelled(Exception):
+    """Raised when an ingest is cancelled; nothing is published."""
+
+
+class IngestProgress:
+    """Live counters of a running ingest, read by the job status endpoint while stages update them."""
+
+    def __init__(self):
+        self.phase = "queued"
+        self.files_total = 0
+        self.files_done = 0
+        self.bytes_total = 0
+        self.bytes_done = 0
+        self.pages_done = 0
+        self.chunks_split = 0
+        self.chunks_done = 0
+        self.current_file = None        # File being split, for the job status
+        self.started = None
+        self.finished = None
+
+    # Fraction of the work done: bytes of PDF split so far, discounted by chunks still waiting to be embedded
+    def fraction(self):
+        if self.phase in ("queued", "planning"):
+            return 0.0
+        if self.phase in ("indexing", "publishing") or self.bytes_total == 0:
+            return 1.0
+        split = self.bytes_done / self.bytes_total
+        embedded = self.chunks_done / self.chunks_split if self.chunks_split else 1.0
+        return split * embedded
+
+    def report(self):
+        fraction = self.fraction()
+        elapsed = (self.finished or time.time()) - self.started if self.started else 0.0
+        eta = elapsed * (1 - fraction) / fraction if 0 < fraction < 1 else None
+        return {
+            "phase": self.phase,
+            "files_total": self.files_total,
+            "files_done": self.files_done,
+            "current_file": self.current_file,
+            "pages_done": self.pages_done,
+            "chunks_done": self.chunks_done,
+            "percent": round(100 * fraction, 1),
+            "elapsed_seconds": round(elapsed, 1),
+            "eta_seconds": round(eta, 1) if eta is not None else None,
+        }
+
+
+class _Pipeline:
+    """Bounded queues, a shared stop flag and the first error raised by any stage."""
+
+    def __init__(self, queue_size, cancel=None):
+        self.queue_size = queue_size
+        self.stop = threading.Event()
+        self.cancel = cancel or threading.Event()
+        self.error = None
+
+    # True once a stage failed or the ingest was cancelled
+    def stopped(self):
+        return self.stop.is_set() or self.cancel.is_set()
+
+    def queue(self):
+        return queue.Queue(maxsize=self.queue_size)
+
+    # Block until there is room downstream, giving up if another stage failed
+    def put(self, q, item, stats):
+        waited = time.perf_counter()
+        while not self.stopped():
+            try:
+                q.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        stats.waiting += time.perf_counter() - waited
+
+    # Block until upstream produced something, returning _DONE if another stage failed
+    def get(self, q, stats):
+        waited = time.perf_counter()
+        item = _DONE
+        while not self.stopped():
+            try:
+                item = q.get(timeout=0.1)
+                break
+            except queue.Empty:
+                continue
+        stats.waiting += time.perf_counter() - waited
+        return item
+
+    # Run a stage in its own thread, recording the first failure and stopping the others
+    def spawn(self, target):
+        def run():
+            try:
+                target()
+            except BaseException as e:
+                if self.error is None:
+                    self.error = e
+                self.stop.set()
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+
+class ParsePool:
+    """Processes parsing PDFs, started on first use and shared by every ingest of the server process."""
+
+    def __init__(self, workers=PARSE_WORKERS):
+        self.workers = workers
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args):
+        with self._lock:
+            try:
+                return self._start().submit(fn, *args)
+            except BrokenProcessPool:
+                # A worker died, for example out of memory; later parses get a fresh pool
+                self._pool = None
+                return self._start().submit(fn, *args)
+
+    def _start(self):
+        if self._pool is None:
+            context = multiprocessing.get_context("spawn")
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+        return self._pool
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True, cancel_futures=True)
+                self._pool = None
+
+
+# Parse a PDF on the calling thread, as a finished future like the ones of the pool
+def parse_here(path):
+    future = Future()
+    try:
+        future.set_result(parse_pdf(path))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+# Bring the engine's index in line with the PDF folder and publish it as a new version
+def ingest_directory(engine, source_dir, chunk_size=500, chunk_overlap=100, parse_pool=None,
+                     embed_batch_size=EMBED_BATCH_SIZE, queue_size=QUEUE_SIZE, dedup_threshold=DEDUP_THRESHOLD,
+                     known_hashes=None, progress=None, cancel=None):
+    progress = progress or IngestProgress()
+    cancel = cancel or threading.Event()
+    progress.started = time.time()
+    progress.phase = "planning"
+    sources = scan_sources(source_dir)
+    if not sources:
+        raise FileNotFoundError(f"No PDFs found in the '{source_dir}' directory.")
+
+    # An index built before manifests (or chunk provenance) existed, or with a different index
+    # type than configured now, cannot be updated in place, so it is rebuilt once
+    snapshot = engine.snapshot()
+    incremental = (
+        snapshot is not None and snapshot.manifest is not None
+        and snapshot.manifest.get("version") == MANIFEST_VERSION
+        and snapshot.manifest.get("index", {}).get("type", "flat") == engine.config.index_type
+    )
+    old_files = snapshot.manifest["files"] if incremental else {}
+
+    summary = dict(
+        files_unchanged=0, files_added=0, files_changed=0, files_deleted=0,
+        chunks_added=0, chunks_removed=0, chunks_kept=0
+    )
+    files = {}
+    pending = []
+    known_hashes = known_hashes or {}    # relpath -> (size, mtime, sha256) of files hashed on upload
+
+    # Plan: decide from sizes, mtimes and content hashes which files need to go through the pipeline
+    for relpath, path in sorted(sources.items()):
+        if cancel.is_set():
+            raise IngestCancelled()
+        stat = os.stat(path)
+        old = old_files.get(relpath)
+
+        # Size and mtime unchanged means the content is unchanged, so the file is not even read
+        if old and old["size"] == stat.st_size and old["mtime"] == stat.st_mtime:
+            files[relpath] = old
+            summary["files_unchanged"] += 1
+            continue
+
+        known = known_hashes.get(relpath)
+        if known and known[:2] == (stat.st_size, stat.st_mtime):
+            sha = known[2]
+        else:
+            sha = file_sha256(path)
+        if old and old["sha256"] == sha:
+            files[relpath] = dict(old, size=stat.st_size, mtime=stat.st_mtime)
+            summary["files_unchanged"] += 1
+            continue
+
+        pending.append((relpath, path, {"sha256": sha, "size": stat.st_size, "mtime": stat.st_mtime}, old))
+        summary["files_changed" if old else "files_added"] += 1
+
+    summary["files_deleted"] = len(old_files.keys() - sources.keys())
+    if incremental and not pending and not summary["files_deleted"]:
+        progress.phase = "done"
+        progress.finished = time.time()
+        summary["generation"] = snapshot.generation
+        return summary
+
+    progress.files_total = len(pending)
+    progress.bytes_total = sum(meta["size"] for _, _, meta, _ in pending)
+    progress.phase = "processing"
+
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size, chunk_overlap=chunk_overlap, add_start_index=True
+    )
+    cache = getattr(engine.embeddings, "cache", None)
+    cache_before = cache.stats() if cache is not None else None
+    # Chunks that nearly repeat one already indexed, or one seen earlier in this ingest, are not
+    # embedded; their manifest entry points at that chunk instead (duplicate_of)
+    deduplicator = None
+    dedup = {"chunks_collapsed": 0, "text_bytes_saved": 0, "seconds": 0.0}
+    if dedup_threshold:
+        minhash_index = None
+        if incremental:
+            minhash_index = MinHashIndex.load(snapshot.path) or MinHashIndex.from_store(snapshot.store)
+        lookup = snapshot.store.index_to_docstore_id if incremental else {}
+        deduplicator = Deduplicator(minhash_index, lookup, dedup_threshold)
+
+    pipeline = _Pipeline(queue_size, cancel)
+    parsed_queue, chunk_queue, vector_queue = pipeline.queue(), pipeline.queue(), pipeline.queue()
+    stats = {
+        "parse": StageStats("pages"),
+        "split": StageStats("chunks"),
+        "embed": StageStats("chunks"),
+        "add": StageStats("chunks"),
+    }
+
+    # Stage 1: parse PDFs in the shared worker processes, keeping only a bounded number in flight
+    def parse_stage():
+        stage = stats["parse"]
+        stage.start()
+
+        def deliver(in_flight):
+            item, future = in_flight.popleft()
+            pages, seconds = future.result()
+            metrics.observe("ingest_parse", seconds)
+            metrics.PAGES_INGESTED.inc(len(pages))
+            stage.items += len(pages)
+            progress.pages_done += len(pages)
+            pipeline.put(parsed_queue, (item, pages), stage)
+
+        # Few, small files are parsed here: handing them to worker processes costs more than it saves
+        serial = parse_pool is None or (len(pending) <= SERIAL_FILES and progress.bytes_total <= SERIAL_BYTES)
+        limit = 1 if serial else parse_pool.workers + queue_size
+        in_flight = deque()
+        for item in pending:
+            if pipeline.stopped():
+                break
+            in_flight.append((item, parse_here(item[1]) if serial else parse_pool.submit(parse_pdf, item[1])))
+            if len(in_flight) >= limit:
+                deliver(in_flight)
+        while in_flight and not pipeline.stopped():
+            deliver(in_flight)
+        for _, future in in_flight:
+            future.cancel()
+        stage.finish()
+        pipeline.put(parsed_queue, _DONE, stage)
+
+    # Stage 2: split pages into chunks, diff them against the manifest, drop near-duplicates
+    # and batch the remaining new chunks for embedding
+    def split_stage():
+        stage = stats["split"]
+        stage.start()
+        batch = []
+        while True:
+            item = pipeline.get(parsed_queue, stage)
+            if item is _DONE:
+                break
+            (relpath, path, meta, old), pages = item
+            progress.current_file = relpath
+            with metrics.stage("ingest_split"):
+                entries, texts = chunk_pages(pages, relpath, text_splitter)
+            stage.items += len(entries)
+            files[relpath] = dict(meta, chunks=entries)
+            new_chunks = 0
+
+            # Only chunks whose content actually changed are embedded again
+            old_entries = {entry["id"]: entry for entry in old["chunks"]} if old else {}
+            for entry, text in zip(entries, texts):
+                if entry["id"] in old_entries:
+                    if "duplicate_of" in old_entries[entry["id"]]:
+                        entry["duplicate_of"] = old_entries[entry["id"]]["duplicate_of"]
+                    summary["chunks_kept"] += 1
+                    continue
+                if deduplicator is not None:
+                    started = time.perf_counter()
+                    original = deduplicator.check(entry["id"], text)
+                    dedup["seconds"] += time.perf_counter() - started
+                    if original is not None:
+                        entry["duplicate_of"] = original
+                        dedup["chunks_collapsed"] += 1
+                        dedup["text_bytes_saved"] += len(text.encode("utf-8"))
+                        continue
+                batch.append((entry["id"], text))
+                new_chunks += 1
+                if len(batch) >= embed_batch_size:
+                    pipeline.put(chunk_queue, batch, stage)
+                    batch = []
+            progress.chunks_split += new_chunks
+            progress.bytes_done += meta["size"]
+            progress.files_done += 1
+        if batch:
+            pipeline.put(chunk_queue, batch, stage)
+        progress.current_file = None
+        stage.finish()
+        pipeline.put(chunk_queue, _DONE, stage)
+
+    # Stage 3: embed chunk batches
+    def embed_stage():
+        stage = stats["embed"]
+        stage.start()
+        while True:
+            batch = pipeline.get(chunk_queue, stage)
+            if batch is _DONE:
+                break
+            with metrics.stage("ingest_embed"):
+                vectors = engine.embeddings.embed_documents([text for _, text in batch])
+            stage.items += len(batch)
+            pipeline.put(vector_queue, (batch, vectors), stage)
+        stage.finish()
+        pipeline.put(vector_queue, _DONE, stage)
+
+    threads = [pipeline.spawn(parse_stage), pipeline.spawn(split_stage), pipeline.spawn(embed_stage)]
+
+    # Stage 4: add vectors to a private copy of the index, so queries keep using the live one until publish
+    stage = stats["add"]
+    stage.start()
+    try:
+        # A fresh index is trained on the first FAISS_TRAIN_SIZE vectors before anything else is added
+        store = engine.load_copy(snapshot) if incremental else None
+        trainer = IndexTrainer(engine.embeddings, engine.config)
+        next_id = next_int_id(store) if store is not None else 0
+        while True:
+            item = pipeline.get(vector_queue, stage)
+            if item is _DONE:
+                break
+            batch, vectors = item
+            ids = [added_id for added_id, _ in batch]
+            texts = [text for _, text in batch]
+            with metrics.stage("ingest_add"):
+                if store is None:
+                    store = trainer.feed(ids, texts, vectors)
+                    next_id = next_int_id(store) if store is not None else 0
+                else:
+                    next_id = add_to_store(store, ids, texts, vectors, next_id)
+            metrics.CHUNKS_INGESTED.inc(len(batch))
+            stage.items += len(batch)
+            progress.chunks_done += len(batch)
+        if store is None and not pipeline.stopped():
+            # Training is the costliest step of a fresh index; a cancelled or failed ingest skips it
+            store = trainer.finish()
+    except BaseException:
+        pipeline.stop.set()
+        raise
+    stage.finish()
+
+    for thread in threads:
+        thread.join()
+    if pipeline.error is not None:
+        raise pipeline.error
+    if cancel.is_set():
+        raise IngestCancelled()
+
+    if store is None:
+        raise ValueError("The PDFs in the source folder did not contain any text.")
+
+    # Chunks no file refers to any more, directly or as the original of a duplicate, leave the index
+    referenced = {entry.get("duplicate_of", entry["id"]) for meta in files.values() for entry in meta["chunks"]}
+    remove_ids = [chunk for chunk in store.index_to_docstore_id.values() if chunk not in referenced]
+    if remove_ids:
+        with metrics.stage("ingest_remove"):
+            metrics.CHUNKS_REMOVED.inc(remove_from_store(store, remove_ids, engine.config))
+
+    summary["chunks_added"] = stats["add"].items
+    summary["chunks_removed"] = len(remove_ids)
+    summary["stages"] = {name: stage.report() for name, stage in stats.items()}
+    if deduplicator is not None:
+        # Savings are estimated from this ingest's own embedding rate and the index's bytes per vector
+        embed = stats["embed"].report()
+        per_chunk = embed["busy_seconds"] / embed["chunks"] if embed["chunks"] else 0.0
+        vector_bytes = store.index.sa_code_size() if hasattr(store.index, "sa_code_size") else 4 * store.index.d
+        summary["dedup"] = {
+            "chunks_collapsed": dedup["chunks_collapsed"],
+            "text_bytes_saved": dedup["text_bytes_saved"],
+            "vector_bytes_saved": dedup["chunks_collapsed"] * vector_bytes,
+            "embed_seconds_saved": round(dedup["chunks_collapsed"] * per_chunk, 3),
+            "dedup_seconds": round(dedup["seconds"], 3),
+        }
+    if cache is not None:
+        cache_after = cache.stats()
+        summary["embedding_cache"] = {
+            "hits": cache_after["hits"] - cache_before["hits"],
+            "misses": cache_after["misses"] - cache_before["misses"],
+            "entries": cache_after["entries"],
+        }
+
+    # The previous version's BM25 postings are updated with the added and removed chunks; a rebuild,
+    # or a version saved before BM25 existed, tokenizes the whole docstore once
+    progress.phase = "indexing"
+    started = time.perf_counter()
+    with metrics.stage("ingest_bm25"):
+        bm25 = BM25Index.update(snapshot.bm25 if incremental else None, store)
+    summary["bm25_seconds"] = round(time.perf_counter() - started, 3)
+
+    progress.phase = "publishing"
+    previous_factory = snapshot.manifest.get("index", {}).get("factory", "IDMap2,Flat") if incremental else None
+    factory = trainer.factory or previous_factory
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "index": {"type": engine.config.index_type, "factory": factory},
+        "files": files,
+    }
+    summary["index"] = manifest["index"]
+    provenance = ChunkProvenance.from_manifest(manifest, store.index_to_docstore_id)
+    minhash = deduplicator.build(store) if deduplicator is not None else None
+    summary["generation"] = engine.publish(store, manifest, bm25, provenance, minhash).generation
+    progress.phase = "done"
+    progress.finished = time.time()
+    return summary
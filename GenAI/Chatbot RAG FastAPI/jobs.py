@@ -0,0 +1,104 @@
+# Background ingestion jobs
+#
+# POST /ingest/ only queues a job and returns its ID. Jobs run one at a time on
+# a worker thread (PDF parsing inside them fans out to a process pool), so the
+# event loop and every /query/ call keep running while an ingest is in progress.
+
+import time                                                                     # For job timestamps
+import uuid                                                                     # For job IDs
+import threading                                                                # For cancellation events and the job table lock
+from collections import OrderedDict                                             # For the bounded job table
+from concurrent.futures import ThreadPoolExecutor                               # For the ingest worker pool
+from ingest import IngestProgress, IngestCancelled                              # For live progress and cancellation
+
+MAX_JOBS_KEPT = 100             # Finished jobs remembered for GET /ingest/{id}
+
+
+class IngestJob:
+    """State of one queued, running or finished ingest."""
+
+    def __init__(self, key=None):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.status = "queued"
+        self.progress = IngestProgress()
+        self.cancel_event = threading.Event()
+        self.created = time.time()
+        self.finished = None
+        self.result = None
+        self.error = None
+
+    def report(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "progress": self.progress.report(),
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobManager:
+    """Runs ingest jobs on a small worker pool and keeps their status for polling."""
+
+    def __init__(self, max_workers=1):
+        # One worker by default: two ingests of the same index would race on its manifest
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Queue work(progress=..., cancel=...) and return the job tracking it; while a job with the same
+    # key is still queued, it is returned instead, since it will see everything the new one would
+    def submit(self, work, key=None):
+        with self._lock:
+            if key is not None:
+                for queued in self._jobs.values():
+                    if queued.key == key and queued.status == "queued" and not queued.cancel_event.is_set():
+                        return queued
+            job = IngestJob(key)
+            self._jobs[job.id] = job
+            self._forget_finished()
+        self._pool.submit(self._run, job, work)
+        return job
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    # Ask a job to stop; a queued job never starts and a running one stops at the next stage boundary
+    def cancel(self, job_id):
+        job = self._jobs.get(job_id)
+        if job is not None and job.status in ("queued", "running"):
+            job.cancel_event.set()
+            if job.status == "queued":
+                job.status = "cancelled"
+                job.finished = time.time()
+        return job
+
+    def shutdown(self):
+        for job in list(self._jobs.values()):
+            job.cancel_event.set()
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+    def _run(self, job, work):
+        if job.cancel_event.is_set():
+            return
+        job.status = "running"
+        try:
+            job.result = work(progress=job.progress, cancel=job.cancel_event)
+            job.status = "completed"
+        except IngestCancelled:
+            job.status = "cancelled"
+            job.progress.phase = "cancelled"
+        except Exception as e:
+            job.status = "failed"
+            job.progress.phase = "failed"
+            job.error = str(e)
+        finally:
+            job.finished = time.time()
+            job.progress.finished = job.progress.finished or job.finished
+
+    # Drop the oldest finished jobs beyond MAX_JOBS_KEPT
+    def _forget_finished(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished is not None]
+        for job_id in finished[:max(len(self._jobs) - MAX_JOBS_KEPT, 0)]:
+            del self._jobs[job_id]
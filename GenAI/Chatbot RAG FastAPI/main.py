@@ -1,14 +1,30 @@
-from fastapi import FastAPI, HTTPException                                      # To create API endpoints and error handling
+from fastapi import FastAPI, HTTPException, Request, Response                   # To create API endpoints and error handling
 from pydantic import BaseModel                                                  # To define request/response schemas for validation
 import os                                                                       # For handling file paths and system-related operations
+import errno                                                                    # For telling a full disk from other storage errors
+import time                                                                     # For per-request timings
+from contextlib import asynccontextmanager                                      # For the startup and shutdown lifespan
+from typing import List, Optional                                               # For list and optional fields in request schemas
+from functools import partial                                                   # For binding ingest arguments to a background job
+from starlette.concurrency import run_in_threadpool                             # For parsing and storing uploads off the event loop
+from starlette.requests import ClientDisconnect                                 # For uploads cut off by the client
 import torch                                                                    # For model inference
 from transformers import AutoTokenizer, AutoModelForCausalLM                    # For Qwen model integration  
-from langchain_community.document_loaders import PyPDFLoader                    # Document loader integration
-from langchain.text_splitter import RecursiveCharacterTextSplitter              # For splitting long texts into manageable chunks
-from langchain_community.vectorstores import FAISS                              # For efficient vector-based storage and retrieval
 from dotenv import load_dotenv							                        # For loading environment variables from a .env file
-from langchain.docstore.document import Document                                # For Document processing
 from langchain_community.embeddings.spacy_embeddings import SpacyEmbeddings   	# For embedding generation using the SpaCy NLP model
+from embedding_cache import CachedEmbeddings                                    # For reusing embeddings of previously seen chunks
+from engine import RetrievalEngine, SEARCH_MODES, MMR_FETCH_K, MMR_LAMBDA, embed_queries  # For the resident, hot-swappable FAISS and BM25 indexes
+from faiss_index import IndexConfig                                             # For the FAISS_* index type configuration
+from ingest import ingest_directory, ParsePool                                  # For incremental, content-hashed ingestion
+from catalog import CollectionCatalog, COLLECTIONS_DIR                          # For named collections with an LRU of open indexes
+from uploads import MultipartSpooler, UploadRegistry, safe_filename            # For streaming, hashed PDF uploads
+from jobs import JobManager                                                     # For running ingestion as background jobs
+from query_cache import QueryCache                                              # For caching repeated queries per index generation
+from semantic_cache import SemanticAnswerCache                                  # For reusing answers to paraphrased questions
+import metrics                                                                  # For Prometheus metrics and per-request stage traces
+from executor import Executor, WorkloadPool, Overloaded                         # For running blocking work off the event loop with admission control
+from models import ModelRegistry, LazyEmbeddings, preload_list                  # For lazy model loading, preload and warm-up
+from answer import AnswerGenerator, MAX_NEW_TOKENS                              # For grounded answers with a cached system prompt
 
 
 # To handle potential shared library errors
@@ -19,88 +35,582 @@ load_dotenv() # Load environment variables
 # Log into Hugging Face
 HF_TOKEN = os.getenv("HF_TOKEN")
 
+# Load and warm up the PRELOAD_MODELS without holding up server startup; on shutdown stop
+# running ingest jobs and the parse workers (the executor's pools stop after this)
+@asynccontextmanager
+async def lifespan(app):
+    models.preload_in_background(preload_list())
+    yield
+    jobs.shutdown()
+    parse_pool.shutdown()
+
 # Initialize FastAPI
-app = FastAPI(title="RAG Based Chat with PDF Document and Query API", version="1.0")
+app = FastAPI(title="RAG Based Chat with PDF Document and Query API", version="1.0", lifespan=lifespan)
 
-# Load Model
+# Models are loaded on first use; the ones in PRELOAD_MODELS (default "embeddings")
+# are loaded and warmed up in the background at startup, before /ready turns green
+models = ModelRegistry()
 device = torch.device("cpu")
 checkpoint = "Qwen/Qwen2.5-0.5B-Instruct"
-tokenizer = AutoTokenizer.from_pretrained(checkpoint)
-base_model = AutoModelForCausalLM.from_pretrained(
-    checkpoint,
-    device_map=device,
-    torch_dtype=torch.float32
+
+# Load the Qwen tokenizer and model and prefill the answer system prompt
+def load_llm():
+    tokenizer = AutoTokenizer.from_pretrained(checkpoint)
+    base_model = AutoModelForCausalLM.from_pretrained(
+        checkpoint,
+        device_map=device,
+        torch_dtype=torch.float32
+    )
+    base_model.eval()
+    return AnswerGenerator(tokenizer, base_model)
+
+# Generate a couple of tokens so the weights are paged in before the first real request
+def warm_up_llm(generator):
+    generator.warm_up()
+
+# Load the spaCy embedding model; chunk embeddings are cached on disk so re-ingesting known text costs nothing
+def load_embeddings():
+    return CachedEmbeddings(SpacyEmbeddings(model_name="en_core_web_lg"), "embedding_cache")
+
+# Embed a dummy query with the model just loaded and search the live index once, so the first
+# real query is not the slow one
+def warm_up_embeddings(model):
+    vectors = embed_queries(model, ["warm up"])
+    snapshot = engine.snapshot()
+    if snapshot is not None and snapshot.store.index.ntotal:
+        snapshot.search(vectors, 1)
+
+models.register("embeddings", load_embeddings, warm_up_embeddings)
+models.register("llm", load_llm, warm_up_llm)
+
+# Open the current FAISS index once for the whole process; it is memory-mapped, so this is cheap
+embeddings = LazyEmbeddings(models, "embeddings")
+engine = RetrievalEngine("faiss_db", embeddings, IndexConfig.from_env())
+engine.load()
+metrics.track_engine(engine)
+
+# Named collections live under COLLECTIONS_DIR and share the embedding model; only the most
+# recently used ones stay open, within COLLECTIONS_MAX_OPEN and COLLECTIONS_MAX_MEMORY_MB
+catalog = CollectionCatalog(COLLECTIONS_DIR, embeddings, IndexConfig.from_env())
+metrics.track_catalog(catalog)
+
+# Ingestion runs as background jobs so it never blocks the event loop or /query/
+jobs = JobManager()
+
+# PDFs are parsed in worker processes started on the first large ingest and kept for the next ones
+parse_pool = ParsePool()
+
+# Uploaded PDFs are hashed while they stream in; duplicates are dropped before they reach a PDF folder
+uploads = UploadRegistry()
+
+# Repeated questions are answered from cache until the next ingest publishes a new generation
+query_cache = QueryCache(
+    max_entries=int(os.getenv("QUERY_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("QUERY_CACHE_TTL", "300"))
 )
 
+# Paraphrases of answered questions that retrieve the same chunks reuse the stored answer,
+# within SEMANTIC_CACHE_SIZE answers and above SEMANTIC_CACHE_THRESHOLD similarity
+answer_cache = SemanticAnswerCache()
+
+MAX_BATCH_QUERIES = 256         # Largest number of questions accepted by /query/batch
+
+MAX_MMR_FETCH_K = 200           # Largest fetch_k accepted for mmr mode; MMR builds a fetch_k x fetch_k matrix per query
+
+MAX_ANSWER_TOKENS = 1024        # Largest max_new_tokens accepted by /answer/
+
+# Retrieval (spaCy, FAISS, BM25) and generation (Qwen) run on bounded thread pools; beyond
+# their queue limits requests get 429. Generation takes one request at a time, and torch and
+# FAISS threads are set once from the cores split between all of the workers.
+executor = Executor(
+    WorkloadPool.from_env("query", workers=min(4, os.cpu_count() or 1), max_queue=64),
+    WorkloadPool.from_env("generate", workers=1, max_queue=8),
+)
+executor.install(app)
+metrics.track_executor(executor)
+
 # API Models
+# mode: dense (vectors only), bm25 (keywords only), hybrid (both, fused by reciprocal rank) or
+# mmr (fetch_k dense candidates, k of them picked by maximal marginal relevance, where
+# lambda_mult = 1 ranks by relevance alone and 0 by novelty alone);
+# prefilter > 0 restricts the dense search to that many best BM25 candidates;
+# sources (paths relative to PDFFILES) and page_from/page_to (1-based, inclusive) restrict
+# the search to matching chunks inside FAISS and BM25 rather than filtering results afterwards
 class QueryRequest(BaseModel):
     query: str
+    k: int = 4
+    mode: str = "hybrid"
+    prefilter: int = 0
+    fetch_k: int = MMR_FETCH_K
+    lambda_mult: float = MMR_LAMBDA
+    sources: Optional[List[str]] = None
+    page_from: Optional[int] = None
+    page_to: Optional[int] = None
 
-# Ingest PDFs and Create Vector Database
-@app.post("/ingest/")
-async def ingest_pdfs():
-    """Ingest PDF files and create embeddings for querying."""
+class BatchQueryRequest(BaseModel):
+    queries: List[str]
+    k: int = 4
+    mode: str = "hybrid"
+    prefilter: int = 0
+    fetch_k: int = MMR_FETCH_K
+    lambda_mult: float = MMR_LAMBDA
+    sources: Optional[List[str]] = None
+    page_from: Optional[int] = None
+    page_to: Optional[int] = None
+
+class AnswerRequest(BaseModel):
+    query: str
+    k: int = 4
+    mode: str = "hybrid"
+    fetch_k: int = MMR_FETCH_K
+    lambda_mult: float = MMR_LAMBDA
+    max_new_tokens: int = MAX_NEW_TOKENS
+    sources: Optional[List[str]] = None
+    page_from: Optional[int] = None
+    page_to: Optional[int] = None
+
+# Take the resident index once so a concurrent ingest cannot change it mid-request;
+# refresh() also picks up versions published by other worker processes
+def current_snapshot(index=engine, ingest_path="/ingest/"):
+    snapshot = index.refresh()
+    if snapshot is None:
+        raise HTTPException(status_code=400, detail=f"No index found. Run {ingest_path} first.")
+    return snapshot
+
+# Validate a collection name and check that the collection exists
+def check_collection(name):
     try:
-        documents = []
-        for root, dirs, files in os.walk("PDFFILES"):
-            for file in files:
-                if file.endswith(".pdf"):
-                    print(f"Loading {file}")
-                    loader = PyPDFLoader(os.path.join(root, file))
-                    documents.extend(loader.load())
-        
-        if not documents:
-            raise HTTPException(status_code=400, detail="No PDFs found in the 'PDFFILES' directory.")
-
-        print("Splitting into chunks")
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=100)
-        text_chunks = text_splitter.split_documents(documents)
-
-        print("Creating embeddings")
-        # Initialize the embedding model 
-        embeddings = SpacyEmbeddings(model_name="en_core_web_lg")
-        
-        # Create documents using LangChain's Document class
-        documents = [Document(page_content=chunk.page_content, metadata={}) for chunk in text_chunks]
-    
-        # Convert documents into embeddings and store them in FAISS
-        vector_store = FAISS.from_documents(documents, embedding=embeddings)
-    
-        # Save the FAISS index locally for later retrieval
-        vector_store.save_local("faiss_db")
-
-        faiss_db = None  # Clear memory
-
-        return {"message": "Ingestion is complete. You can now query the PDFs."}
+        exists = catalog.exists(name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not exists:
+        raise HTTPException(
+            status_code=404, detail=f"Unknown collection. Put its PDFs in {catalog.source_dir(name)} first."
+        )
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+# Reject unknown search modes and negative prefilter sizes
+def validate_search(mode, prefilter):
+    if mode not in SEARCH_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {', '.join(SEARCH_MODES)}.")
+    if prefilter < 0:
+        raise HTTPException(status_code=400, detail="prefilter must not be negative.")
+
+# MMR parameters of a request in mmr mode, validated; other modes ignore them, so they stay out of cache keys
+def mmr_options(request):
+    if request.mode != "mmr":
+        return {}
+    if not request.k <= request.fetch_k <= MAX_MMR_FETCH_K:
+        raise HTTPException(status_code=400, detail=f"fetch_k must be between k and {MAX_MMR_FETCH_K}.")
+    if not 0 <= request.lambda_mult <= 1:
+        raise HTTPException(status_code=400, detail="lambda_mult must be between 0 and 1.")
+    return {"fetch_k": request.fetch_k, "lambda_mult": request.lambda_mult}
+
+# Source and page filters of a request, in a hashable form usable in query cache keys
+def search_filters(request):
+    sources = tuple(sorted(set(request.sources))) if request.sources is not None else None
+    return {"sources": sources, "page_from": request.page_from, "page_to": request.page_to}
+
+# Where a match was found: its own source and page, plus the places of the near-duplicates ingest collapsed into it
+def match_source(match):
+    return {
+        "source": match.source,
+        "page": match.page,
+        "also_in": [{"source": source, "page": page} for source, page in match.duplicates]
+    }
+
+# Retrieve the top-k matches for each query, embedding and searching only the cache misses in one batch;
+# mmr holds fetch_k and lambda_mult for mmr mode, index and collection select a named collection
+# instead of the default index, and vectors, if given, are the queries already embedded
+def retrieve(snapshot, queries, k, mode="hybrid", prefilter=0, filters=None, mmr=None, index=engine, collection=None,
+             vectors=None):
+    filters = filters or {}
+    mmr = mmr or {}
+    try:
+        int_ids = snapshot.select(**filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    keys = [
+        query_cache.key(query, k, mode=mode, prefilter=prefilter, collection=collection, **filters, **mmr)
+        for query in queries
+    ]
+    results, missing = [], []
+    with metrics.stage("query_cache"):
+        for i, key in enumerate(keys):
+            cached = query_cache.get(key, snapshot.generation)
+            results.append(snapshot.resolve(cached) if cached is not None else None)
+            if cached is None:
+                missing.append(i)
+    metrics.QUERIES.labels(mode, "hit").inc(len(queries) - len(missing))
+    metrics.QUERIES.labels(mode, "miss").inc(len(missing))
+    if missing:
+        missed = [queries[i] for i in missing]
+        missed_vectors = None
+        if vectors is not None:
+            missed_vectors = vectors[missing]
+        elif mode != "bm25":
+            with metrics.stage("embed"):
+                missed_vectors = index.embed_queries(missed)
+        searched = snapshot.retrieve(missed, missed_vectors, k, mode=mode, prefilter=prefilter, int_ids=int_ids, **mmr)
+        for i, matches in zip(missing, searched):
+            query_cache.put(keys[i], snapshot.generation, tuple((m.id, m.score) for m in matches))
+            results[i] = matches
+    return results, len(queries) - len(missing)
+
+# Embed a question once for both the semantic answer cache and the search, then retrieve its matches;
+# returns the question vector and the matches
+def retrieve_for_answer(snapshot, request):
+    with metrics.stage("embed"):
+        vectors = engine.embed_queries([request.query])
+    results, _ = retrieve(
+        snapshot, [request.query], k=request.k, mode=request.mode, filters=search_filters(request),
+        mmr=mmr_options(request), vectors=vectors
+    )
+    return vectors[0], results[0]
+
+# A stored answer to a paraphrase of the question that retrieved the same chunks, or None
+def cached_answer(snapshot, question, vector, matches, max_new_tokens):
+    with metrics.stage("answer_cache"):
+        hit = answer_cache.lookup(vector, tuple(m.id for m in matches), snapshot.generation, max_new_tokens)
+    if hit is None:
+        metrics.ANSWER_CACHE.labels("miss").inc()
+        return None
+    entry, similarity = hit
+    metrics.ANSWER_CACHE.labels("hit").inc()
+    metrics.ANSWER_CACHE_SAVED.inc(entry.seconds)
+    answer, used, usage = entry.value
+    cache = {
+        "hit": True, "similar_to": entry.question, "similarity": round(similarity, 4),
+        "saved_ms": round(entry.seconds * 1000, 1)
+    }
+    return answer, used, usage, cache
+
+# Answer a question from retrieved matches with Qwen; runs on the generation pool, where the model is loaded on first use
+def generate_answer(question, matches, max_new_tokens):
+    with metrics.stage("generate"):
+        answer, used, usage = models.get("llm").answer(question, matches, max_new_tokens=max_new_tokens)
+    if usage["ttft_ms"] is not None:
+        metrics.observe("generate_ttft", usage["ttft_ms"] / 1000)
+    return answer, used, usage
+
+# Ingest job body for the default index; files uploaded since the last ingest are not hashed again
+def ingest_default_directory(progress=None, cancel=None):
+    return ingest_directory(
+        engine, "PDFFILES", chunk_size=500, chunk_overlap=100, parse_pool=parse_pool,
+        known_hashes=uploads.hashes("PDFFILES"), progress=progress, cancel=cancel
+    )
+
+# Ingest job body for a named collection; its index is opened on the ingest worker, not the event loop
+def ingest_collection_directory(name, progress=None, cancel=None):
+    source_dir = catalog.source_dir(name)
+    return ingest_directory(
+        catalog.get(name), source_dir, chunk_size=500, chunk_overlap=100, parse_pool=parse_pool,
+        known_hashes=uploads.hashes(source_dir), progress=progress, cancel=cancel
+    )
+
+# Stream the PDFs of a multipart request into source_dir, skipping duplicates, and queue one ingest for the rest
+async def receive_uploads(request, snapshot, source_dir, work):
+    try:
+        spooler = MultipartSpooler(request.headers.get("content-type", ""))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    manifest = snapshot.manifest if snapshot is not None else None
+
+    # Reserve a name for a finished part and move it into source_dir; runs on a worker thread
+    def accept(part):
+        if part.error is not None:
+            return {"filename": part.filename, "status": "rejected", "reason": part.error}
+        duplicate, relpath = uploads.reserve(source_dir, part.sha256, safe_filename(part.filename), manifest)
+        if duplicate is not None:
+            part.close()
+            return {"filename": part.filename, "status": "duplicate", "duplicate_of": duplicate}
+        try:
+            uploads.store(part, source_dir, relpath)
+        except Exception:
+            uploads.release(source_dir, part.sha256)
+            raise
+        return {
+            "filename": part.filename, "status": "accepted", "stored_as": relpath,
+            "sha256": part.sha256, "bytes": part.size
+        }
+
+    # Parsing, hashing and spooling a body chunk, and storing the parts it finished, touch the disk,
+    # so they run on a worker thread rather than the event loop
+    def feed(chunk):
+        return [accept(part) for part in spooler.feed(chunk)]
+
+    def close():
+        return [accept(part) for part in spooler.close()]
+
+    files = []
+    with metrics.stage("upload"):
+        try:
+            async for chunk in request.stream():
+                files.extend(await run_in_threadpool(feed, chunk))
+            files.extend(await run_in_threadpool(close))
+        except ClientDisconnect:
+            raise HTTPException(status_code=400, detail="Upload failed: the client disconnected.")
+        except ValueError as e:
+            # Malformed multipart body (python_multipart parse errors are ValueErrors)
+            raise HTTPException(status_code=400, detail=f"Upload failed: {e}")
+        except OSError as e:
+            raise HTTPException(status_code=507 if e.errno == errno.ENOSPC else 500,
+                                detail=f"Could not store the upload: {e.strerror or e}")
+
+    result = {"files": files}
+    if any(file["status"] == "accepted" for file in files):
+        job = jobs.submit(work, key=source_dir)
+        result.update(job_id=job.id, status_url=f"/ingest/{job.id}")
+    return result
+
+# Time every request and return its stage breakdown in a Server-Timing header
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    trace, token = metrics.start_trace(f"{request.method} {request.url.path}")
+    try:
+        response = await call_next(request)
+    finally:
+        route = request.scope.get("route")
+        metrics.finish_trace(trace, token, route.path if route is not None else "unmatched")
+    response.headers["Server-Timing"] = trace.server_timing()
+    return response
+
+# Ingest PDFs and Create Vector Database in the background
+@app.post("/ingest/", status_code=202)
+async def ingest_pdfs():
+    """Start ingesting new, changed and deleted PDF files; poll the returned job for progress."""
+    job = jobs.submit(ingest_default_directory, key="PDFFILES")
+    return {"message": "Ingestion started.", "job_id": job.id, "status_url": f"/ingest/{job.id}"}
+
+# Upload PDFs into the default PDF folder and ingest them
+@app.post("/upload/", status_code=202)
+async def upload_pdfs(request: Request):
+    """Stream multipart PDFs to disk, hashing them on the way; duplicates are skipped, the rest are ingested."""
+    return await receive_uploads(request, engine.snapshot(), "PDFFILES", ingest_default_directory)
+
+# Report the progress of an ingest job
+@app.get("/ingest/{job_id}")
+async def ingest_status(job_id: str):
+    """Files, pages and chunks done, ETA and, once finished, per-stage throughput."""
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown ingest job.")
+    return job.report()
+
+# Cancel a queued or running ingest job
+@app.post("/ingest/{job_id}/cancel")
+async def cancel_ingest(job_id: str):
+    """Stop an ingest job; the live index is left untouched."""
+    job = jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown ingest job.")
+    return job.report()
 
 # Query the Database
 @app.post("/query/")
 async def query_documents(request: QueryRequest):
     """Query the ingested documents."""
+    if request.k < 1:
+        raise HTTPException(status_code=400, detail="k must be at least 1.")
+    validate_search(request.mode, request.prefilter)
+    snapshot = current_snapshot()
+
     try:
-    
-        embeddings = SpacyEmbeddings(model_name="en_core_web_lg")
+        results, _ = await executor["query"].run(
+            retrieve, snapshot, [request.query], k=request.k, mode=request.mode, prefilter=request.prefilter,
+            filters=search_filters(request), mmr=mmr_options(request)
+        )
+        matches = results[0]
 
-        # Load FAISS vector store created earlier
-        new_db = FAISS.load_local("faiss_db", embeddings, allow_dangerous_deserialization=True)
-        retriever = new_db.as_retriever()
+        if not matches:
+            return {"query": request.query, "response": "No relevant documents found."}
 
-        docs = retriever.get_relevant_documents(request.query)
+        return {
+            "query": request.query,
+            "response": [match.text for match in matches],
+            "sources": [match_source(match) for match in matches]
+        }
 
-        if not docs:
-            return {"query": request.query, "response": "No relevant documents found."}
+    except (HTTPException, Overloaded):
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Answer a question from the documents
+@app.post("/answer/")
+async def answer_question(request: AnswerRequest):
+    """Retrieve the top-k chunks, pack them into a token-budgeted prompt and generate a grounded answer."""
+    if request.k < 1:
+        raise HTTPException(status_code=400, detail="k must be at least 1.")
+    if not 1 <= request.max_new_tokens <= MAX_ANSWER_TOKENS:
+        raise HTTPException(status_code=400, detail=f"max_new_tokens must be between 1 and {MAX_ANSWER_TOKENS}.")
+    validate_search(request.mode, 0)
+    snapshot = current_snapshot()
+
+    try:
+        vector, matches = await executor["query"].run(retrieve_for_answer, snapshot, request)
+        cached = cached_answer(snapshot, request.query, vector, matches, request.max_new_tokens)
+        if cached is not None:
+            answer, used, usage, cache = cached
+        else:
+            started = time.perf_counter()
+            answer, used, usage = await executor["generate"].run(
+                generate_answer, request.query, matches, request.max_new_tokens
+            )
+            answer_cache.store(
+                request.query, vector, tuple(m.id for m in matches), snapshot.generation, (answer, used, usage),
+                time.perf_counter() - started, request.max_new_tokens
+            )
+            cache = {"hit": False}
+
+        return {
+            "query": request.query,
+            "answer": answer,
+            "sources": [
+                {"ref": n, "id": m.id, **match_source(m)} for n, m in enumerate(used, 1)
+            ],
+            "usage": usage,
+            "cache": cache
+        }
+
+    except (HTTPException, Overloaded):
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Query the Database with many questions at once
+@app.post("/query/batch")
+async def query_documents_batch(request: BatchQueryRequest):
+    """Embed all queries in one pass and search them with a single FAISS call (plus BM25 in hybrid mode)."""
+    if not request.queries or len(request.queries) > MAX_BATCH_QUERIES:
+        raise HTTPException(status_code=400, detail=f"Send between 1 and {MAX_BATCH_QUERIES} queries.")
+    if request.k < 1:
+        raise HTTPException(status_code=400, detail="k must be at least 1.")
+    validate_search(request.mode, request.prefilter)
+    snapshot = current_snapshot()
+
+    try:
+        started = time.perf_counter()
+        results, cached = await executor["query"].run(
+            retrieve, snapshot, request.queries, k=request.k, mode=request.mode, prefilter=request.prefilter,
+            filters=search_filters(request), mmr=mmr_options(request)
+        )
+        elapsed = time.perf_counter() - started
 
         return {
+            "generation": snapshot.generation,
+            "results": [
+                {
+                    "query": query,
+                    "matches": [
+                        {"id": m.id, "text": m.text, "score": m.score, **match_source(m)}
+                        for m in matches
+                    ]
+                }
+                for query, matches in zip(request.queries, results)
+            ],
+            "cached": cached,
+            "elapsed_ms": round(elapsed * 1000, 2)
+        }
+
+    except (HTTPException, Overloaded):
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Ingest the PDFs of a named collection in the background
+@app.post("/collections/{name}/ingest", status_code=202)
+async def ingest_collection(name: str):
+    """Start ingesting the collection's PDF folder into its own index; poll the returned job for progress."""
+    check_collection(name)
+    job = jobs.submit(partial(ingest_collection_directory, name), key=catalog.source_dir(name))
+    return {"message": "Ingestion started.", "collection": name, "job_id": job.id, "status_url": f"/ingest/{job.id}"}
+
+# Upload PDFs into a named collection, creating it if needed, and ingest them
+@app.post("/collections/{name}/upload", status_code=202)
+async def upload_collection(name: str, request: Request):
+    """Stream multipart PDFs into the collection's folder; duplicates are skipped, the rest are ingested."""
+    try:
+        source_dir = catalog.source_dir(name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    index = await executor["query"].run(catalog.get, name)
+    result = await receive_uploads(request, index.snapshot(), source_dir, partial(ingest_collection_directory, name))
+    return {"collection": name, **result}
+
+# Query a named collection
+@app.post("/collections/{name}/query")
+async def query_collection(name: str, request: QueryRequest):
+    """Query one collection's documents; its index is opened on first use and kept while recently used."""
+    check_collection(name)
+    if request.k < 1:
+        raise HTTPException(status_code=400, detail="k must be at least 1.")
+    validate_search(request.mode, request.prefilter)
+
+    try:
+        index = await executor["query"].run(catalog.get, name)
+        snapshot = current_snapshot(index, f"/collections/{name}/ingest")
+        results, _ = await executor["query"].run(
+            retrieve, snapshot, [request.query], k=request.k, mode=request.mode, prefilter=request.prefilter,
+            filters=search_filters(request), mmr=mmr_options(request), index=index, collection=name
+        )
+        matches = results[0]
+
+        if not matches:
+            return {"collection": name, "query": request.query, "response": "No relevant documents found."}
+
+        return {
+            "collection": name,
             "query": request.query,
-            "response": [doc.page_content for doc in docs]
+            "response": [match.text for match in matches],
+            "sources": [match_source(match) for match in matches]
         }
 
+    except (HTTPException, Overloaded):
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Collections on disk and the open-index LRU: which are resident, their size and evictions so far
+@app.get("/collections")
+async def list_collections():
+    return {"collections": catalog.names(), **catalog.stats()}
+
+# Query cache counters, for sizing QUERY_CACHE_SIZE and QUERY_CACHE_TTL
+@app.get("/cache/stats")
+async def cache_stats():
+    return query_cache.stats()
+
+# Semantic answer cache counters: hit rate, paraphrases with other chunks and generation time saved
+@app.get("/cache/answers/stats")
+async def answer_cache_stats():
+    return answer_cache.stats()
+
+# Prometheus metrics: per-stage latency histograms, ingest counters, index size and memory gauges
+@app.get("/metrics")
+async def prometheus_metrics():
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+# Load of the workload pools: running, queued and rejected calls
+@app.get("/pools")
+async def pool_stats():
+    return executor.stats()
+
+# Stage breakdown of recent requests, slowest first
+@app.get("/traces")
+async def traces(min_ms: float = 0.0, limit: int = 50):
+    return metrics.recent_traces(min_ms=min_ms, limit=limit)
+
+# Readiness probe: 200 once the preloaded models are loaded and warmed up, 503 until then
+@app.get("/ready")
+async def ready(response: Response):
+    status = models.status()
+    snapshot = engine.snapshot()
+    status["index_generation"] = snapshot.generation if snapshot is not None else None
+    if not status["ready"]:
+        response.status_code = 503
+    return status
+
 # Root Endpoint
 @app.get("/")
 async def root():
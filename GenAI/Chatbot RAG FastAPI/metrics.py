@@ -0,0 +1,155 @@
+# Prometheus metrics and per-request stage tracing for the RAG API
+#
+# Every expensive step (PDF parsing, splitting, spaCy embedding, FAISS and BM25
+# search, FAISS load/save) runs inside stage(name), which feeds one latency
+# histogram per stage. When the step runs on behalf of an HTTP request, it is also
+# appended to that request's Trace, which the API returns as a Server-Timing
+# header and keeps in a small ring buffer for GET /traces. Chunk and page
+# counters, index size and process memory gauges complete the /metrics surface.
+
+import os                                                                       # For index file sizes
+import time                                                                     # For stage timings
+from collections import deque                                                   # For the recent trace buffer
+from contextlib import contextmanager                                           # For the stage() timer
+from contextvars import ContextVar                                              # For the trace of the current request
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest  # For the Prometheus exposition
+
+TRACE_KEEP = int(os.getenv("RAG_TRACE_KEEP", "200"))    # Recent request traces kept for GET /traces
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+STAGE_SECONDS = Histogram("rag_stage_seconds", "Time spent in each processing stage.", ["stage"], buckets=STAGE_BUCKETS)
+REQUEST_SECONDS = Histogram("rag_request_seconds", "End-to-end HTTP request time.", ["path"], buckets=STAGE_BUCKETS)
+PAGES_INGESTED = Counter("rag_pages_ingested", "PDF pages parsed by ingest jobs.")
+CHUNKS_INGESTED = Counter("rag_chunks_ingested", "Chunks embedded and added to the index by ingest jobs.")
+CHUNKS_REMOVED = Counter("rag_chunks_removed", "Chunks removed from the index by ingest jobs.")
+QUERIES = Counter("rag_queries", "Queries answered, by search mode and whether the query cache hit.", ["mode", "cache"])
+ANSWER_CACHE = Counter("rag_answer_cache", "Answer requests, by whether the semantic answer cache hit.", ["result"])
+ANSWER_CACHE_SAVED = Counter("rag_answer_cache_saved_seconds", "Generation time saved by semantic answer cache hits.")
+INDEX_CHUNKS = Gauge("rag_index_chunks", "Vectors in the live index.")
+INDEX_BYTES = Gauge("rag_index_bytes", "On-disk size of the live index version, by file.", ["file"])
+INDEX_GENERATION = Gauge("rag_index_generation", "Generation of the live index version.")
+POOL_CALLS = Gauge("rag_pool_calls", "Calls running or queued in each workload pool.", ["pool", "state"])
+POOL_REJECTED = Gauge("rag_pool_rejected", "Calls turned away by each workload pool since start.", ["pool"])
+COLLECTIONS_OPEN = Gauge("rag_collections_open", "Collection indexes currently open.")
+COLLECTIONS_BYTES = Gauge("rag_collections_bytes", "Estimated resident size of the open collection indexes.")
+COLLECTIONS_EVICTED = Gauge("rag_collections_evicted", "Collection indexes closed by the LRU since start.")
+PROCESS_MEMORY = Gauge("rag_process_memory_bytes", "Resident memory split into private and file-backed (mmap) pages.", ["kind"])
+
+_current_trace = ContextVar("rag_trace", default=None)
+_recent_traces = deque(maxlen=TRACE_KEEP)
+
+
+class Trace:
+    """Stage timings of one HTTP request, in the order the stages ran."""
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.time()
+        self.seconds = None
+        self.stages = []
+
+    # Total milliseconds per stage name; stages that ran more than once are summed
+    def breakdown(self):
+        totals = {}
+        for name, seconds in self.stages:
+            totals[name] = totals.get(name, 0.0) + seconds * 1000
+        return {name: round(ms, 3) for name, ms in totals.items()}
+
+    def server_timing(self):
+        return ", ".join(f"{name};dur={ms}" for name, ms in self.breakdown().items())
+
+    def report(self):
+        return {
+            "request": self.name,
+            "started": self.started,
+            "total_ms": round(self.seconds * 1000, 3) if self.seconds is not None else None,
+            "stages_ms": self.breakdown(),
+        }
+
+
+# Begin tracing the current request; returns the trace and the token finish_trace needs
+def start_trace(name):
+    trace = Trace(name)
+    return trace, _current_trace.set(trace)
+
+
+def finish_trace(trace, token, path):
+    _current_trace.reset(token)
+    trace.seconds = time.time() - trace.started
+    REQUEST_SECONDS.labels(path).observe(trace.seconds)
+    _recent_traces.append(trace)
+
+
+# Recent request traces, slowest first, optionally only those slower than min_ms
+def recent_traces(min_ms=0.0, limit=50):
+    traces = [t for t in _recent_traces if t.seconds is not None and t.seconds * 1000 >= min_ms]
+    traces.sort(key=lambda t: t.seconds, reverse=True)
+    return [t.report() for t in traces[:limit]]
+
+
+# Record a stage timed elsewhere, for example inside a worker process
+def observe(name, seconds):
+    STAGE_SECONDS.labels(name).observe(seconds)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.stages.append((name, seconds))
+
+
+# Time a block of work as one stage
+@contextmanager
+def stage(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started)
+
+
+# Resident memory of this process from /proc, in bytes
+def _memory(kind):
+    with open("/proc/self/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key == kind:
+                return int(value.split()[0]) * 1024
+    return 0
+
+
+# Evaluate the index and memory gauges from the engine's live snapshot at scrape time
+def track_engine(engine):
+    def snapshot_value(read):
+        snapshot = engine.snapshot()
+        return read(snapshot) if snapshot is not None else 0
+
+    def file_size(name):
+        return lambda: snapshot_value(
+            lambda s: os.path.getsize(os.path.join(s.path, name)) if os.path.exists(os.path.join(s.path, name)) else 0
+        )
+
+    INDEX_CHUNKS.set_function(lambda: snapshot_value(lambda s: s.store.index.ntotal))
+    INDEX_GENERATION.set_function(lambda: snapshot_value(lambda s: s.generation))
+    for name in ("index.faiss", "index.pkl", "bm25.npz", "provenance.npz", "minhash.npz", "manifest.json"):
+        INDEX_BYTES.labels(name).set_function(file_size(name))
+    if os.path.exists("/proc/self/status"):
+        for kind, key in (("anon", "RssAnon"), ("file", "RssFile")):
+            PROCESS_MEMORY.labels(kind).set_function(lambda key=key: _memory(key))
+
+
+# Evaluate the workload pool gauges at scrape time
+def track_executor(executor):
+    for name, pool in executor.pools.items():
+        POOL_CALLS.labels(name, "running").set_function(lambda pool=pool: min(pool.active, pool.workers))
+        POOL_CALLS.labels(name, "queued").set_function(lambda pool=pool: max(pool.active - pool.workers, 0))
+        POOL_REJECTED.labels(name).set_function(lambda pool=pool: pool.rejected)
+
+
+# Evaluate the open collection gauges at scrape time
+def track_catalog(catalog):
+    COLLECTIONS_OPEN.set_function(lambda: len(catalog.stats()["open"]))
+    COLLECTIONS_BYTES.set_function(lambda: catalog.stats()["open_bytes"])
+    COLLECTIONS_EVICTED.set_function(lambda: catalog.evictions)
+
+
+# Prometheus text exposition of every metric, plus its content type
+def render():
+    return generate_latest(), CONTENT_TYPE_LATEST
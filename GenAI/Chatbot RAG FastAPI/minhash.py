@@ -0,0 +1,140 @@
+# MinHash/LSH near-duplicate detection for chunks at ingest time
+#
+# Revisions of the same manual, and the chunk overlap of the text splitter, yield
+# many chunks that differ only in a few words. Each chunk gets a MinHash
+# signature over its word 5-shingles. Signatures are split into LSH bands, so
+# candidate near-duplicates come from a handful of sorted-array lookups instead
+# of comparing against every chunk, and a candidate only counts as a duplicate
+# when the signatures estimate a Jaccard similarity at or above the threshold.
+# Signatures of the chunks in the index are stored with each version
+# (minhash.npz), so re-ingests also collapse new chunks into old ones.
+
+import os                                                                       # For file paths
+import re                                                                       # For word shingles
+import zlib                                                                     # For stable 32-bit shingle hashes
+import numpy as np                                                              # For vectorized signatures and band lookups
+
+MINHASH_FILE = "minhash.npz"
+NUM_PERM = 64                   # Hash permutations per signature
+BANDS = 16                      # LSH bands of ROWS permutations each; candidates from Jaccard ~0.5 upward
+ROWS = NUM_PERM // BANDS
+SHINGLE_WORDS = 5
+WORD_PATTERN = re.compile(r"\w+")
+_PRIME = np.uint64(4294967291)  # Largest prime below 2**32, keeps permuted hashes in uint32
+_rng = np.random.default_rng(20240101)
+_A = _rng.integers(1, 1 << 31, NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, 1 << 31, NUM_PERM, dtype=np.uint64)
+_BAND_MIX = np.array([0x9E3779B97F4A7C15 ** (r + 1) % (1 << 64) for r in range(ROWS)], dtype=np.uint64)
+
+
+# MinHash signature of a text over its lower-cased word shingles
+def signature(text):
+    words = WORD_PATTERN.findall(text.lower())
+    width = min(SHINGLE_WORDS, len(words)) or 1
+    shingles = {" ".join(words[i:i + width]) for i in range(max(len(words) - width + 1, 1))}
+    hashes = np.array([zlib.crc32(shingle.encode("utf-8")) for shingle in shingles], dtype=np.uint64)
+    return ((hashes[:, None] * _A + _B) % _PRIME).min(axis=0).astype(np.uint32)
+
+
+# One 64-bit key per LSH band, for a matrix of signatures
+def band_keys(signatures):
+    bands = np.asarray(signatures, dtype=np.uint64).reshape(-1, BANDS, ROWS)
+    with np.errstate(over="ignore"):
+        return (bands * _BAND_MIX).sum(axis=2)
+
+
+# Estimated Jaccard similarity of two signatures
+def similarity(a, b):
+    return float(np.mean(a == b))
+
+
+class MinHashIndex:
+    """Signatures of the chunks in one index version, with sorted band keys for LSH lookups."""
+
+    def __init__(self, int_ids, signatures):
+        self.int_ids = np.asarray(int_ids, dtype=np.int64)
+        self.signatures = np.asarray(signatures, dtype=np.uint32).reshape(-1, NUM_PERM)
+        keys = band_keys(self.signatures)
+        self._order = np.argsort(keys, axis=0, kind="stable")
+        self._keys = np.take_along_axis(keys, self._order, axis=0)
+
+    # Sign every chunk of a store, for versions built before signatures were saved
+    @classmethod
+    def from_store(cls, store):
+        int_ids = sorted(store.index_to_docstore_id)
+        texts = [store.docstore.search(store.index_to_docstore_id[i]).page_content for i in int_ids]
+        return cls(int_ids, [signature(text) for text in texts])
+
+    def save(self, path):
+        np.savez(os.path.join(path, MINHASH_FILE), int_ids=self.int_ids, signatures=self.signatures)
+
+    @classmethod
+    def load(cls, path):
+        minhash_path = os.path.join(path, MINHASH_FILE)
+        if not os.path.exists(minhash_path):
+            return None
+        with np.load(minhash_path, allow_pickle=False) as data:
+            return cls(data["int_ids"], data["signatures"])
+
+    # Int64 ID of the most similar indexed chunk at or above threshold, or None
+    def find(self, sig, threshold):
+        keys = band_keys(sig[None, :])[0]
+        rows = set()
+        for band in range(BANDS):
+            column = self._keys[:, band]
+            start, end = np.searchsorted(column, keys[band], "left"), np.searchsorted(column, keys[band], "right")
+            rows.update(self._order[start:end, band].tolist())
+        best, best_score = None, threshold
+        for row in rows:
+            score = similarity(sig, self.signatures[row])
+            if score >= best_score:
+                best, best_score = int(self.int_ids[row]), score
+        return best
+
+
+class Deduplicator:
+    """Collapses near-duplicate chunks of one ingest into chunks already indexed or seen earlier in it."""
+
+    def __init__(self, index, index_to_docstore_id, threshold):
+        self.index = index                      # Signatures of the live version, or None
+        self.lookup = index_to_docstore_id      # Int64 ID -> chunk ID of the live version
+        self.threshold = threshold
+        self.signatures = {}                    # Chunk ID -> signature of chunks kept in this ingest
+        self._buckets = [{} for _ in range(BANDS)]
+
+    # Chunk ID that text duplicates, or None; a text that is kept is remembered for later lookups
+    def check(self, chunk, text):
+        sig = signature(text)
+        if self.index is not None:
+            found = self.index.find(sig, self.threshold)
+            if found is not None and found in self.lookup:
+                return self.lookup[found]
+
+        keys = band_keys(sig[None, :])[0].tolist()
+        candidates = {other for band, key in enumerate(keys) for other in self._buckets[band].get(key, ())}
+        best, best_score = None, self.threshold
+        for other in candidates:
+            score = similarity(sig, self.signatures[other])
+            if score >= best_score:
+                best, best_score = other, score
+        if best is not None:
+            return best
+
+        self.signatures[chunk] = sig
+        for band, key in enumerate(keys):
+            self._buckets[band].setdefault(key, []).append(chunk)
+        return None
+
+    # Signatures of every chunk left in the finished store
+    def build(self, store):
+        int_of = {chunk: int_id for int_id, chunk in store.index_to_docstore_id.items()}
+        int_ids, signatures = [], []
+        if self.index is not None:
+            keep = np.isin(self.index.int_ids, np.fromiter(store.index_to_docstore_id, dtype=np.int64))
+            int_ids.extend(self.index.int_ids[keep].tolist())
+            signatures.extend(self.index.signatures[keep])
+        for chunk, sig in self.signatures.items():
+            if chunk in int_of:
+                int_ids.append(int_of[chunk])
+                signatures.append(sig)
+        return MinHashIndex(int_ids, np.array(signatures, dtype=np.uint32).reshape(-1, NUM_PERM))
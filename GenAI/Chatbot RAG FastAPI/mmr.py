@@ -0,0 +1,46 @@
+# Maximal marginal relevance (MMR) re-ranking of dense search candidates
+#
+# Neighbouring chunks overlap, so a plain top-k by similarity often returns the
+# same passage several times. MMR picks results one at a time by
+#
+#   lambda_mult * sim(query, chunk) - (1 - lambda_mult) * max sim(chunk, already picked)
+#
+# which trades relevance for novelty. All cosine similarities between the
+# queries and their candidates and among the candidates are computed up front
+# as batched matrix products; each of the k picks is then a handful of array
+# operations over every query at once, with no Python loop over candidates.
+
+import numpy as np                                                              # For the similarity matrices
+
+
+# Scale rows to unit length, leaving all-zero rows (for example empty text) at zero
+def normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+# Pick k of the candidates of every query by MMR. query_vectors is (Q, d), candidate_vectors
+# (Q, F, d) and valid (Q, F) marks the real candidates of each row; returns (Q, k) positions
+# into the candidates in pick order, padded with -1 where a query has fewer than k
+def mmr_select(query_vectors, candidate_vectors, valid, k, lambda_mult=0.5):
+    queries = normalize(np.asarray(query_vectors, dtype=np.float32))
+    candidates = normalize(np.asarray(candidate_vectors, dtype=np.float32))
+    available = np.array(valid, dtype=bool)
+    n_queries, n_candidates = available.shape
+    k = min(k, n_candidates)
+
+    relevance = np.einsum("qd,qfd->qf", queries, candidates)
+    similarity = np.matmul(candidates, candidates.transpose(0, 2, 1))
+    redundancy = np.zeros((n_queries, n_candidates), dtype=np.float32)
+    rows = np.arange(n_queries)
+    picks = np.full((n_queries, k), -1, dtype=np.int64)
+    for step in range(k):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy if step else relevance.copy()
+        scores[~available] = -np.inf
+        best = scores.argmax(axis=1)
+        found = available[rows, best]
+        picks[found, step] = best[found]
+        available[rows, best] = False
+        picked = similarity[rows, best]
+        redundancy = picked if step == 0 else np.maximum(redundancy, picked)
+    return picks
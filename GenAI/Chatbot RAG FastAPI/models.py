@@ -0,0 +1,102 @@
+# Lazily loaded models with opt-in preload and warm-up
+#
+# Loading spaCy en_core_web_lg and Qwen at import time made every worker start
+# slow and memory-hungry even when an endpoint never needed the model. Models
+# are now registered with a loader and loaded on first use. The names listed in
+# PRELOAD_MODELS (comma separated, default "embeddings") are loaded and warmed up
+# by a dummy call in the background at startup; /ready only reports ready once
+# that has finished, so an orchestrator never routes traffic to a cold worker.
+
+import os                                                                       # For the preload list
+import time                                                                     # For load and warm-up timings
+import threading                                                                # For per-model load locks and the warm-up thread
+from langchain_core.embeddings import Embeddings                                # For presenting a lazy model as LangChain embeddings
+
+
+class ModelRegistry:
+    """Named models loaded on first use, each at most once per process."""
+
+    def __init__(self):
+        self._loaders = {}
+        self._warmups = {}
+        self._models = {}
+        self._locks = {}
+        self._timings = {}
+        self._error = None
+        self.ready = threading.Event()
+
+    # Register how to load a model and, optionally, a dummy call that warms it up
+    def register(self, name, loader, warmup=None):
+        self._loaders[name] = loader
+        self._warmups[name] = warmup
+        self._locks[name] = threading.Lock()
+
+    # Return the model, loading it now if this is its first use
+    def get(self, name):
+        model = self._models.get(name)
+        if model is not None:
+            return model
+        with self._locks[name]:
+            if name not in self._models:
+                started = time.perf_counter()
+                self._models[name] = self._loaders[name]()
+                self._timings[name] = {"load_seconds": round(time.perf_counter() - started, 3)}
+        return self._models[name]
+
+    def loaded(self, name):
+        return name in self._models
+
+    # Load and warm up the given models, then mark the registry ready
+    def preload(self, names):
+        try:
+            for name in names:
+                model = self.get(name)
+                warmup = self._warmups[name]
+                if warmup is not None:
+                    started = time.perf_counter()
+                    warmup(model)
+                    self._timings[name]["warmup_seconds"] = round(time.perf_counter() - started, 3)
+            self.ready.set()
+        except Exception as e:
+            self._error = f"{type(e).__name__}: {e}"
+
+    # Run preload() on a background thread so the server can answer /ready while it works
+    def preload_in_background(self, names):
+        thread = threading.Thread(target=self.preload, args=(names,), name="preload", daemon=True)
+        thread.start()
+        return thread
+
+    def status(self):
+        return {
+            "ready": self.ready.is_set(),
+            "error": self._error,
+            "models": {
+                name: dict(loaded=name in self._models, **self._timings.get(name, {}))
+                for name in self._loaders
+            },
+        }
+
+
+# Model names to preload from PRELOAD_MODELS
+def preload_list(default="embeddings"):
+    return [name.strip() for name in os.getenv("PRELOAD_MODELS", default).split(",") if name.strip()]
+
+
+class LazyEmbeddings(Embeddings):
+    """LangChain embeddings that load the registered embedding model on first use."""
+
+    def __init__(self, registry, name):
+        self._registry = registry
+        self._name = name
+
+    def embed_documents(self, texts):
+        return self._registry.get(self._name).embed_documents(texts)
+
+    def embed_query(self, text):
+        return self._registry.get(self._name).embed_query(text)
+
+    # Anything else (the embedding cache, the wrapped spaCy model) comes from the loaded model
+    def __getattr__(self, attribute):
+        if attribute.startswith("_"):
+            raise AttributeError(attribute)
+        return getattr(self._registry.get(self._name), attribute)
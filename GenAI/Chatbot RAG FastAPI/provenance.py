@@ -0,0 +1,91 @@
+# Columnar chunk provenance stored next to each FAISS index version
+#
+# The docstore only keeps chunk texts. Where each chunk came from (source file,
+# 1-based page and character offset inside the page) is kept as parallel NumPy
+# columns in a single .npz, with every source path stored once, so it costs a
+# few bytes per chunk. Filters such as "this manual, pages 10-20" become one
+# vectorized mask over the columns that yields the int64 IDs FAISS and BM25
+# restrict their search to. A chunk that ingest collapsed into a near-duplicate
+# gets a row for every place it occurs, all under the one indexed chunk's ID.
+
+import os                                                                       # For file paths
+import numpy as np                                                              # For the provenance columns
+
+PROVENANCE_FILE = "provenance.npz"
+
+
+class ChunkProvenance:
+    """Source, page and offset of every chunk in one index version, addressed by its FAISS int64 ID."""
+
+    def __init__(self, sources, int_ids, source_rows, pages, starts, index_to_docstore_id):
+        self.sources = sources          # Distinct source paths, relative to the PDF folder
+        self.int_ids = int_ids          # Sorted FAISS IDs, one row per occurrence of a chunk
+        self.source_rows = source_rows  # Index into sources of each chunk
+        self.pages = pages              # 1-based page of each chunk, 0 if unknown
+        self.starts = starts            # Character offset of each chunk in its page, -1 if unknown
+        self._source_index = {source: i for i, source in enumerate(sources.tolist())}
+        self._rows = {}
+        for row, int_id in enumerate(int_ids.tolist()):
+            self._rows.setdefault(index_to_docstore_id[int_id], []).append(row)
+
+    # Build the columns from an ingest manifest and the store's ID map
+    @classmethod
+    def from_manifest(cls, manifest, index_to_docstore_id):
+        int_of = {chunk: int_id for int_id, chunk in index_to_docstore_id.items()}
+        sources = sorted(manifest["files"])
+        rows = []
+        for source_row, relpath in enumerate(sources):
+            for entry in manifest["files"][relpath]["chunks"]:
+                int_id = int_of.get(entry.get("duplicate_of", entry["id"]))
+                if int_id is not None:
+                    rows.append((int_id, source_row, entry.get("page", 0), entry.get("start", -1)))
+        rows.sort()
+        columns = np.array(rows, dtype=np.int64).reshape(-1, 4)
+        return cls(
+            np.array(sources, dtype=str), columns[:, 0], columns[:, 1].astype(np.int32),
+            columns[:, 2].astype(np.int32), columns[:, 3].astype(np.int32), index_to_docstore_id
+        )
+
+    def save(self, path):
+        np.savez(
+            os.path.join(path, PROVENANCE_FILE), sources=self.sources, int_ids=self.int_ids,
+            source_rows=self.source_rows, pages=self.pages, starts=self.starts
+        )
+
+    # Load the columns saved with a version, or None for versions built before provenance existed
+    @classmethod
+    def load(cls, path, index_to_docstore_id):
+        provenance_path = os.path.join(path, PROVENANCE_FILE)
+        if not os.path.exists(provenance_path):
+            return None
+        with np.load(provenance_path, allow_pickle=False) as data:
+            return cls(
+                data["sources"], data["int_ids"], data["source_rows"], data["pages"], data["starts"],
+                index_to_docstore_id
+            )
+
+    # Int64 IDs of the chunks matching every given filter; sources are paths relative to the PDF folder
+    def select(self, sources=None, page_from=None, page_to=None):
+        mask = np.ones(len(self.int_ids), dtype=bool)
+        if sources is not None:
+            wanted = [self._source_index[source] for source in sources if source in self._source_index]
+            mask &= np.isin(self.source_rows, wanted)
+        if page_from is not None:
+            mask &= self.pages >= page_from
+        if page_to is not None:
+            mask &= self.pages <= page_to
+        return np.unique(self.int_ids[mask])
+
+    # Source, page and offset of a chunk's first occurrence, or None if it is unknown
+    def locate(self, chunk):
+        rows = self._rows.get(chunk)
+        if rows is None:
+            return None
+        return self._location(rows[0])
+
+    # Source, page and offset of every occurrence of a chunk, including its collapsed near-duplicates
+    def locations(self, chunk):
+        return [self._location(row) for row in self._rows.get(chunk, ())]
+
+    def _location(self, row):
+        return str(self.sources[self.source_rows[row]]), int(self.pages[row]), int(self.starts[row])
@@ -0,0 +1,81 @@
+# Query-result cache for /query/
+#
+# Support traffic repeats the same questions, so the top-k chunk IDs and scores
+# of a normalized query are kept in an LRU with a TTL. Every entry is tagged with
+# the index generation it was computed against; once an ingest publishes a new
+# generation, older entries count as misses and are dropped on sight, so no
+# explicit invalidation is needed.
+
+import re                                                                       # For whitespace normalization
+import time                                                                     # For entry expiry
+import threading                                                                # For guarding the LRU
+import unicodedata                                                              # For unicode normalization
+from collections import OrderedDict                                             # For LRU ordering
+
+
+# Normalize a query so trivially different spellings of a question share an entry
+def normalize_query(query):
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", query)).strip().casefold()
+
+
+class QueryCache:
+    """LRU + TTL cache of query -> ranked (chunk ID, score) pairs, tagged with the index generation."""
+
+    def __init__(self, max_entries=10000, ttl=300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.expired = 0
+        self.evictions = 0
+
+    # Cache key for a query and the search parameters that change its result
+    def key(self, query, k, **params):
+        return (normalize_query(query), k, tuple(sorted(params.items())))
+
+    # Return the cached matches for key at this generation, or None
+    def get(self, key, generation):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            entry_generation, expires, value = entry
+            if entry_generation != generation or expires < time.monotonic():
+                del self._entries[key]
+                if entry_generation != generation:
+                    self.stale += 1
+                else:
+                    self.expired += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, generation, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (generation, time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "stale": self.stale,
+            "expired": self.expired,
+            "evictions": self.evictions,
+        }
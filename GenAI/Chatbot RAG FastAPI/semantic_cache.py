@@ -0,0 +1,131 @@
+# Semantic answer cache keyed by question embedding
+#
+# Many questions are paraphrases of earlier ones, and each would otherwise pay a
+# full CPU generation. Generated answers are kept with the embedding of the
+# question that produced them and the IDs of the chunks it was answered from. A
+# new question is served a stored answer when its cosine similarity to a cached
+# question reaches the threshold and its own retrieval returned the very same
+# chunks, in the same order, so a paraphrase that lands on other passages is
+# still answered afresh. Entries belong to one index version; the first lookup
+# or store against a newer version empties the cache. The least recently used
+# entry makes room for a new one. Hits, misses and the generation time saved are
+# counted for reporting.
+
+import os                                                                       # For the cache size and threshold
+import threading                                                                # For guarding the cache across requests
+import numpy as np                                                              # For scoring every cached question at once
+
+MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_SIZE", "1000"))             # Answers kept
+THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))        # Cosine similarity a paraphrase must reach
+
+
+class CachedAnswer:
+    """A generated answer, the question and chunks it came from, and the seconds it took to generate."""
+
+    def __init__(self, question, chunks, params, value, seconds):
+        self.question = question
+        self.chunks = chunks
+        self.params = params
+        self.value = value
+        self.seconds = seconds
+        self.hits = 0
+
+
+class SemanticAnswerCache:
+    """Answers of earlier questions, served again to paraphrases that retrieve the same chunks."""
+
+    def __init__(self, max_entries=MAX_ENTRIES, threshold=THRESHOLD):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.version = None
+        self._vectors = None                            # (max_entries, dim) unit question vectors, one row per slot
+        self._answers = [None] * max_entries            # Slot -> CachedAnswer
+        self._used = np.zeros(max_entries, np.int64)    # Slot -> tick of its last use, 0 while free
+        self._tick = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.near_misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+        self.seconds_saved = 0.0
+
+    # (entry, similarity) of a cached answer to reuse for this question, or None. chunks are the IDs
+    # of the chunks retrieved for it, in order; params are any other settings the answer depends on,
+    # and accept, if given, can turn down an entry whose stored value no longer applies.
+    def lookup(self, vector, chunks, version, params=None, accept=None):
+        with self._lock:
+            if not self._sync(version) or self._vectors is None:
+                self.misses += 1
+                return None
+            similarity = self._vectors @ unit(vector)
+            similarity[self._used == 0] = -np.inf
+            close = np.flatnonzero(similarity >= self.threshold)
+            for slot in close[np.argsort(-similarity[close])]:
+                entry = self._answers[slot]
+                if entry.chunks == chunks and entry.params == params and (accept is None or accept(entry.value)):
+                    self._tick += 1
+                    self._used[slot] = self._tick
+                    entry.hits += 1
+                    self.hits += 1
+                    self.seconds_saved += entry.seconds
+                    return entry, float(similarity[slot])
+            if len(close):
+                # A paraphrase, but retrieval found other passages (or its answer was turned down): it could differ
+                self.near_misses += 1
+            self.misses += 1
+            return None
+
+    # Keep the answer generated for a question; seconds is what generating it cost
+    def store(self, question, vector, chunks, version, value, seconds, params=None):
+        if self.max_entries <= 0:
+            return
+        vector = unit(vector)
+        with self._lock:
+            if not self._sync(version):
+                return
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, len(vector)), np.float32)
+            free = np.flatnonzero(self._used == 0)
+            if len(free):
+                slot = free[0]
+            else:
+                slot = int(self._used.argmin())
+                self.evictions += 1
+            self._tick += 1
+            self._vectors[slot] = vector
+            self._answers[slot] = CachedAnswer(question, chunks, params, value, seconds)
+            self._used[slot] = self._tick
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": int(np.count_nonzero(self._used)),
+            "max_entries": self.max_entries,
+            "threshold": self.threshold,
+            "version": self.version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "near_misses": self.near_misses,
+            "invalidations": self.invalidations,
+            "evictions": self.evictions,
+            "seconds_saved": round(self.seconds_saved, 3),
+        }
+
+    # Move to a newer index version, dropping every answer of the old one; False for an older version
+    def _sync(self, version):
+        if self.version is None or version > self.version:
+            if np.count_nonzero(self._used):
+                self.invalidations += 1
+            self._used[:] = 0
+            self._answers = [None] * self.max_entries
+            self.version = version
+        return version == self.version
+
+
+# Scale a vector to unit length, leaving an all-zero vector (no known words) at zero
+def unit(vector):
+    vector = np.asarray(vector, dtype=np.float32).ravel()
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
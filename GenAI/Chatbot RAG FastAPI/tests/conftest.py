@@ -0,0 +1,6 @@
+# Make the API modules (main, uploads, ingest, ...) importable from the tests
+
+import os                                                                       # For the path of the API folder
+import sys                                                                      # For the import path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
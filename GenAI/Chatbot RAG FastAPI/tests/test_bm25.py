@@ -0,0 +1,65 @@
+# Updating a BM25 index with added and removed chunks must match a rebuild
+
+import random                                                                   # For random chunk texts
+import numpy as np                                                              # For comparing postings arrays
+from langchain_core.documents import Document                                   # For docstore entries
+from bm25_index import BM25Index                                                # For the index under test
+
+
+class Docstore:
+    def __init__(self):
+        self.documents = {}
+
+    def search(self, chunk):
+        return self.documents[chunk]
+
+
+class Store:
+    """The parts of a LangChain FAISS store BM25Index reads: the ID map and the docstore."""
+
+    def __init__(self):
+        self.index_to_docstore_id = {}
+        self.docstore = Docstore()
+        self.next_id = 0
+
+    def add(self, text):
+        chunk = f"chunk-{self.next_id}"
+        self.index_to_docstore_id[self.next_id] = chunk
+        self.docstore.documents[chunk] = Document(page_content=text)
+        self.next_id += 1
+
+    def remove(self, int_id):
+        del self.docstore.documents[self.index_to_docstore_id.pop(int_id)]
+
+
+def assert_same(index, expected):
+    for field in ("terms", "offsets", "rows", "tfs", "doc_ids", "doc_lengths"):
+        np.testing.assert_array_equal(getattr(index, field), getattr(expected, field), err_msg=field)
+
+
+def test_update_matches_rebuild():
+    words = ["pump", "seal", "valve", "e-1042", "v2.3", "motor", "bearing", "flow", "pressure", "gasket"]
+    rng = random.Random(7)
+    store = Store()
+    for _ in range(50):
+        store.add(" ".join(rng.choices(words, k=rng.randint(0, 12))))
+    index = BM25Index.from_store(store)
+
+    for _ in range(5):
+        for int_id in rng.sample(sorted(store.index_to_docstore_id), 8):
+            store.remove(int_id)
+        for _ in range(10):
+            store.add(" ".join(rng.choices(words + ["rotor", "impeller"], k=rng.randint(0, 12))))
+        index = BM25Index.update(index, store)
+        assert_same(index, BM25Index.from_store(store))
+    assert index.search("impeller pump", 3) == BM25Index.from_store(store).search("impeller pump", 3)
+
+
+def test_update_to_empty_store():
+    store = Store()
+    store.add("pump seal")
+    index = BM25Index.from_store(store)
+    store.remove(0)
+    index = BM25Index.update(index, store)
+    assert len(index.doc_ids) == 0 and len(index.terms) == 0
+    assert index.search("pump", 3) == []
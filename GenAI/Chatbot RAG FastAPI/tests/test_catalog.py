@@ -0,0 +1,80 @@
+# Opening a collection must not hold up requests for collections already open, and
+# must not leave its per-name lock behind
+#
+# RetrievalEngine is swapped for a stand-in whose load() can be made slow, so
+# the test needs neither an index nor an embedding model.
+
+import os                                                                       # For the stand-in index files
+import time                                                                     # For the slow load and timing
+import threading                                                                # For concurrent requests
+import pytest                                                                   # For expecting the failed load
+import catalog                                                                  # For the catalog under test
+
+
+class Snapshot:
+    def __init__(self, path):
+        self.generation = 1
+        self.path = path
+
+
+class SlowEngine:
+    """Stand-in engine; loading a collection whose name starts with "slow" takes half a second,
+    and one whose name starts with "broken" fails."""
+
+    loads = []
+
+    def __init__(self, path, embeddings, config):
+        self.path = path
+
+    def load(self):
+        self.loads.append(self.path)
+        name = os.path.basename(os.path.dirname(self.path))
+        if name.startswith("slow"):
+            time.sleep(0.5)
+        if name.startswith("broken"):
+            raise OSError(f"cannot read {self.path}")
+
+    def snapshot(self):
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, "index.faiss"), "wb") as handle:
+            handle.write(b"x" * 100)
+        return Snapshot(self.path)
+
+
+def test_loading_one_collection_does_not_block_others(tmp_path, monkeypatch):
+    monkeypatch.setattr(catalog, "RetrievalEngine", SlowEngine)
+    SlowEngine.loads = []
+    collections = catalog.CollectionCatalog(str(tmp_path), None, max_open=2)
+    collections.get("fast")
+
+    threads = [threading.Thread(target=collections.get, args=("slow",)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    started = time.monotonic()
+    collections.get("fast")
+    waited = time.monotonic() - started
+    for thread in threads:
+        thread.join()
+
+    assert waited < 0.25
+    assert sum("slow" in path for path in SlowEngine.loads) == 1
+
+    collections.get("third")
+    stats = collections.stats()
+    assert list(stats["open"]) == ["slow", "third"]
+    assert stats["open_bytes"] == 200
+    assert stats["evictions"] == 1
+    assert collections._opening == {}
+
+
+def test_open_locks_are_dropped_after_success_and_failure(tmp_path, monkeypatch):
+    monkeypatch.setattr(catalog, "RetrievalEngine", SlowEngine)
+    collections = catalog.CollectionCatalog(str(tmp_path), None, max_open=1)
+    for name in ("first", "second", "first"):
+        collections.get(name)
+    assert collections._opening == {}
+
+    with pytest.raises(OSError):
+        collections.get("broken")
+    assert collections._opening == {}
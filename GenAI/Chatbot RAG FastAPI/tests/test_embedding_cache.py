@@ -0,0 +1,24 @@
+# Rows of the embedding cache must stay aligned with their keys after a torn append
+
+import os                                                                       # For the cache files
+from embedding_cache import EmbeddingCache, KEYS_FILE, KEY_SIZE                 # For the cache under test
+
+
+def test_torn_key_is_cut_before_the_next_append(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "model")
+    first = [cache.key(f"chunk {i}") for i in range(3)]
+    cache.put_many(first, [[float(i)] * 4 for i in range(3)])
+
+    # A crash in the middle of appending a key leaves part of it behind
+    keys_path = os.path.join(cache.path, KEYS_FILE)
+    with open(keys_path, "ab") as f:
+        f.write(cache.key("torn")[:KEY_SIZE // 2])
+
+    # A fresh process reads only the whole keys, then appends after them
+    cache = EmbeddingCache(str(tmp_path), "model")
+    later = [cache.key(f"chunk {i}") for i in range(3, 6)]
+    cache.put_many(later, [[float(i)] * 4 for i in range(3, 6)])
+    assert os.path.getsize(keys_path) == 6 * KEY_SIZE
+
+    reopened = EmbeddingCache(str(tmp_path), "model")
+    assert reopened.get_many(first + later) == [[float(i)] * 4 for i in range(6)]
@@ -0,0 +1,68 @@
+# A cancelled ingest must stop before training and publishing anything, and the parse pool is shared
+
+import threading                                                                # For the cancel event
+import pytest                                                                   # For expecting the cancellation
+from langchain_community.embeddings import DeterministicFakeEmbedding           # For embeddings without the spaCy model
+from engine import RetrievalEngine                                              # For the index the ingest targets
+from faiss_index import IndexTrainer                                            # For watching the training step
+import ingest                                                                   # For the serial parse thresholds
+from ingest import ingest_directory, IngestCancelled, ParsePool                 # For the ingest under test
+from test_uploads import make_pdf                                               # For small test PDFs
+
+
+class CancellingEmbeddings:
+    """Embeds like the fake model, then cancels the ingest, as a user pressing cancel mid-run would."""
+
+    def __init__(self, cancel):
+        self.cancel = cancel
+        self.model = DeterministicFakeEmbedding(size=32)
+
+    def embed_documents(self, texts):
+        vectors = self.model.embed_documents(texts)
+        self.cancel.set()
+        return vectors
+
+    def embed_query(self, text):
+        return self.model.embed_query(text)
+
+
+def test_cancelled_ingest_skips_training(tmp_path, monkeypatch):
+    source_dir = tmp_path / "PDFFILES"
+    source_dir.mkdir()
+    for i in range(3):
+        (source_dir / f"doc{i}.pdf").write_bytes(make_pdf([f"Document {i} about pump maintenance"]))
+    trained = []
+    monkeypatch.setattr(IndexTrainer, "finish", lambda self: trained.append(self))
+
+    cancel = threading.Event()
+    engine = RetrievalEngine(str(tmp_path / "faiss_db"), CancellingEmbeddings(cancel))
+    with pytest.raises(IngestCancelled):
+        ingest_directory(engine, str(source_dir), embed_batch_size=1, cancel=cancel)
+
+    assert trained == []
+    assert engine.snapshot() is None
+
+
+def test_parse_pool_is_shared_and_small_ingests_skip_it(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest, "SERIAL_FILES", 2)
+    source_dir = tmp_path / "PDFFILES"
+    source_dir.mkdir()
+    for i in range(4):
+        (source_dir / f"doc{i}.pdf").write_bytes(make_pdf([f"Document {i} about pump maintenance"]))
+    pool = ParsePool(workers=2)
+    engine = RetrievalEngine(str(tmp_path / "faiss_db"), DeterministicFakeEmbedding(size=32))
+    try:
+        summary = ingest_directory(engine, str(source_dir), parse_pool=pool)
+        assert summary["files_added"] == 4
+        started = pool._pool
+        assert started is not None
+
+        # One changed file is parsed on the ingest's own thread; the running pool is kept for later
+        (source_dir / "doc0.pdf").write_bytes(make_pdf(["Document 0 about seal replacement"]))
+        submitted = []
+        monkeypatch.setattr(pool, "submit", lambda *args: submitted.append(args))
+        summary = ingest_directory(engine, str(source_dir), parse_pool=pool)
+        assert summary["files_changed"] == 1 and submitted == []
+        assert pool._pool is started
+    finally:
+        pool.shutdown()
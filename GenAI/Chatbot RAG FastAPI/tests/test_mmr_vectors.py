@@ -0,0 +1,67 @@
+# MMR candidate vectors come from the index where it keeps them exactly, never from re-embedding
+
+import numpy as np                                                              # For the test vectors
+import pytest                                                                   # For parametrizing over index types
+from engine import IndexSnapshot                                                # For the search and MMR under test
+from embedding_cache import CachedEmbeddings                                    # For the read-only cache lookup
+from faiss_index import IndexConfig, new_store, add_to_store                    # For building each index type
+
+DIM = 8
+CHUNKS = 1200           # Enough to train SQ8 and IVF instead of falling back to flat
+
+
+class CountingModel:
+    """Embedding model that returns a fixed vector per text and counts the texts it embedded."""
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+        self.embedded = 0
+
+    def embed_documents(self, texts):
+        self.embedded += len(texts)
+        return [self.vectors[text] for text in texts]
+
+    def embed_query(self, text):
+        return self.vectors[text]
+
+
+def snapshot(index_type, tmp_path):
+    rng = np.random.default_rng(0)
+    texts = [f"chunk {i}" for i in range(CHUNKS)]
+    vectors = rng.standard_normal((CHUNKS, DIM)).astype(np.float32)
+    model = CountingModel({text: vector.tolist() for text, vector in zip(texts, vectors)})
+    embeddings = CachedEmbeddings(model, str(tmp_path), name="counting")
+    store, _ = new_store(embeddings, IndexConfig(index_type=index_type, nprobe=64), vectors)
+    add_to_store(store, [f"id{i}" for i in range(CHUNKS)], texts, vectors, 0)
+    return IndexSnapshot(1, str(tmp_path), store, None), model, embeddings, vectors
+
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw", "ivf_flat"])
+def test_exact_indexes_hand_back_their_vectors(index_type, tmp_path):
+    index, model, embeddings, vectors = snapshot(index_type, tmp_path)
+    matches = index.search(vectors[:3], 10)
+    picked = index.diversify(vectors[:3], matches, 4)
+
+    assert model.embedded == 0 and embeddings.cache.stats()["entries"] == 0
+    assert [len(row) for row in picked] == [4, 4, 4]
+    candidates = {match.id: match for row in matches for match in row}
+    found = index.candidate_vectors(candidates)
+    for chunk, match in candidates.items():
+        np.testing.assert_allclose(found[chunk], vectors[match.int_id], rtol=1e-6)
+
+
+def test_lossy_indexes_read_the_cache_and_embed_only_misses(tmp_path):
+    index, model, embeddings, vectors = snapshot("sq8", tmp_path)
+    embeddings.embed_documents([f"chunk {i}" for i in range(CHUNKS // 2)])
+    model.embedded = 0
+    entries = embeddings.cache.stats()["entries"]
+
+    matches = index.search(vectors[:5], 10)
+    candidates = {match.id: match for row in matches for match in row}
+    found = index.candidate_vectors(candidates)
+
+    misses = sum(1 for match in candidates.values() if match.int_id >= CHUNKS // 2)
+    assert model.embedded == misses
+    assert embeddings.cache.stats()["entries"] == entries
+    for chunk, match in candidates.items():
+        np.testing.assert_allclose(found[chunk], vectors[match.int_id], rtol=1e-6)
@@ -0,0 +1,90 @@
+# Uploads that share a file name must not overwrite, and so un-index, each other
+#
+# The API keeps its index, PDF folder and caches in the working directory, so
+# main is imported inside a temporary one. A small deterministic embedding
+# replaces the spaCy model, which is too large for a test run.
+
+import time                                                                     # For polling ingest jobs
+import importlib                                                                # For importing the API inside the temporary folder
+import pytest                                                                   # For fixtures
+from fastapi.testclient import TestClient                                       # For calling the API in-process
+from langchain_community.embeddings import DeterministicFakeEmbedding           # For embeddings without the spaCy model
+
+
+# A minimal PDF with one line of text per page
+def make_pdf(pages):
+    body = {
+        1: "<< /Type /Catalog /Pages 2 0 R >>",
+        3: "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    }
+    kids = []
+    for i, text in enumerate(pages):
+        page, content = 4 + 2 * i, 5 + 2 * i
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET"
+        kids.append(f"{page} 0 R")
+        body[page] = (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {content} 0 R "
+                      "/Resources << /Font << /F1 3 0 R >> >> >>")
+        body[content] = f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream"
+    body[2] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(pages)} >>"
+
+    out, offsets = b"%PDF-1.4\n", {}
+    for number in sorted(body):
+        offsets[number] = len(out)
+        out += f"{number} 0 obj\n{body[number]}\nendobj\n".encode()
+    xref = len(out)
+    out += f"xref\n0 {len(body) + 1}\n0000000000 65535 f \n".encode()
+    out += b"".join(f"{offsets[number]:010d} 00000 n \n".encode() for number in sorted(body))
+    out += f"trailer\n<< /Size {len(body) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return out
+
+
+@pytest.fixture(scope="module")
+def client(tmp_path_factory):
+    with pytest.MonkeyPatch.context() as patch:
+        patch.chdir(tmp_path_factory.mktemp("api"))
+        patch.setenv("PRELOAD_MODELS", "")
+        main = importlib.import_module("main")
+        main.models.register("embeddings", lambda: DeterministicFakeEmbedding(size=32))
+        with TestClient(main.app) as client:
+            yield client
+
+
+def wait_for(client, status_url):
+    for _ in range(100):
+        report = client.get(status_url).json()
+        if report["status"] not in ("queued", "running"):
+            return report
+        time.sleep(0.1)
+    raise AssertionError(f"{status_url} did not finish")
+
+
+def upload(client, name, content):
+    response = client.post("/upload/", files=[("files", (name, content, "application/pdf"))])
+    assert response.status_code == 202
+    body = response.json()
+    assert wait_for(client, body["status_url"])["status"] == "completed"
+    return body["files"][0]
+
+
+def sources(client, query):
+    response = client.post("/query/", json={"query": query, "mode": "bm25", "k": 4})
+    assert response.status_code == 200
+    return {source["source"] for source in response.json().get("sources", [])}
+
+
+def test_same_name_different_content_keeps_both_documents(client):
+    first = upload(client, "manual.pdf", make_pdf(["Centrifugal pump priming instructions"]))
+    second = upload(client, "manual.pdf", make_pdf(["Warranty coverage for damaged units"]))
+
+    assert first["status"] == second["status"] == "accepted"
+    assert first["stored_as"] == "manual.pdf"
+    assert second["stored_as"] == f"manual-{second['sha256'][:8]}.pdf"
+    assert any(source.endswith("manual.pdf") for source in sources(client, "centrifugal pump priming"))
+    assert any(source.endswith(second["stored_as"]) for source in sources(client, "warranty coverage damaged"))
+
+
+def test_same_name_same_content_is_a_duplicate(client):
+    content = make_pdf(["Seal replacement procedure"])
+    assert upload(client, "seals.pdf", content)["status"] == "accepted"
+    response = client.post("/upload/", files=[("files", ("seals.pdf", content, "application/pdf"))]).json()
+    assert response["files"][0]["status"] == "duplicate"
@@ -0,0 +1,202 @@
+# Streaming multipart PDF uploads
+#
+# The request body is fed to a streaming multipart parser chunk by chunk as it
+# arrives. Each file part is written to a spooled temporary file, which stays in
+# memory up to UPLOAD_SPOOL_MB and then moves to disk, and is SHA-256 hashed on
+# the way, so no upload is ever held in memory whole or read twice. A file
+# whose hash is already in the live manifest, or in an upload that has not been
+# ingested yet, is dropped before it reaches the PDF folder or the parser. The
+# hashes of accepted files are handed to the ingest job, so its planning step
+# does not hash them again. A different file arriving under a name that is
+# already taken, on disk, in the manifest or by a pending upload, is stored as
+# name-<first 8 hex digits of its hash>.pdf instead, so it never overwrites
+# (and so un-indexes) another document.
+
+import os                                                                       # For the PDF folder and upload limits
+import re                                                                       # For sanitizing file names
+import shutil                                                                   # For copying spooled files into place
+import hashlib                                                                  # For hashing uploads as they stream in
+import tempfile                                                                 # For spooled temporary files
+import threading                                                                # For guarding the pending hash table
+from python_multipart.multipart import MultipartParser, parse_options_header    # For parsing multipart bodies incrementally
+
+SPOOL_BYTES = int(float(os.getenv("UPLOAD_SPOOL_MB", "8")) * 1024 * 1024)      # Upload size kept in memory before spilling to disk
+MAX_UPLOAD_BYTES = int(float(os.getenv("UPLOAD_MAX_MB", "200")) * 1024 * 1024) # Largest single file accepted
+PDF_MAGIC = b"%PDF-"
+UNSAFE_NAME = re.compile(r"[^A-Za-z0-9._ -]+")
+
+
+# File name an upload is stored under: no directories, no odd characters, always ending in .pdf
+def safe_filename(filename):
+    stem = os.path.splitext(os.path.basename(filename.replace("\\", "/")))[0]
+    stem = UNSAFE_NAME.sub("_", stem).strip(" .") or "upload"
+    return f"{stem[:200]}.pdf"
+
+
+# Name for a file whose safe name is taken by different content: the hash prefix makes it unique
+def unique_filename(relpath, sha256):
+    stem, ext = os.path.splitext(relpath)
+    return f"{stem}-{sha256[:8]}{ext}"
+
+
+class SpooledPart:
+    """One file part of a multipart upload, spooled and hashed while it arrives."""
+
+    def __init__(self, filename, max_bytes=MAX_UPLOAD_BYTES):
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.file = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.head = b""
+        self.error = None
+
+    def write(self, data):
+        if self.error is not None:
+            return
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            self.error = f"larger than {self.max_bytes // (1024 * 1024)} MB"
+            self.file.close()
+            return
+        if len(self.head) < len(PDF_MAGIC):
+            self.head += data[:len(PDF_MAGIC) - len(self.head)]
+        self.digest.update(data)
+        self.file.write(data)
+
+    # Called once the part has fully arrived: reject anything that does not look like a PDF
+    def finish(self):
+        if self.error is None and not self.head.startswith(PDF_MAGIC):
+            self.error = "not a PDF"
+            self.file.close()
+
+    @property
+    def sha256(self):
+        return self.digest.hexdigest()
+
+    def close(self):
+        self.file.close()
+
+
+class MultipartSpooler:
+    """Feeds body chunks to a streaming multipart parser and hands back the file parts that finished."""
+
+    def __init__(self, content_type, max_bytes=MAX_UPLOAD_BYTES):
+        kind, options = parse_options_header(content_type)
+        boundary = options.get(b"boundary")
+        if kind != b"multipart/form-data" or not boundary:
+            raise ValueError("Send the PDFs as multipart/form-data.")
+        self.max_bytes = max_bytes
+        self._finished = []
+        self._part = None
+        self._headers = {}
+        self._field = b""
+        self._value = b""
+        self._parser = MultipartParser(boundary, {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+
+    # Parse the next body chunk; returns the file parts it completed
+    def feed(self, chunk):
+        self._parser.write(chunk)
+        finished, self._finished = self._finished, []
+        return finished
+
+    # End of the body; returns any file parts still pending
+    def close(self):
+        self._parser.finalize()
+        finished, self._finished = self._finished, []
+        return finished
+
+    def _on_part_begin(self):
+        self._part = None
+        self._headers = {}
+
+    def _on_header_field(self, data, start, end):
+        self._field += data[start:end]
+
+    def _on_header_value(self, data, start, end):
+        self._value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._field.lower()] = self._value
+        self._field, self._value = b"", b""
+
+    # Only parts with a file name are uploads; plain form fields are ignored
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        filename = options.get(b"filename")
+        if filename:
+            self._part = SpooledPart(filename.decode("utf-8", "replace"), self.max_bytes)
+
+    def _on_part_data(self, data, start, end):
+        if self._part is not None:
+            self._part.write(data[start:end])
+
+    def _on_part_end(self):
+        if self._part is not None:
+            self._part.finish()
+            self._finished.append(self._part)
+            self._part = None
+
+
+class UploadRegistry:
+    """Hashes of uploaded files that no published version contains yet, per PDF folder."""
+
+    def __init__(self):
+        self._pending = {}      # PDF folder -> {sha256: relpath}
+        self._stored = {}       # PDF folder -> {relpath: (size, mtime, sha256)}
+        self._lock = threading.Lock()
+
+    # (relative path of a file with the same content, None) for a duplicate; otherwise (None, relative path
+    # to store the upload under) after reserving its hash and that path. The path is relpath unless
+    # another file already has that name, then it is made unique with the hash.
+    def reserve(self, source_dir, sha256, relpath, manifest=None):
+        files = (manifest or {}).get("files", {})
+        known = {meta["sha256"]: path for path, meta in files.items()}
+        with self._lock:
+            pending = self._pending.setdefault(source_dir, {})
+            for path in [path for sha, path in pending.items() if sha in known]:
+                # Published since it was uploaded, the manifest covers it from now on
+                self._stored.get(source_dir, {}).pop(path, None)
+            pending = {sha: path for sha, path in pending.items() if sha not in known}
+            self._pending[source_dir] = pending
+            duplicate = known.get(sha256) or pending.get(sha256)
+            if duplicate is not None:
+                return duplicate, None
+            taken = set(files) | set(pending.values())
+            if relpath in taken or os.path.exists(os.path.join(source_dir, relpath)):
+                relpath = unique_filename(relpath, sha256)
+            pending[sha256] = relpath
+            return None, relpath
+
+    def release(self, source_dir, sha256):
+        with self._lock:
+            self._pending.get(source_dir, {}).pop(sha256, None)
+
+    # Move a spooled upload into the PDF folder under the path reserve() gave it, and remember its hash
+    # for the ingest job
+    def store(self, part, source_dir, relpath):
+        os.makedirs(source_dir, exist_ok=True)
+        path = os.path.join(source_dir, relpath)
+        tmp_path = path + ".part"
+        part.file.seek(0)
+        with open(tmp_path, "wb") as f:
+            shutil.copyfileobj(part.file, f, 1 << 20)
+        part.close()
+        os.replace(tmp_path, path)
+        stat = os.stat(path)
+        with self._lock:
+            self._stored.setdefault(source_dir, {})[relpath] = (stat.st_size, stat.st_mtime, part.sha256)
+        return path
+
+    # Content hashes of stored uploads, as relpath -> (size, mtime, sha256), for ingest planning
+    def hashes(self, source_dir):
+        with self._lock:
+            return dict(self._stored.get(source_dir, {}))
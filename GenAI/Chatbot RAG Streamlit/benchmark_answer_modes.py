@@ -0,0 +1,81 @@
+# Benchmark of the direct and agent answer modes of the Streamlit RAG chatbot
+#
+# Indexes the given PDF files the way the app does for a session, answers the same
+# questions with both modes and reports end-to-end latency, generations (LLM calls) and tokens generated per
+# question. The direct mode is one retrieval and one generation; the agent mode
+# is the ReAct loop bounded by AGENT_MAX_STEPS and AGENT_MAX_SECONDS. Models and
+# the index are loaded and warmed up before timing, as they would be in a running app.
+#
+# Usage:
+#   python benchmark_answer_modes.py --pdfs manual.pdf --questions "What is the warranty period?" "How do I reset it?" --repeat 3
+
+import io                                                                       # For handing PDF files to the extractor like uploads
+import os                                                                       # For upload names
+import time                                                                     # For latency measurements
+import argparse                                                                 # For command line options
+import statistics                                                               # For medians
+from langchain_core.callbacks import BaseCallbackHandler                        # For counting the agent's generated tokens
+import chatbot_rag_streamlit as app                                             # For the answer modes under test
+
+
+class TokenCounter(BaseCallbackHandler):
+    """Counts LLM calls and the tokens they generated."""
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        self.calls = 0
+        self.tokens = 0
+
+    def on_llm_end(self, response, **kwargs):
+        for generations in response.generations:
+            for generation in generations:
+                self.calls += 1
+                self.tokens += len(self.tokenizer(generation.text, add_special_tokens=False).input_ids)
+
+
+# Answer one question in the given mode; returns seconds, LLM calls and generated tokens
+def run(mode, question, index, tokenizer):
+    started = time.perf_counter()
+    if mode == "Direct":
+        documents = index.similarity_search(question, k=app.TOP_K)
+        _, tokens = app.direct_answer(question, documents)
+        calls = 1
+    else:
+        counter = TokenCounter(tokenizer)
+        app.build_agent(index).invoke({"input": question}, config={"callbacks": [counter]})
+        calls, tokens = counter.calls, counter.tokens
+    return time.perf_counter() - started, calls, tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the direct and agent answer modes.")
+    parser.add_argument("--pdfs", nargs="+", required=True)
+    parser.add_argument("--questions", nargs="+", required=True)
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    uploads = []
+    for path in args.pdfs:
+        with open(path, "rb") as f:
+            upload = io.BytesIO(f.read())
+        upload.name = os.path.basename(path)
+        uploads.append(upload)
+    index, chunks = app.vector_store(app.get_chunks(app.pdf_read(uploads)))
+    if not chunks:
+        raise SystemExit("No text found in the PDF files.")
+    tokenizer, _ = app.load_qwen()
+    for mode in app.ANSWER_MODES:
+        run(mode, "warm up", index, tokenizer)
+
+    print(f"{'mode':>8} {'p50_s':>8} {'mean_s':>8} {'llm_calls':>10} {'tokens':>8} {'tok/s':>8}")
+    for mode in app.ANSWER_MODES:
+        results = [run(mode, question, index, tokenizer) for question in args.questions for _ in range(args.repeat)]
+        seconds = [r[0] for r in results]
+        calls = statistics.mean(r[1] for r in results)
+        tokens = statistics.mean(r[2] for r in results)
+        print(f"{mode:>8} {statistics.median(seconds):>8.2f} {statistics.mean(seconds):>8.2f} {calls:>10.1f} "
+              f"{tokens:>8.1f} {tokens / statistics.mean(seconds):>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
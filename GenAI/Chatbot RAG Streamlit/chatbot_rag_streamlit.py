@@ -2,28 +2,41 @@
 
 # Importing the important libraries
 import streamlit as st								                            # For building the web application
-from PyPDF2 import PdfReader							                        # For reading and extracting text from PDF files
+from pdf_extract import iter_pages, make_pool                                   # For parallel page-level PDF text extraction
 from langchain.text_splitter import RecursiveCharacterTextSplitter 		        # For splitting long texts into manageable chunks
-from langchain.prompts.chat import SystemMessagePromptTemplate                  # For creating templates for the Qwen model prompts
-from langchain.prompts.chat import HumanMessagePromptTemplate, AIMessagePromptTemplate # For creating templates for the Qwen model prompts
-from langchain.prompts import ChatPromptTemplate				                # For creating templates for the Qwen model prompts
+from langchain.prompts import ChatPromptTemplate, PromptTemplate, MessagesPlaceholder  # For creating templates for the Qwen model prompts
 from langchain_community.embeddings.spacy_embeddings import SpacyEmbeddings   	# For embedding generation using the SpaCy NLP model
 from langchain_community.vectorstores import FAISS				                # For efficient vector-based storage and retrieval
 from langchain.tools.retriever import create_retriever_tool			            # For building retrieval tools for question answering
-from langchain.agents import create_react_agent                                 # For creating agent
+from langchain.agents import create_react_agent, AgentExecutor                  # For creating agent and bounding its steps and time
 from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline          # For Qwen model integration  
+from transformers import TextIteratorStreamer, StoppingCriteria, StoppingCriteriaList  # For streaming and cancelling generation
+import torch                                                                    # For direct generation with the Qwen model
 from langchain_huggingface import HuggingFacePipeline                           # Pipeline for HuggingPace
 from dotenv import load_dotenv							                        # For loading environment variables from a .env file
 import os									                                    # For interacting with the operating system
+import time                                                                     # For time to first token and generation time saved
+import uuid                                                                     # For naming each session's index
+import threading                                                                # For generating on a background thread while streaming
+import queue                                                                    # For the stream timeout
 import huggingface_hub                                                          # For HuggingFace
 from huggingface_hub import hf_hub_download                                     # For login into HuggingFace
 import logging                                                                  # For logging
 from langchain.schema import SystemMessage, HumanMessage, AIMessage             # For formatting the prompt messages
 from langchain.docstore.document import Document                                # For Document processing
+from embedding_cache import CachedEmbeddings                                    # For reusing embeddings of previously seen chunks
+from session_indexes import SessionIndexStore                                   # For per-session indexes under a memory cap
+from semantic_cache import SemanticAnswerCache                                  # For reusing answers to paraphrased questions
+from conversation_memory import ConversationMemory, SUMMARY_TOKENS             # For token-budgeted follow-up history
+from concurrent.futures import ThreadPoolExecutor                               # For summarizing old turns off the critical path
 
 # For logging
 # 
 # logging.basicConfig(level=logging.DEBUG)  # Set DEBUG level globally
+logger = logging.getLogger("chatbot_rag_streamlit")
+logger.setLevel(logging.INFO)
+if not logger.handlers:     # The script re-runs on every interaction; attach the handler only once
+    logger.addHandler(logging.StreamHandler())
 
 # To handle potential shared library errors
 os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
@@ -33,130 +46,385 @@ load_dotenv() # Load environment variables
 # Log into Hugging Face
 HF_TOKEN = os.getenv("HF_TOKEN")
 
-# Initialize Qwen model and tokenizer
 model_name="Qwen/Qwen2.5-0.5B-Instruct"
-qwen_model = AutoModelForCausalLM.from_pretrained(model_name)
-qwen_tokenizer = AutoTokenizer.from_pretrained(model_name, use_auth_token=HF_TOKEN)
-
-# Create a Hugging Face pipeline for text generation
-hf_pipeline = pipeline(
-    "text-generation", model=qwen_model, tokenizer=qwen_tokenizer, max_length=512, device="cpu"
+ANSWER_MODES = ("Direct", "Agent")  # Direct: one retrieval and one generation; Agent: a bounded ReAct loop
+TOP_K = 4                           # Chunks retrieved per question
+MAX_NEW_TOKENS = int(os.getenv("MAX_NEW_TOKENS", "256"))           # Tokens generated per answer (or per agent step)
+AGENT_MAX_STEPS = int(os.getenv("AGENT_MAX_STEPS", "3"))           # Thought/action rounds the agent may take
+AGENT_MAX_SECONDS = float(os.getenv("AGENT_MAX_SECONDS", "60"))    # Wall-clock budget of one agent answer
+STREAM_TIMEOUT = 120.0              # Seconds to wait for the next streamed token before giving up
+ANSWER_CACHE_SIZE = int(os.getenv("SESSION_ANSWER_CACHE_SIZE", "100"))  # Answers each session keeps for paraphrases
+
+SYSTEM_PROMPT = (
+    "You are a helpful assistant that answers questions about the user's PDF files. "
+    "If the answer cannot be found in the provided context, reply with: "
+    "\"The answer is not available in the context.\" Do not provide incorrect or misleading answers."
 )
 
-# Wrap the Hugging Face pipeline in LangChain's HuggingFacePipeline
-qwen_llm = HuggingFacePipeline(pipeline=hf_pipeline)
+# Prompt of the direct mode, built once: the conversation so far, then the retrieved chunks,
+# numbered with their file and page, and the question
+DIRECT_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", SYSTEM_PROMPT + " Cite the passages you use as [1], [2], ..."),
+    MessagesPlaceholder("history", optional=True),
+    ("human", "Context:\n{context}\n\nQuestion: {question}"),
+])
 
-# Initialize the embedding model 
-embeddings = SpacyEmbeddings(model_name="en_core_web_lg")
+# Prompt that folds turns which left the verbatim history into the running summary
+SUMMARY_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "You keep a short running summary of a conversation about the user's PDF files. "
+               "Merge the new turns into the summary, keeping the names, numbers and facts the user may "
+               f"refer back to. Reply with the updated summary only, in at most {SUMMARY_TOKENS * 3 // 4} words."),
+    ("human", "Summary so far:\n{summary}\n\nNew turns:\n{turns}"),
+])
 
-# Function to read text from uploaded PDF files
-def pdf_read(pdf_doc):
-    text = ""
-    # Loop through each uploaded PDF file
-    for pdf in pdf_doc:     
-        pdf_reader = PdfReader(pdf)
-        # Extract text from each page of the PDF
-        for page in pdf_reader.pages:
-            text += page.extract_text()
-    return text
-
-# Function to split the extracted text into smaller chunks
-def get_chunks(text):
-    # Chunk size is 1000 characters with an overlap of 200 characters
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    chunks = text_splitter.split_text(text)
-    return chunks
-
-# Function to create a FAISS vector store for storing text embeddings
-def vector_store(text_chunks):
-    # Create documents using LangChain's Document class
-    documents = [Document(page_content=chunk, metadata={}) for chunk in text_chunks]
-    
-    # Convert documents into embeddings and store them in FAISS
-    vector_store = FAISS.from_documents(documents, embedding=embeddings)
-    
-    # Save the FAISS index locally for later retrieval
-    vector_store.save_local("faiss_db")
-
-# Function to handle question answering using the Qwen model and retriever tool
-def get_conversational_chain(retrieval_tool, user_question):
-    
-     # Format the prompt with the required variables: user question and tools
-    tool_names = "pdf_extractor"
-
-    print("Tool Names", tool_names)
-    
-    # Define individual message templates
-    system_message_template = SystemMessagePromptTemplate.from_template(
-        """You are a helpful assistant equipped with tools to answer questions.
-          Use the available tools effectively. If the answer cannot be found in the provided context, 
-          reply with: "The answer is not available in the context." Do not provide incorrect or misleading answers."""
-   )
-    
-    # Format the system message with the tool_names variable
-    print("Before System Message")
-    system_message = system_message_template.format()
-
-    print("System Message:", system_message)
-    
-    human_message = HumanMessagePromptTemplate.from_template("{input}")
-
-    print("Human Message:", human_message)
-
-    assistant_initial_message = AIMessagePromptTemplate.from_template("Let me check that for you...")
-
-    assistant_scratchpad_message = AIMessagePromptTemplate.from_template("Checking")
-
-    print("User Question", user_question)
-
-    # Create the ChatPromptTemplate from these message templates
-    prompt = ChatPromptTemplate.from_messages(
-        [
-            system_message,
-            human_message,
-            assistant_initial_message,
-            assistant_scratchpad_message
-        ]
-    )
+# Prompt of the agent mode, built once, in the format create_react_agent expects; history is the
+# conversation so far, empty for a first question
+AGENT_PROMPT = PromptTemplate.from_template(SYSTEM_PROMPT + """ Use the available tools effectively.
 
-     
-    #formatted_prompt = prompt.format_messages(input=user_question, tool_names=tool_names )
-    formatted_prompt = prompt.format_messages(input=user_question)
+You have access to the following tools:
 
-    print("FORMATTED TEXT", formatted_prompt)
+{tools}
 
-    # Initialize the agent with the retrieval tool
-    agent = create_react_agent(
-       llm=qwen_llm,
-       tools=retrieval_tool,
-       prompt=formatted_prompt
-    )
+Use the following format:
 
-    print("Before INVOKE")
+Question: the input question you must answer
+Thought: you should always think about what to do
+Action: the action to take, should be one of [{tool_names}]
+Action Input: the input to the action
+Observation: the result of the action
+... (this Thought/Action/Action Input/Observation can repeat N times)
+Thought: I now know the final answer
+Final Answer: the final answer to the original input question
 
-    # Generate a response to the user's question
-    response = agent.invoke({"input": user_question})
+Begin!
 
-    print("RESPONSE", response['output'])
+{history}Question: {input}
+Thought:{agent_scratchpad}""").partial(history="")
 
-    # Display the agent's response
-    st.write("Reply: ", response['output'])
+# Streamlit re-runs this script on every widget interaction, so models and the store of session
+# indexes are loaded through st.cache_resource: once per server process, shared by every session
 
-# Function to handle user inputs and process queries
-def user_input(user_question):
-    try:
-        # Load FAISS vector store created earlier
-        new_db = FAISS.load_local("faiss_db", embeddings, allow_dangerous_deserialization=True)
-        retriever = new_db.as_retriever()
+# Initialize Qwen model and tokenizer
+@st.cache_resource(show_spinner="Loading the Qwen model...")
+def load_qwen():
+    qwen_model = AutoModelForCausalLM.from_pretrained(model_name)
+    qwen_tokenizer = AutoTokenizer.from_pretrained(model_name, use_auth_token=HF_TOKEN)
+    return qwen_tokenizer, qwen_model
+
+# Create a Hugging Face pipeline for text generation, wrapped in LangChain's HuggingFacePipeline
+@st.cache_resource(show_spinner=False)
+def load_llm():
+    qwen_tokenizer, qwen_model = load_qwen()
+    hf_pipeline = pipeline(
+        "text-generation", model=qwen_model, tokenizer=qwen_tokenizer, max_new_tokens=MAX_NEW_TOKENS,
+        return_full_text=False, device="cpu"
+    )
+    return HuggingFacePipeline(pipeline=hf_pipeline)
+
+# Initialize the embedding model; chunk embeddings are cached on disk so
+# re-processing text that was seen before skips the embedding cost
+@st.cache_resource(show_spinner="Loading the spaCy embedding model...")
+def load_embeddings():
+    return CachedEmbeddings(SpacyEmbeddings(model_name="en_core_web_lg"), "embedding_cache")
+
+# Every session's FAISS index, kept in memory under a shared cap and spilled to disk when evicted
+@st.cache_resource(show_spinner=False)
+def load_session_indexes():
+    return SessionIndexStore(load_embeddings())
+
+# Id of the current browser session, the key of its index
+def session_id():
+    if "session_id" not in st.session_state:
+        st.session_state["session_id"] = uuid.uuid4().hex
+    return st.session_state["session_id"]
+
+EMBED_BATCH_SIZE = 256         # Chunks embedded and added to FAISS per step while pages are still being extracted
+
+# Worker processes extracting PDF pages, started once per server and shared by every session
+@st.cache_resource(show_spinner=False)
+def load_extract_pool():
+    return make_pool()
+
+# Function to read text from uploaded PDF files, one (file, page, text) record per page;
+# pages of large files are extracted in the shared pool of worker processes and streamed back in order
+def pdf_read(pdf_doc):
+    return iter_pages(pdf_doc, pool=load_extract_pool())
 
-        # Define a retrieval tool
-        retrieval_tool = create_retriever_tool(
-            retriever, "pdf_extractor", "This tool answers queries from the PDF content."
+# Function to split the extracted pages into smaller chunks as they arrive, keeping the file and page of each
+def get_chunks(pages):
+    # Chunk size is 1000 characters with an overlap of 200 characters
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+    for source, page, text in pages:
+        for chunk in text_splitter.split_text(text):
+            yield Document(page_content=chunk, metadata={"source": source, "page": page})
+
+# Answers of this session's earlier questions, for paraphrases that retrieve the same chunks; the cache
+# empties itself when the session processes new files, since its index version changes
+def session_answer_cache():
+    if "answer_cache" not in st.session_state:
+        st.session_state["answer_cache"] = SemanticAnswerCache(max_entries=ANSWER_CACHE_SIZE)
+    return st.session_state["answer_cache"]
+
+# One background worker per server writes the running summaries of every session, one at a time,
+# so summaries never pile up on the CPU next to the answers being generated
+@st.cache_resource(show_spinner=False)
+def load_summarizer():
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix="summarize")
+
+# This session's conversation: recent turns verbatim, older ones in a running summary
+def session_memory():
+    if "conversation" not in st.session_state:
+        qwen_tokenizer, _ = load_qwen()
+        st.session_state["conversation"] = ConversationMemory(qwen_tokenizer, summarize_turns, load_summarizer())
+    return st.session_state["conversation"]
+
+# Function to create a FAISS vector store for storing text embeddings; returns it and its chunk count
+def vector_store(documents):
+    # Convert documents into embeddings and store them in FAISS, a batch at a time, so
+    # embedding overlaps with the extraction of later pages
+    vector_store = None
+    batch = []
+    chunks = 0
+    for document in documents:
+        batch.append(document)
+        if len(batch) == EMBED_BATCH_SIZE:
+            vector_store = add_documents(vector_store, batch)
+            chunks += len(batch)
+            batch = []
+    if batch:
+        vector_store = add_documents(vector_store, batch)
+        chunks += len(batch)
+    return vector_store, chunks
+
+# Add a batch of documents to the store being built, creating it with the first batch
+def add_documents(vector_store, documents):
+    if vector_store is None:
+        return FAISS.from_documents(documents, embedding=load_embeddings())
+    vector_store.add_documents(documents)
+    return vector_store
+
+# "file, page N" for a retrieved chunk, or None for chunks of an index built before pages were kept
+def citation(document):
+    if "source" not in document.metadata:
+        return None
+    return f"{document.metadata['source']}, page {document.metadata['page']}"
+
+# Number the retrieved chunks with their file and page for the direct prompt
+def format_context(documents):
+    blocks = []
+    for n, document in enumerate(documents, 1):
+        source = citation(document)
+        blocks.append(f"[{n}] ({source})\n{document.page_content}" if source else f"[{n}]\n{document.page_content}")
+    return "\n\n".join(blocks)
+
+class CancelGeneration(StoppingCriteria):
+    """Stops generate() at the next token once its event is set."""
+
+    def __init__(self, event):
+        self.event = event
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return self.event.is_set()
+
+class TimedStreamer(TextIteratorStreamer):
+    """TextIteratorStreamer that also records when the first answer token was generated and how many followed."""
+
+    def __init__(self, tokenizer, **kwargs):
+        super().__init__(tokenizer, **kwargs)
+        self.first_token = None
+        self.last_token = None
+        self.tokens = 0
+
+    # The decoder holds text back until it ends a word, so tokens are timed here rather than at the reader
+    def put(self, value):
+        if not (self.skip_prompt and self.next_tokens_are_prompt):
+            now = time.perf_counter()
+            if self.first_token is None:
+                self.first_token = now
+            self.last_token = now
+            self.tokens += value.numel()
+        super().put(value)
+
+class GenerationTimedOut(Exception):
+    """Raised by stream_answer when no token arrives within STREAM_TIMEOUT."""
+
+# Generate a reply to chat messages greedily; returns the reply and the number of tokens generated.
+# A streamer, if given, receives the tokens as they are generated, and setting the cancel event stops
+# generation early.
+def generate(messages, max_new_tokens, streamer=None, cancel=None):
+    qwen_tokenizer, qwen_model = load_qwen()
+    roles = {"system": "system", "human": "user", "ai": "assistant"}
+    chat = [{"role": roles[message.type], "content": message.content} for message in messages]
+    prompt = qwen_tokenizer.apply_chat_template(chat, tokenize=False, add_generation_prompt=True)
+    input_ids = qwen_tokenizer(prompt, add_special_tokens=False, return_tensors="pt").input_ids
+    with torch.inference_mode():
+        output = qwen_model.generate(
+            input_ids,
+            attention_mask=torch.ones_like(input_ids),
+            max_new_tokens=max_new_tokens,
+            do_sample=False,
+            pad_token_id=qwen_tokenizer.eos_token_id,
+            streamer=streamer,
+            stopping_criteria=StoppingCriteriaList([CancelGeneration(cancel)]) if cancel is not None else None,
         )
+    generated = output[0, input_ids.shape[1]:]
+    return qwen_tokenizer.decode(generated, skip_special_tokens=True).strip(), len(generated)
+
+# Direct mode: answer from already retrieved chunks with a single generation, after the conversation
+# so far if there is one; returns the answer and the number of tokens generated
+def direct_answer(user_question, documents, max_new_tokens=MAX_NEW_TOKENS, streamer=None, cancel=None, history=None):
+    messages = DIRECT_PROMPT.format_messages(
+        history=history or [], context=format_context(documents), question=user_question
+    )
+    return generate(messages, max_new_tokens, streamer=streamer, cancel=cancel)
+
+# Fold turns into the running summary of a conversation; runs on the summarizer worker
+def summarize_turns(summary, turns):
+    text = "\n".join(f"User: {turn.question}\nAssistant: {turn.answer}" for turn in turns)
+    messages = SUMMARY_PROMPT.format_messages(summary=summary or "(none yet)", turns=text)
+    return generate(messages, SUMMARY_TOKENS)[0]
+
+# Stream a direct answer token by token, for st.write_stream. Generation runs on a background thread;
+# it is cancelled when this session asks a new question or the page stops reading the stream.
+# Time to first token and decode speed are logged and stored in stats.
+def stream_answer(user_question, documents, stats, history=None):
+    previous = st.session_state.get("generation_cancel")
+    if previous is not None:
+        previous.set()
+    cancel = threading.Event()
+    st.session_state["generation_cancel"] = cancel
+
+    qwen_tokenizer, _ = load_qwen()
+    streamer = TimedStreamer(qwen_tokenizer, skip_prompt=True, skip_special_tokens=True, timeout=STREAM_TIMEOUT)
+    errors = []
+
+    def run():
+        try:
+            direct_answer(user_question, documents, streamer=streamer, cancel=cancel, history=history)
+        except Exception as e:
+            errors.append(e)
+            streamer.end()
+
+    started = time.perf_counter()
+    thread = threading.Thread(target=run, name="generate", daemon=True)
+    thread.start()
+    try:
+        for text in streamer:
+            if text:
+                yield text
+    except queue.Empty:
+        # No token within STREAM_TIMEOUT; the generation thread stops at its next token
+        raise GenerationTimedOut(f"No new token was generated for {STREAM_TIMEOUT:g} seconds.") from None
+    finally:
+        # A no-op once generation finished; otherwise the reader went away, so stop generating
+        cancel.set()
+    thread.join()
+    if errors:
+        raise errors[0]
+    if streamer.first_token is not None:
+        stats["tokens"] = streamer.tokens
+        stats["ttft_ms"] = round((streamer.first_token - started) * 1000)
+        logger.info("Time to first token: %d ms", stats["ttft_ms"])
+        if streamer.tokens > 1:
+            stats["tokens_per_sec"] = round((streamer.tokens - 1) / max(streamer.last_token - streamer.first_token, 1e-9), 1)
+            logger.info("Streamed %d tokens at %.1f tokens/s", streamer.tokens, stats["tokens_per_sec"])
+
+# Agent mode: a ReAct agent over the retriever tool of a session's index. Building it is cheap, the
+# model behind it is cached. The executor stops it after AGENT_MAX_STEPS rounds or AGENT_MAX_SECONDS,
+# whichever comes first.
+def build_agent(vector_store):
+    retriever = vector_store.as_retriever(search_kwargs={"k": TOP_K})
+
+    # Define a retrieval tool
+    retrieval_tool = create_retriever_tool(
+        retriever, "pdf_extractor", "This tool answers queries from the PDF content."
+    )
+    agent = create_react_agent(llm=load_llm(), tools=[retrieval_tool], prompt=AGENT_PROMPT)
+    return AgentExecutor(
+        agent=agent,
+        tools=[retrieval_tool],
+        max_iterations=AGENT_MAX_STEPS,
+        max_execution_time=AGENT_MAX_SECONDS,
+        handle_parsing_errors=True,
+        return_intermediate_steps=True,
+    )
 
-        # Use the conversational chain to process the query
-        get_conversational_chain(retrieval_tool, user_question)
-
+# Function to handle user inputs and process queries
+def user_input(user_question, mode="Direct"):
+    try:
+        # Use the FAISS index this session built, from memory unless it was spilled to disk
+        new_db, version = load_session_indexes().get(session_id())
+        if new_db is None:
+            st.warning("Upload and process PDF files first.")
+            return
+
+        # Any widget re-runs the script with the question still in the box: show its reply again
+        # rather than answering it, and adding it to the conversation, a second time
+        last = st.session_state.get("last_reply")
+        if last is not None and last["key"] == (user_question, mode, version):
+            st.write("Reply: ", last["answer"])
+            if last["sources"]:
+                st.caption("Sources: " + "; ".join(last["sources"]))
+            return
+
+        # Embed the question once, for the search and for the answer cache
+        question_vector = load_embeddings().embed_query(user_question)
+        documents = new_db.similarity_search_by_vector(question_vector, k=TOP_K)
+        chunks = tuple(document.id or document.page_content for document in documents)
+
+        # Cached answers carry the summary and turns they were generated with. One is only reused while
+        # all of those are still in the conversation, so an answer given without history is reusable at
+        # any point, and a paraphrase right after its original still matches.
+        memory = session_memory()
+        history, context = memory.history()
+        answer_cache = session_answer_cache()
+        hit = answer_cache.lookup(question_vector, chunks, version, mode, accept=lambda value: value[1] <= context)
+        if hit is not None:
+            # A paraphrase of an earlier question that retrieved the same chunks: no generation needed
+            entry, similarity = hit
+            answer = entry.value[0]
+            st.write("Reply: ", answer)
+            st.caption(f"From cache: similar to \"{entry.question}\" ({similarity:.2f}), saved {entry.seconds:.1f} s")
+            logger.info("Answer cache hit at similarity %.3f, saved %.1f s", similarity, entry.seconds)
+        elif mode == "Agent":
+            # Generate a response to the user's question with the step- and time-bounded agent
+            started = time.perf_counter()
+            transcript = memory.transcript(history)
+            response = build_agent(new_db).invoke({
+                "input": user_question, "history": f"Conversation so far:\n{transcript}\n\n" if transcript else ""
+            })
+            answer = response["output"]
+
+            # Display the response
+            st.write("Reply: ", answer)
+            answer_cache.store(
+                user_question, question_vector, chunks, version, (answer, context), time.perf_counter() - started, mode
+            )
+        else:
+            # One retrieval (above) and one generation, streamed into the page as it is generated
+            st.write("Reply: ")
+            stats = {}
+            started = time.perf_counter()
+            answer = st.write_stream(stream_answer(user_question, documents, stats, history=history))
+            if "ttft_ms" in stats:
+                speed = f", {stats['tokens_per_sec']} tokens/s" if "tokens_per_sec" in stats else ""
+                st.caption(f"First token after {stats['ttft_ms']} ms{speed}")
+            answer_cache.store(
+                user_question, question_vector, chunks, version, (answer, context), time.perf_counter() - started, mode
+            )
+
+        # Cite the files and pages of the chunks retrieved for the question
+        sources = [source for source in dict.fromkeys(map(citation, documents)) if source]
+        if sources:
+            st.caption("Sources: " + "; ".join(sources))
+
+        # Remember the turn for follow-up questions; turns that no longer fit the history budget
+        # are summarized in the background
+        memory.add(user_question, answer)
+        st.session_state["last_reply"] = {"key": (user_question, mode, version), "answer": answer, "sources": sources}
+
+    except GenerationTimedOut as e:
+        st.error(f"Generation timed out. {e} Try again, or ask a shorter question.")
     except Exception as e:
         st.error(f"An error occurred: {e}")
 
@@ -169,9 +437,12 @@ def main():
     # Input field for the user to ask a question about the PDF content
     user_question = st.text_input("Ask a Question from the PDF Files")
 
+    # Direct answers take one generation; the agent may take several, within its step and time budget
+    mode = st.sidebar.radio("Answer mode", ANSWER_MODES, help="Direct is much faster on CPU.")
+
     # If the user enters a question, process it
     if user_question:
-        user_input(user_question)
+        user_input(user_question, mode)
 
     # Sidebar for uploading PDF files
     with st.sidebar:
@@ -183,13 +454,37 @@ def main():
         # Button to process the uploaded PDF files
         if st.button("Submit & Process"):
             with st.spinner("Processing..."):  # Show a spinner while processing
-                # Extract text from PDFs and create chunks
-                raw_text = pdf_read(pdf_doc)
-                text_chunks = get_chunks(raw_text)
-                # Store the chunks in the FAISS vector store
-                vector_store(text_chunks)
+                # Extract pages from PDFs in parallel and split them into chunks as they arrive
+                pages = pdf_read(pdf_doc)
+                text_chunks = get_chunks(pages)
+                # Store the chunks in this session's FAISS index, replacing the one it had
+                index, chunks = vector_store(text_chunks)
                 
-                st.success("Done")  # Indicate successful processing
+                if chunks:
+                    load_session_indexes().put(session_id(), index)
+                    st.success(f"Done: {chunks} chunks")  # Indicate successful processing
+                else:
+                    st.warning("No text found in the uploaded PDF files.")
+
+        # Memory shared by the indexes of all sessions on this server
+        stats = load_session_indexes().stats()
+        st.caption(f"Indexes in memory: {stats['resident_mb']} of {stats['max_mb']} MB, {stats['sessions']} sessions")
+        # Conversation history carried into the next prompt, and a way to start over
+        memory = session_memory()
+        if (memory.turns or memory.summary) and st.button("New conversation"):
+            memory.clear()
+        if memory.turns or memory.summary:
+            st.caption(
+                f"Conversation: {len(memory.turns)} recent turns, {memory.summarized} summarized, "
+                f"{memory.tokens()} of {memory.budget} history tokens"
+            )
+        # How often this session's questions were answered from the answer cache
+        cache = session_answer_cache().stats()
+        if cache["hits"] + cache["misses"]:
+            st.caption(
+                f"Answer cache: {cache['hits']} of {cache['hits'] + cache['misses']} questions "
+                f"({cache['hit_rate']:.0%}), {cache['seconds_saved']:.1f} s saved"
+            )
 
 # Run the app when the script is executed
 if __name__ == "__main__":
@@ -0,0 +1,137 @@
+# Token-budgeted conversation memory for follow-up questions
+#
+# Replaying the whole chat history into every prompt makes each turn's prefill
+# longer than the last, until the prompt no longer fits. The memory keeps the
+# most recent turns verbatim and rolls older ones into a running summary, so the
+# history in a prompt never exceeds HISTORY_TOKENS, counted with the model's own
+# tokenizer. Room for a full-length summary is always reserved, and the
+# verbatim turns get the rest. Summaries are written by a background worker
+# after the answer has been shown; until an update lands, prompts carry the
+# previous summary, so no question ever waits for one.
+
+import os                                                                       # For the token budgets
+import itertools                                                                # For numbering turns and summaries
+import logging                                                                  # For logging failed summaries
+import threading                                                                # For guarding the memory against its summary worker
+from langchain_core.messages import SystemMessage, HumanMessage, AIMessage      # For the history messages of a prompt
+
+HISTORY_TOKENS = int(os.getenv("HISTORY_TOKENS", "512"))    # History allowed in one prompt: summary plus verbatim turns
+SUMMARY_TOKENS = int(os.getenv("SUMMARY_TOKENS", "128"))    # Longest running summary
+MESSAGE_TOKENS = 5          # Chat template markers around each message: <|im_start|>role\n ... <|im_end|>\n
+SUMMARY_PREFIX = "Summary of the earlier conversation: "
+
+logger = logging.getLogger("chatbot_rag_streamlit.conversation_memory")
+
+
+class Turn:
+    """One question and its answer, with the prompt tokens they take."""
+
+    def __init__(self, id, question, answer, tokens):
+        self.id = id
+        self.question = question
+        self.answer = answer
+        self.tokens = tokens
+
+
+class ConversationMemory:
+    """Recent turns kept verbatim and older ones in a running summary, within a token budget."""
+
+    def __init__(self, tokenizer, summarize, executor, budget=HISTORY_TOKENS, summary_tokens=SUMMARY_TOKENS):
+        self.tokenizer = tokenizer
+        self.summarize = summarize      # (summary, turns) -> new summary text, runs on executor
+        self.executor = executor
+        self.budget = budget
+        self.summary_tokens = summary_tokens
+        self.turns = []
+        self.summary = ""
+        self.summary_id = None          # Changes with every summary update
+        self.summarized = 0             # Turns folded into the summary so far
+        self._ids = itertools.count(1)
+        self._summary_size = 0          # Prompt tokens of the summary message
+        self._pending = []              # Turns rolled out of the verbatim window, not summarized yet
+        self._epoch = 0                 # Bumped by clear(), so a summary of the old conversation is discarded
+        self._lock = threading.Lock()
+        # Tokens the verbatim turns may use: the budget minus room for the longest summary message
+        self.turn_budget = budget - summary_tokens - self.count(SUMMARY_PREFIX) - MESSAGE_TOKENS
+
+    # Tokens of a text for the model, without special tokens
+    def count(self, text):
+        return len(self.tokenizer(text, add_special_tokens=False).input_ids)
+
+    # Remember an answered question; turns that no longer fit are summarized in the background
+    def add(self, question, answer):
+        tokens = self.count(question) + self.count(answer) + 2 * MESSAGE_TOKENS
+        with self._lock:
+            turn = Turn(next(self._ids), question, answer, tokens)
+            self.turns.append(turn)
+            rolled = []
+            while self.turns and sum(t.tokens for t in self.turns) > self.turn_budget:
+                rolled.append(self.turns.pop(0))
+            if not rolled:
+                return
+            self._pending.extend(rolled)
+        self.executor.submit(self._update_summary)
+
+    # Fold the pending turns into the summary; jobs run one at a time, so updates never race
+    def _update_summary(self):
+        with self._lock:
+            turns, self._pending = self._pending, []
+            summary, epoch = self.summary, self._epoch
+        if not turns:
+            return
+        try:
+            text = self.summarize(summary, turns)
+        except Exception:
+            logger.exception("Summarizing %d turns failed; they are left out of the history", len(turns))
+            return
+        ids = self.tokenizer(text.strip(), add_special_tokens=False).input_ids[:self.summary_tokens]
+        text = self.tokenizer.decode(ids, skip_special_tokens=True).strip()
+        with self._lock:
+            if epoch != self._epoch:
+                return
+            self.summary = text
+            self.summary_id = next(self._ids)
+            self.summarized += len(turns)
+            self._summary_size = self.count(SUMMARY_PREFIX + text) + MESSAGE_TOKENS if text else 0
+
+    # History messages for the next prompt: the running summary, then the verbatim turns
+    def messages(self):
+        return self.history()[0]
+
+    # (messages, context) of the history for the next prompt, taken together. context names the summary
+    # and turns in it, so an answer built on them can later tell whether they are still in the conversation.
+    def history(self):
+        with self._lock:
+            messages = [SystemMessage(content=SUMMARY_PREFIX + self.summary)] if self.summary else []
+            context = {("summary", self.summary_id)} if self.summary else set()
+            for turn in self.turns:
+                messages += [HumanMessage(content=turn.question), AIMessage(content=turn.answer)]
+                context.add(("turn", turn.id))
+            return messages, frozenset(context)
+
+    # The current summary and turns, in the form history() names them
+    def context(self):
+        return self.history()[1]
+
+    # History messages as plain text, for prompts that are not chat messages
+    def transcript(self, messages=None):
+        lines = []
+        for message in self.messages() if messages is None else messages:
+            speaker = {"system": "", "human": "User: ", "ai": "Assistant: "}[message.type]
+            lines.append(speaker + message.content)
+        return "\n".join(lines)
+
+    # Prompt tokens the history takes right now, never more than the budget
+    def tokens(self):
+        with self._lock:
+            return self._summary_size + sum(turn.tokens for turn in self.turns)
+
+    def clear(self):
+        with self._lock:
+            self.turns = []
+            self._pending = []
+            self.summary = ""
+            self.summary_id = None
+            self.summarized = 0
+            self._summary_size = 0
+            self._epoch += 1
@@ -0,0 +1,87 @@
+# Parallel page-level text extraction for uploaded PDFs
+#
+# PyPDF2 is pure Python, so extracting pages on threads would serialize on the
+# GIL. Every uploaded file is written to a temporary file and cut into batches
+# of pages instead, and the batches are extracted in a process pool, which only
+# receives the file path. Records come back as (file, page, text), one per
+# page, in document order, so callers can split and embed the first pages while
+# later ones are still being extracted, and every chunk keeps the page it came
+# from.
+#
+# The pool is created once per server (see make_pool) and shared by every
+# upload, so a click does not pay for spawning processes. Files of at most
+# SERIAL_PAGES pages are extracted in the calling process with the reader that
+# counted their pages, since shipping them to a worker costs more than it saves.
+# Each worker keeps the last files it parsed open, so the batches of one file
+# that land on the same worker do not parse the whole PDF again.
+
+import os                                                                       # For the CPU count and temporary file paths
+import tempfile                                                                 # For handing uploads to worker processes as files
+import multiprocessing                                                          # For a fork-safe process pool context
+from functools import lru_cache                                                 # For reusing parsed files in a worker
+from collections import deque                                                   # For in-flight batches in document order
+from concurrent.futures import ProcessPoolExecutor                              # For extracting pages on all cores
+from PyPDF2 import PdfReader                                                    # For reading and extracting text from PDF files
+
+EXTRACT_WORKERS = max(1, (os.cpu_count() or 2) - 1)    # Processes extracting pages, one core is left for embedding
+PAGE_BATCH = 8                                          # Pages extracted per task
+SERIAL_PAGES = 16                                       # Files up to this many pages are extracted without the pool
+MAX_IN_FLIGHT = 4                                       # Batches queued per worker, bounds memory on huge uploads
+
+
+# The process pool uploads are extracted in, or None when there is a single core to extract on
+def make_pool(workers=EXTRACT_WORKERS):
+    if workers <= 1:
+        return None
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+# Parsed PDF of a path; temporary paths are never reused, so a cached reader is never stale
+@lru_cache(maxsize=2)
+def _reader(path):
+    return PdfReader(path)
+
+
+# Extract the text of pages [first, last) of a PDF; runs in a worker process. Returns 1-based page numbers.
+def extract_pages(path, first, last, reader=None):
+    reader = reader or _reader(path)
+    return [(number + 1, reader.pages[number].extract_text() or "") for number in range(first, last)]
+
+
+# Yield (file name, 1-based page, text) for every page of the uploaded files, in order,
+# extracting batches of pages of large files in the pool, if one is given
+def iter_pages(files, pool=None, workers=EXTRACT_WORKERS, page_batch=PAGE_BATCH):
+    with tempfile.TemporaryDirectory(prefix="pdf_extract_") as tmp_dir:
+        yield from _iter_pages(files, tmp_dir, pool, workers, page_batch)
+
+
+def _iter_pages(files, tmp_dir, pool, workers, page_batch):
+    # (name, pages) of each file in order, pages being a list extracted here or futures of batches
+    def tasks():
+        for n, upload in enumerate(files):
+            path = os.path.join(tmp_dir, f"{n}.pdf")
+            with open(path, "wb") as f:
+                f.write(upload.getbuffer())
+            reader = PdfReader(path)
+            pages = len(reader.pages)
+            if pool is None or pages <= SERIAL_PAGES:
+                yield upload.name, [extract_pages(path, 0, pages, reader)]
+                continue
+            del reader
+            for first in range(0, pages, page_batch):
+                yield upload.name, pool.submit(extract_pages, path, first, min(first + page_batch, pages))
+
+    in_flight = deque()
+    for name, batch in tasks():
+        in_flight.append((name, batch))
+        while in_flight and (len(in_flight) >= workers * MAX_IN_FLIGHT or isinstance(in_flight[0][1], list)):
+            yield from _done(*in_flight.popleft())
+    while in_flight:
+        yield from _done(*in_flight.popleft())
+
+
+# Records of a batch, waiting for it if it is still being extracted
+def _done(name, batch):
+    for pages in batch if isinstance(batch, list) else [batch.result()]:
+        for page, text in pages:
+            yield name, page, text
@@ -0,0 +1,218 @@
+# Per-session FAISS indexes kept in memory under a server-wide cap
+#
+# Every browser session builds its own index from the PDFs it uploaded, so
+# sessions never see or overwrite each other's documents, and questions are
+# answered from memory instead of reloading an index from disk. All indexes
+# share one memory budget. When it is exceeded, or a session has been idle for
+# too long, the least recently used indexes are evicted. With a spill directory
+# configured an evicted index is saved there and loaded back on the session's
+# next question; without one it is dropped and the session has to process its
+# files again. Spilled copies that stay unused for long are deleted as well.
+#
+# Each store spills into a fresh directory of its own inside the spill
+# directory and only ever deletes that, so pointing SESSION_INDEX_SPILL_DIR at
+# a shared or existing folder is safe and several server processes can share
+# it. Saving, loading and deleting spilled copies happen outside the store's
+# lock: an index is only marked as spilling or loaded under it, so one
+# session's disk I/O never holds up the questions of the others.
+
+import os                                                                       # For the spill directory and limits
+import time                                                                     # For idle times and index versions
+import atexit                                                                   # For removing this store's spill directory on exit
+import shutil                                                                   # For removing spilled indexes
+import tempfile                                                                 # For a spill directory of this store's own
+import logging                                                                  # For logging evictions
+import threading                                                                # For guarding the store across sessions
+from collections import OrderedDict                                             # For least recently used order
+from langchain_community.vectorstores import FAISS                              # For saving and loading spilled indexes
+
+MAX_BYTES = int(float(os.getenv("SESSION_INDEX_MAX_MB", "1024")) * 1024 * 1024)     # Memory shared by all session indexes
+IDLE_SECONDS = float(os.getenv("SESSION_INDEX_IDLE_MINUTES", "30")) * 60            # Idle time after which an index is evicted
+SPILL_DIR = os.getenv("SESSION_INDEX_SPILL_DIR", "session_indexes")                 # Where evicted indexes go, empty to drop them
+SPILL_SECONDS = float(os.getenv("SESSION_INDEX_SPILL_HOURS", "24")) * 3600          # Unused time after which a spilled index is deleted
+
+logger = logging.getLogger("chatbot_rag_streamlit.session_indexes")
+
+
+# Approximate memory held by a FAISS vector store: the vectors plus the chunk texts
+def index_bytes(vector_store):
+    vectors = vector_store.index.ntotal * vector_store.index.d * 4
+    texts = sum(len(document.page_content) + 200 for document in vector_store.docstore._dict.values())
+    return vectors + texts
+
+
+class SessionIndex:
+    """The index of one session: resident in memory, spilled to disk, or both gone."""
+
+    def __init__(self, vector_store, version):
+        self.vector_store = vector_store
+        self.version = version
+        self.bytes = index_bytes(vector_store)
+        self.last_used = time.monotonic()
+        self.spilled = None             # Path of the copy on disk; kept once loaded back, the index never changes
+        self.spilling = False           # Picked for eviction and being saved; a get() meanwhile keeps it in memory
+        self.removed = False            # Replaced or dropped, its copy on disk is deleted
+        self.io = threading.Lock()      # Serializes saving, loading and deleting the copy on disk
+
+
+class SessionIndexStore:
+    """Server-wide map of session id to FAISS index, bounded in memory with LRU and idle eviction."""
+
+    def __init__(self, embeddings, max_bytes=MAX_BYTES, idle_seconds=IDLE_SECONDS, spill_dir=SPILL_DIR,
+                 spill_seconds=SPILL_SECONDS):
+        self.embeddings = embeddings
+        self.max_bytes = max_bytes
+        self.idle_seconds = idle_seconds
+        self.spill_seconds = spill_seconds
+        self.resident_bytes = 0
+        self._entries = OrderedDict()   # Session id -> SessionIndex, least recently used first
+        self._lock = threading.Lock()
+        self.spill_dir = None
+        if spill_dir:
+            # Sessions do not survive a server restart, neither do their spilled indexes
+            os.makedirs(spill_dir, exist_ok=True)
+            self.spill_dir = tempfile.mkdtemp(prefix=f"spill-{os.getpid()}-", dir=spill_dir)
+            atexit.register(shutil.rmtree, self.spill_dir, True)
+
+    # Replace the index of a session; returns its new version
+    def put(self, session_id, vector_store):
+        entry = SessionIndex(vector_store, time.time_ns())
+        with self._lock:
+            replaced = self._remove(session_id)
+            self._entries[session_id] = entry
+            self.resident_bytes += entry.bytes
+            spill, discard = self._evict(keep=session_id)
+        self._io(spill, discard + [replaced])
+        logger.info("Session %s indexed %d chunks (%.1f MB)", session_id[:8], vector_store.index.ntotal,
+                    entry.bytes / 2**20)
+        return entry.version
+
+    # (vector store, version) of a session, loading a spilled index back; (None, None) if it has none
+    def get(self, session_id):
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return None, None
+            entry.last_used = time.monotonic()
+            self._entries.move_to_end(session_id)
+            if entry.spilling:
+                # Asked for again before its spill finished: it stays in memory
+                entry.spilling = False
+                self.resident_bytes += entry.bytes
+            vector_store = entry.vector_store
+            spill, discard = self._evict(keep=session_id)
+        self._io(spill, discard)
+        if vector_store is None:
+            vector_store = self._load(session_id, entry)
+            if vector_store is None:
+                return None, None
+        return vector_store, entry.version
+
+    # Forget the index of a session, in memory and on disk
+    def drop(self, session_id):
+        with self._lock:
+            entry = self._remove(session_id)
+        self._io([], [entry])
+
+    # Counts for the sidebar and logs
+    def stats(self):
+        with self._lock:
+            resident = sum(1 for e in self._entries.values() if e.vector_store is not None and not e.spilling)
+            return {
+                "sessions": len(self._entries),
+                "resident": resident,
+                "spilled": len(self._entries) - resident,
+                "resident_mb": round(self.resident_bytes / 2**20, 1),
+                "max_mb": round(self.max_bytes / 2**20, 1),
+            }
+
+    # Read a spilled index back into memory; None if the session's index was replaced or dropped meanwhile
+    def _load(self, session_id, entry):
+        with entry.io:
+            with self._lock:
+                if entry.removed or entry.vector_store is not None:
+                    return None if entry.removed else entry.vector_store
+                path = entry.spilled
+            vector_store = FAISS.load_local(path, self.embeddings, allow_dangerous_deserialization=True)
+            with self._lock:
+                if entry.removed:
+                    return None
+                entry.vector_store = vector_store
+                self.resident_bytes += entry.bytes
+                spill, discard = self._evict(keep=session_id)
+        logger.info("Session %s index loaded back from %s", session_id[:8], path)
+        self._io(spill, discard)
+        return vector_store
+
+    # The disk work picked under the lock: save the indexes being spilled, delete the copies of removed ones
+    def _io(self, spill, discard):
+        for entry in discard:
+            if entry is not None:
+                with entry.io:
+                    if entry.spilled:
+                        shutil.rmtree(entry.spilled, ignore_errors=True)
+                        entry.spilled = None
+        for session_id, entry, reason in spill:
+            with entry.io:
+                if entry.removed:
+                    continue
+                if entry.spilled is None:
+                    path = os.path.join(self.spill_dir, session_id)
+                    try:
+                        entry.vector_store.save_local(path)
+                    except OSError:
+                        logger.exception("Session %s index could not be spilled; it stays in memory", session_id[:8])
+                        with self._lock:
+                            if entry.spilling:
+                                entry.spilling = False
+                                self.resident_bytes += entry.bytes
+                        continue
+                    entry.spilled = path
+            with self._lock:
+                if not entry.spilling or entry.removed:
+                    continue
+                entry.vector_store = None
+                entry.spilling = False
+            logger.info("Session %s index spilled to %s, %s", session_id[:8], entry.spilled, reason)
+
+    # Take a session's index out of the store; returns it so the caller can delete its copy on disk
+    def _remove(self, session_id):
+        entry = self._entries.pop(session_id, None)
+        if entry is None:
+            return None
+        if entry.vector_store is not None and not entry.spilling:
+            self.resident_bytes -= entry.bytes
+        entry.removed = True
+        return entry
+
+    # Pick idle indexes, then the least recently used ones until the rest fit in max_bytes, for eviction.
+    # The index of the session being served is kept even if it alone is over the cap. Returns the
+    # (session id, entry, reason) to spill and the entries whose copies on disk are to be deleted.
+    def _evict(self, keep):
+        now = time.monotonic()
+        spill, discard = [], []
+        for session_id, entry in list(self._entries.items()):
+            if session_id == keep or entry.spilling:
+                continue
+            idle = now - entry.last_used
+            if entry.vector_store is None:
+                if idle > self.spill_seconds:
+                    discard.append(self._remove(session_id))
+            elif idle > self.idle_seconds:
+                self._evict_one(session_id, entry, "idle", spill, discard)
+        for session_id, entry in list(self._entries.items()):
+            if self.resident_bytes <= self.max_bytes:
+                break
+            if session_id != keep and entry.vector_store is not None and not entry.spilling:
+                self._evict_one(session_id, entry, "over the memory cap", spill, discard)
+        return spill, discard
+
+    # Count an index out of memory now; it is saved after the lock is released, or dropped without a spill directory
+    def _evict_one(self, session_id, entry, reason, spill, discard):
+        if self.spill_dir is None:
+            discard.append(self._remove(session_id))
+            logger.info("Session %s index dropped, %s", session_id[:8], reason)
+            return
+        entry.spilling = True
+        self.resident_bytes -= entry.bytes
+        spill.append((session_id, entry, reason))
@@ -1,6 +1,7 @@
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 from transformers import AutoTokenizer, AutoModelForCausalLM
+from executor import Executor, WorkloadPool
 
 # Initialize FastAPI
 app = FastAPI(title="Text Generation API with Qwen", version="1.0")
@@ -14,6 +15,10 @@ model = AutoModelForCausalLM.from_pretrained(MODEL_NAME)
 if tokenizer.pad_token_id is None:
     tokenizer.pad_token_id = tokenizer.eos_token_id
 
+# Run generation on a bounded thread pool so it never blocks the event loop; excess requests get 429
+executor = Executor(WorkloadPool.from_env("generate", workers=1, max_queue=8))
+executor.install(app)
+
 # Pydantic model for input validation
 class StoryRequest(BaseModel):
     title: str
@@ -23,12 +28,8 @@ class StoryResponse(BaseModel):
     title: str
     story: str
 
-@app.post("/story", response_model=StoryResponse)
-async def generate_story(request: StoryRequest):
-    title = request.title.strip()
-    if not title:
-        raise HTTPException(status_code=400, detail="Title cannot be empty")
-
+# Generate a story for a title; runs on the generation pool
+def write_story(title):
     # Create a prompt for story generation
     prompt = f"Write a short story about {title}."
     inputs = tokenizer(prompt, return_tensors="pt", padding=True, truncation=True)
@@ -44,7 +45,15 @@ async def generate_story(request: StoryRequest):
         do_sample=True
     )
 
-    story = tokenizer.decode(outputs[0], skip_special_tokens=True)
+    return tokenizer.decode(outputs[0], skip_special_tokens=True)
+
+@app.post("/story", response_model=StoryResponse)
+async def generate_story(request: StoryRequest):
+    title = request.title.strip()
+    if not title:
+        raise HTTPException(status_code=400, detail="Title cannot be empty")
+
+    story = await executor["generate"].run(write_story, title)
 
     # Return the generated story
     return {"title": title, "story": story}
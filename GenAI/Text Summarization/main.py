@@ -1,6 +1,7 @@
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 from transformers import T5Tokenizer, T5ForConditionalGeneration
+from executor import Executor, WorkloadPool
 
 MODEL_NAME = "t5-small"
 model = T5ForConditionalGeneration.from_pretrained(MODEL_NAME)
@@ -9,10 +10,25 @@ tokenizer = T5Tokenizer.from_pretrained(MODEL_NAME)
 # Initialize FastAPI
 app = FastAPI(title="Text Summarization API", version = "1.0")
 
+# Run generation on a bounded thread pool so it never blocks the event loop; excess requests get 429
+executor = Executor(WorkloadPool.from_env("summarize", workers=2, max_queue=16))
+executor.install(app)
+
 # Pydantic model for input validation
 class StoryRequest(BaseModel):
     Story: str
 
+# Summarize a text; runs on the summarization pool
+def summarize(input_text):
+    input_ids = tokenizer.encode(input_text, return_tensors="pt",
+    max_length=512, truncation=True)
+
+    # Generate summary
+    response = model.generate(input_ids,max_length=50)
+
+    #Decode Summary
+    return tokenizer.decode(response[0], skip_special_tokens=True)
+
 # POST endpoint for generating a story based on the title
 @app.post("/Summarize")
 async def generate_story(request: StoryRequest):
@@ -26,14 +42,8 @@ async def generate_story(request: StoryRequest):
     #Preprocess the input
     input_text = f"Please summarize the following text:\n\n{Story}"
 
-    input_ids = tokenizer.encode(input_text, return_tensors="pt",
-    max_length=512, truncation=True)
-
-    # Generate summary
-    response = model.generate(input_ids,max_length=50)
-        
-    #Decode Summary
-    summary = tokenizer.decode(response[0], skip_special_tokens=True)
+    # Generate and decode the summary off the event loop
+    summary = await executor["summarize"].run(summarize, input_text)
 
     # Return the generated story as a response
     return {"Story": Story, "Summmary": summary}
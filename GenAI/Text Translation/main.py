@@ -1,6 +1,7 @@
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 from transformers import T5ForConditionalGeneration, T5Tokenizer
+from executor import Executor, WorkloadPool, Overloaded
 
 TF_ENABLE_ONEDNN_OPTS = 0 # Turn off oneDNN optimizations for more consistent floating-point results
 TF_CPP_MIN_LOG_LEVEL = 1  # Suppress TensorFlow logs for cleaner output 
@@ -13,6 +14,10 @@ model_name = "google-t5/t5-small"
 model = T5ForConditionalGeneration.from_pretrained(model_name)
 tokenizer = T5Tokenizer.from_pretrained(model_name, legacy=False)
 
+# Run generation on a bounded thread pool so it never blocks the event loop; excess requests get 429
+executor = Executor(WorkloadPool.from_env("translate", workers=2, max_queue=16))
+executor.install(app)
+
 class TranslationRequest(BaseModel):
     text: str
     source_lang: str
@@ -30,7 +35,11 @@ def translate_text(text: str, source_lang: str, target_lang: str) -> str:
 @app.post("/translate/")
 async def translate(request: TranslationRequest):
     try:
-        translated_text = translate_text(request.text, request.source_lang, request.target_lang)
+        translated_text = await executor["translate"].run(
+            translate_text, request.text, request.source_lang, request.target_lang
+        )
         return {"original": request.text, "translated": translated_text}
+    except Overloaded:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))